@@ -0,0 +1,92 @@
+"""
+Savings and accuracy of ingest-time near-duplicate elimination.
+
+Run from the `rag` directory:
+    python -m bench.dedup --corpus-size 20000 --duplicate-share 0.2 --threshold 0.7 0.8 0.9
+    python -m bench.dedup --corpus data/culturax_vectors.ndjson
+
+The synthetic corpus gets `--duplicate-share` lightly edited copies of its
+documents (see `add_near_duplicates`), so `recall` is the share of injected
+copies that ended up in the same cluster as their source. `precision` checks
+every detected pair against the exact Jaccard of its shingle sets. `redundant@k`
+is the share of exact top-k vector search slots taken by a document whose
+cluster already appeared higher in the list, i.e. retrieval slots wasted on copies.
+"""
+from typing import Dict
+import argparse
+import time
+
+import numpy as np
+
+from common import format_dedup_report
+from common.dedup import MinHasher, build_duplicate_map
+from bench.fakes import synthetic_corpus, add_near_duplicates, load_corpus
+
+
+def jaccard(hasher: MinHasher, a: str, b: str) -> float:
+    x, y = hasher.shingles(a), hasher.shingles(b)
+    return len(np.intersect1d(x, y)) / max(len(np.union1d(x, y)), 1)
+
+
+def redundant_share(matrix: np.ndarray, clusters: np.ndarray, queries: np.ndarray, k: int) -> float:
+    redundant = 0
+    for q in queries:
+        top = np.argpartition(-(matrix @ q), k)[:k]
+        redundant += k - len(set(clusters[top].tolist()))
+    return redundant / (len(queries) * k)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark near-duplicate elimination at ingest")
+    parser.add_argument("--corpus", help="ndjson data file; synthetic corpus with injected duplicates when omitted")
+    parser.add_argument("--corpus-size", type=int, default=10000)
+    parser.add_argument("--duplicate-share", type=float, default=0.2)
+    parser.add_argument("--threshold", type=float, nargs="*", default=[0.8])
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--limit", type=int, default=35)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    if args.corpus:
+        docs = load_corpus(args.corpus)
+    else:
+        docs = add_near_duplicates(synthetic_corpus(args.corpus_size, args.seed), args.duplicate_share, args.seed)
+    by_id: Dict[str, dict] = {str(d["id"]): d for d in docs}
+    hasher = MinHasher()
+
+    matrix = np.asarray([d["vector"] for d in docs], dtype=np.float32)
+    matrix /= np.linalg.norm(matrix, axis=1, keepdims=True)
+    rng = np.random.default_rng(args.seed)
+    queries = matrix[rng.choice(len(matrix), args.queries)] + rng.normal(0, 0.05, (args.queries, matrix.shape[1]))
+    queries = (queries / np.linalg.norm(queries, axis=1, keepdims=True)).astype(np.float32)
+
+    for threshold in args.threshold:
+        start = time.perf_counter()
+        duplicate_of, report = build_duplicate_map(docs, threshold)
+        elapsed = time.perf_counter() - start
+        print(f"\nthreshold={threshold}: {len(docs) / elapsed:.0f} docs/s")
+        print(format_dedup_report(report))
+
+        detected = list(duplicate_of.items())
+        if detected:
+            sample = [detected[i] for i in rng.choice(len(detected), min(500, len(detected)), replace=False)]
+            exact = [jaccard(hasher, by_id[d]["text"], by_id[r]["text"]) for d, r in sample]
+            print(f"precision={np.mean(np.asarray(exact) >= threshold):.3f} "
+                  f"(exact Jaccard of detected pairs: min {min(exact):.2f}, mean {np.mean(exact):.2f})")
+
+        representative = lambda doc_id: duplicate_of.get(doc_id, doc_id)
+        injected = [d for d in docs if "near_duplicate_of" in d]
+        if injected:
+            found = np.mean([representative(str(d["id"])) == representative(str(d["near_duplicate_of"]))
+                             for d in injected])
+            print(f"recall={found:.3f} over {len(injected)} injected copies")
+
+        clusters = np.asarray([representative(str(d["id"])) for d in docs])
+        kept = np.asarray([str(d["id"]) not in duplicate_of for d in docs])
+        before = redundant_share(matrix, clusters, queries, args.limit)
+        after = redundant_share(matrix[kept], clusters[kept], queries, args.limit)
+        print(f"redundant@{args.limit}: {before:.3f} before, {after:.3f} after dedup")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+"""
+Query encoder backends: parity with the torch embeddings, per-query latency and memory.
+
+Run from the `rag` directory:
+    python -m bench.encoder --backends torch onnx onnx-int8
+    python -m bench.encoder --backends torch onnx-int8 --threads 1 --quantization avx512_vnni --passages 2000
+
+Every backend runs in its own process (`--worker`), so memory is the encoder's alone:
+resident memory growth from before loading to after encoding the benchmark queries one
+at a time as the pipeline does (`query: ` prefix, `--repeat` passes, first one is
+warm-up and not timed), and after also encoding the passages in batches of 32 (ONNX
+Runtime's arena keeps the peak of the largest batch). The vectors go back in a .npy file.
+
+Parity is measured against the torch backend: cosine of each query / passage vector with
+the torch one, and top-10 overlap of passages retrieved for each query by the backend's
+query vector from the torch passage vectors (what an index filled with torch embeddings
+returns). Exits 1 when a backend's minimum cosine is below `--min-cosine`.
+"""
+import subprocess
+import argparse
+import tempfile
+import time
+import json
+import sys
+import os
+
+import numpy as np
+
+from bench.fakes import synthetic_corpus
+from bench.loadtest import DEFAULT_QUERIES
+
+TOP_K = 10
+
+
+def rss_mib() -> float:
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024.0
+    return 0.0
+
+
+def load_texts(passages: int, data: str | None, seed: int) -> tuple[list, list]:
+    from common import make_queries
+
+    queries = [make_queries(query)[0] for query in DEFAULT_QUERIES]
+    if data:
+        from common import iter_documents
+
+        docs = [doc for _, doc in zip(range(passages), iter_documents(data))]
+    else:
+        docs = synthetic_corpus(passages, seed)
+    return queries, [f"passage: {doc['text'][:1000]}" for doc in docs]
+
+
+def worker(args):
+    '''
+    One backend: load, encode, report (stdout, one JSON line) and save the vectors
+    '''
+    from common import load_encoder, limit_threads
+
+    queries, passages = load_texts(args.passages, args.data, args.seed)
+    limit_threads(args.threads)
+    before = rss_mib()
+    started = time.perf_counter()
+    model = load_encoder(args.model, args.worker, args.onnx_dir, args.quantization, args.threads)
+    load_s = time.perf_counter() - started
+
+    latencies = []
+    for n in range(args.repeat + 1):
+        for query in queries:
+            started = time.perf_counter()
+            vec = model.encode(query, normalize_embeddings=True, convert_to_numpy=True)
+            if n:
+                latencies.append(time.perf_counter() - started)
+    rss = rss_mib() - before
+    started = time.perf_counter()
+    passage_vecs = model.encode(passages, batch_size=32, normalize_embeddings=True, convert_to_numpy=True)
+    passages_s = time.perf_counter() - started
+
+    query_vecs = model.encode(queries, normalize_embeddings=True, convert_to_numpy=True)
+    np.save(args.out, np.vstack([query_vecs, passage_vecs]).astype(np.float32))
+    latencies = np.array(latencies) * 1000
+    print(json.dumps({
+        "backend": args.worker,
+        "dim": int(vec.shape[-1]),
+        "load_s": load_s,
+        "rss_mib": rss,
+        "rss_batch_mib": rss_mib() - before,
+        "p50_ms": float(np.percentile(latencies, 50)),
+        "p95_ms": float(np.percentile(latencies, 95)),
+        "passages_per_s": len(passages) / passages_s,
+        "queries": len(queries),
+    }))
+
+
+def run_backend(backend: str, args, out: str) -> dict:
+    command = [sys.executable, "-m", "bench.encoder", "--worker", backend, "--out", out,
+               "--model", args.model, "--onnx-dir", args.onnx_dir, "--quantization", args.quantization,
+               "--threads", str(args.threads), "--repeat", str(args.repeat), "--passages", str(args.passages),
+               "--seed", str(args.seed)] + (["--data", args.data] if args.data else [])
+    process = subprocess.run(command, capture_output=True, text=True, env={**os.environ, "LOG_LEVEL": "WARNING"})
+    if process.returncode:
+        sys.stderr.write(process.stderr[-4000:])
+        raise RuntimeError(f"backend {backend} failed")
+    return json.loads(process.stdout.strip().splitlines()[-1])
+
+
+def top_k(query_vecs: np.ndarray, passage_vecs: np.ndarray) -> np.ndarray:
+    return np.argsort(-(query_vecs @ passage_vecs.T), axis=1)[:, :TOP_K]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Query encoder backends: parity, latency, memory")
+    parser.add_argument("--backends", nargs="*", default=["torch", "onnx", "onnx-int8"])
+    parser.add_argument("--model", default=os.getenv("TRANSFORMER_MODEL_NAME", "intfloat/multilingual-e5-small"))
+    parser.add_argument("--onnx-dir", default=os.path.join("data", "onnx"))
+    parser.add_argument("--quantization", default="avx2")
+    parser.add_argument("--threads", type=int, default=max(1, os.cpu_count() or 1))
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--passages", type=int, default=500)
+    parser.add_argument("--data", help="ndjson data file, synthetic passages when not given")
+    parser.add_argument("--min-cosine", type=float, default=0.99)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    parser.add_argument("--out", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        worker(args)
+        return
+
+    backends = ["torch"] + [backend for backend in args.backends if backend != "torch"]
+    workdir = tempfile.mkdtemp(prefix="rag_encoder_")
+    reports, vectors = {}, {}
+    for backend in backends:
+        out = os.path.join(workdir, f"{backend}.npy")
+        reports[backend] = run_backend(backend, args, out)
+        vectors[backend] = np.load(out)
+
+    n_queries = reports["torch"]["queries"]
+    reference = vectors["torch"]
+    reference_top = top_k(reference[:n_queries], reference[n_queries:])
+    print(f"model={args.model} threads={args.threads} queries={n_queries} passages={args.passages}")
+    print(f"{'backend':>10}{'load s':>8}{'RSS MiB':>9}{'batch RSS':>11}{'p50 ms':>8}{'p95 ms':>8}"
+          f"{'passages/s':>12}{'min cos':>9}{'mean cos':>10}{'top10 overlap':>15}")
+    failed = False
+    for backend in backends:
+        report, vecs = reports[backend], vectors[backend]
+        cosines = (vecs * reference).sum(axis=1)
+        backend_top = top_k(vecs[:n_queries], reference[n_queries:])
+        overlap = np.mean([len(set(a) & set(b)) / TOP_K for a, b in zip(backend_top, reference_top)])
+        failed |= bool(cosines.min() < args.min_cosine)
+        print(f"{backend:>10}{report['load_s']:>8.1f}{report['rss_mib']:>9.0f}{report['rss_batch_mib']:>11.0f}"
+              f"{report['p50_ms']:>8.2f}{report['p95_ms']:>8.2f}{report['passages_per_s']:>12.0f}{cosines.min():>9.4f}"
+              f"{cosines.mean():>10.4f}{overlap:>15.3f}")
+    print(f"FAIL: cosine below {args.min_cosine}" if failed else f"OK: every backend within cosine {args.min_cosine}")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
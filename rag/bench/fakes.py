@@ -0,0 +1,802 @@
+"""
+In-process stand-ins for Elasticsearch, Qdrant and Ollama.
+
+Every fake is a small threaded HTTP server speaking just enough of the real
+API for `RAG` to start and answer `/ask`. Response times are drawn from a
+configurable latency distribution so load tests can model slow backends
+without docker, network or GPU.
+"""
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from datetime import datetime, timezone
+from collections import defaultdict
+from typing import Callable, Dict, List, Optional
+import threading
+import random
+import json
+import gzip
+import time
+import math
+import zlib
+import re
+
+import numpy as np
+
+VECTOR_DIM = 384
+TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+FRAGMENT_RE = re.compile(r"^\[1\]\s+(.+)$", re.MULTILINE)
+DURATION_RE = re.compile(r"^(-?\d+(?:\.\d+)?)(ms|s|m|h)?$")
+DURATION_UNITS = {"ms": 0.001, "s": 1.0, "m": 60.0, "h": 3600.0, None: 1.0}
+
+
+class LatencyModel:
+    '''
+    Latency distribution parsed from a spec string:
+    "0" / "const:MS" / "uniform:LO_MS:HI_MS" / "lognormal:MEDIAN_MS:SIGMA"
+    '''
+
+    def __init__(self, spec: str = "0", seed: Optional[int] = None):
+        self.spec = spec
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        parts = spec.split(":")
+        kind = parts[0]
+
+        if kind in ("0", "none"):
+            self._sample = lambda: 0.0
+        elif kind == "const":
+            ms = float(parts[1])
+            self._sample = lambda: ms
+        elif kind == "uniform":
+            lo, hi = float(parts[1]), float(parts[2])
+            self._sample = lambda: self._rng.uniform(lo, hi)
+        elif kind == "lognormal":
+            median, sigma = float(parts[1]), float(parts[2])
+            mu = math.log(max(median, 1e-6))
+            self._sample = lambda: self._rng.lognormvariate(mu, sigma)
+        else:
+            raise ValueError(f"Unknown latency spec: {spec}")
+
+    def sample(self) -> float:
+        '''
+        Returns latency in seconds
+        '''
+        with self._lock:
+            return self._sample() / 1000.0
+
+
+SYNTHETIC_WORDS = (
+    "prezent pomysł rodzina dom ogród praca firma zespół projekt zarządzanie "
+    "rozwój sukces kryzys inflacja gospodarka polityka rada komisja instytut "
+    "program szkoła uczelnia zdrowie lekarz sport piłka muzyka książka film "
+    "historia miasto wieś podróż samochód kuchnia przepis ciasto kawa herbata "
+    "komputer telefon internet sklep cena promocja klient usługa umowa prawo"
+).split()
+SYNTHETIC_SYLLABLES = "ka ro wi sza ło mie dzy ta ne pol ski go ra cze ni by la dro".split()
+RARE_WORD_SHARE = 0.3   # share of words drawn from the long (Zipf) tail, so lexical search has selective terms
+
+
+def _rare_words(n: int = 20000, seed: int = 0) -> List[str]:
+    rng = random.Random(seed)
+    words = set()
+    while len(words) < n:
+        words.add("".join(rng.choice(SYNTHETIC_SYLLABLES) for _ in range(rng.randint(2, 4))))
+    return sorted(words)
+
+
+def synthetic_corpus(n_docs: int = 2000, seed: int = 0) -> List[Dict]:
+    '''
+    Deterministic pseudo-Polish corpus in the same shape as the ndjson data file
+    '''
+    rng = random.Random(seed)
+    np_rng = np.random.default_rng(seed)
+    rare = _rare_words(seed=seed)
+    docs = []
+    for doc_id in range(1, n_docs + 1):
+        sentences = []
+        for _ in range(rng.randint(4, 12)):
+            words = [
+                rare[min(int(np_rng.zipf(1.3)) - 1, len(rare) - 1)] if rng.random() < RARE_WORD_SHARE
+                else rng.choice(SYNTHETIC_WORDS)
+                for _ in range(rng.randint(8, 20))
+            ]
+            sentences.append(" ".join(words).capitalize() + ".")
+        vec = np_rng.standard_normal(VECTOR_DIM).astype(np.float32)
+        vec /= np.linalg.norm(vec)
+        docs.append({
+            "id": str(doc_id),
+            "text": " ".join(sentences),
+            "domain": f"strona{doc_id % 50}.pl",
+            "date": f"{2010 + doc_id % 14}-{1 + doc_id % 12:02d}-01",
+            "vector": vec.tolist(),
+        })
+    return docs
+
+
+def add_near_duplicates(docs: List[Dict], share: float = 0.2, seed: int = 0) -> List[Dict]:
+    '''
+    Corpus with `share` of extra documents that are light edits of existing ones (a word swapped,
+    a boilerplate footer, same vector plus noise), as mirrored / re-posted web pages are.
+    Each copy carries "near_duplicate_of" with the id of its source.
+    '''
+    rng = random.Random(seed)
+    np_rng = np.random.default_rng(seed)
+    next_id = max(int(d["id"]) for d in docs) + 1
+    copies = []
+    for source in rng.sample(docs, int(len(docs) * share)):
+        words = source["text"].split()
+        for _ in range(max(1, len(words) // 100)):
+            words[rng.randrange(len(words))] = rng.choice(SYNTHETIC_WORDS)
+        if rng.random() < 0.5:
+            words += "Wszelkie prawa zastrzeżone.".split()
+        vec = np.asarray(source["vector"], dtype=np.float32) + np_rng.normal(0, 0.01, VECTOR_DIM).astype(np.float32)
+        copies.append({
+            **source,
+            "id": str(next_id),
+            "text": " ".join(words),
+            "vector": (vec / np.linalg.norm(vec)).tolist(),
+            "near_duplicate_of": source["id"],
+        })
+        next_id += 1
+    mixed = docs + copies
+    rng.shuffle(mixed)
+    return mixed
+
+
+def load_corpus(data_file_path: str, limit: Optional[int] = None) -> List[Dict]:
+    docs = []
+    with open(data_file_path, "r") as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith("{\"index\""):
+                continue
+            docs.append(json.loads(line))
+            if limit and len(docs) >= limit:
+                break
+    return docs
+
+
+def write_corpus(docs: List[Dict], data_file_path: str):
+    '''
+    Save docs as an ndjson data file (for backends that build from the file)
+    '''
+    with open(data_file_path, "w") as f:
+        for doc in docs:
+            f.write(json.dumps(doc, ensure_ascii=False) + "\n")
+
+
+def passes_filter(doc: Dict, conditions: List[tuple]) -> bool:
+    '''
+    conditions: (field, spec) with spec either a range (gte/gt/lte/lt, ISO dates) or {"any": [...]}
+    '''
+    for field, spec in conditions:
+        value = doc.get(field)
+        if value is None:
+            return False
+        if "any" in spec:
+            if value not in spec["any"]:
+                return False
+            continue
+        day = str(value)[:10]
+        bounds = {op: str(spec[op])[:10] for op in ("gte", "gt", "lte", "lt") if spec.get(op) is not None}
+        if ("gte" in bounds and day < bounds["gte"]) or ("gt" in bounds and day <= bounds["gt"]) \
+                or ("lte" in bounds and day > bounds["lte"]) or ("lt" in bounds and day >= bounds["lt"]):
+            return False
+    return True
+
+
+def select_fields(doc: Dict, fields) -> Dict:
+    '''
+    _source / with_payload semantics: True = everything, False = nothing, list = only these fields
+    '''
+    if fields is True:
+        return doc
+    if not fields:
+        return {}
+    return {k: v for k, v in doc.items() if k in fields}
+
+
+def normalized_matrix(docs: List[Dict]) -> np.ndarray:
+    matrix = np.asarray([d["vector"] for d in docs], dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix / np.where(norms == 0, 1, norms)
+
+
+def rrf(rankings: List[List[int]], rank_constant: int) -> Dict[int, float]:
+    scores = defaultdict(float)
+    for ranking in rankings:
+        for rank, pos in enumerate(ranking, start=1):
+            scores[pos] += 1.0 / (rank_constant + rank)
+    return scores
+
+
+class FakeServer:
+    '''
+    Threaded HTTP server on 127.0.0.1 with per-route call statistics.
+    Subclasses register handlers with `route(method, regex, handler)`.
+    Setting `down` makes every request fail with 503, as an overloaded or crashed backend.
+    New TCP connections count as calls of the `connect` route and wait `connect_ms`
+    (handshakes over a real network) before the first request. Gzipped request bodies are
+    accepted; responses are gzipped for clients asking for it when `compress` is set.
+    '''
+
+    def __init__(self, latency: LatencyModel):
+        self.latency = latency
+        self.routes: List[tuple] = []
+        self.stats = defaultdict(lambda: {"calls": 0, "seconds": 0.0, "bytes": 0})
+        self._stats_lock = threading.Lock()
+        self._httpd = ThreadingHTTPServer(("127.0.0.1", 0), self._make_handler())
+        self._httpd.daemon_threads = True
+        self._thread = None
+        self.down = False
+        self.compress = False
+        self.connect_ms = 0.0
+
+    @property
+    def url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def route(self, method: str, pattern: str, handler: Callable, delay: bool = True):
+        self.routes.append((method, re.compile(pattern), handler, delay))
+
+    def start(self):
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def record(self, name: str, seconds: float, size: int = 0):
+        with self._stats_lock:
+            self.stats[name]["calls"] += 1
+            self.stats[name]["seconds"] += seconds
+            self.stats[name]["bytes"] += size
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # headers and body are separate writes, with Nagle the body waits for a delayed ACK (~40 ms)
+            disable_nagle_algorithm = True
+
+            def log_message(self, *args):
+                pass
+
+            def setup(self):
+                super().setup()
+                server.record("connect", server.connect_ms / 1000.0)
+                if server.connect_ms:
+                    time.sleep(server.connect_ms / 1000.0)
+
+            def _dispatch(self, method):
+                path = self.path.split("?", 1)[0]
+                length = int(self.headers.get("Content-Length") or 0)
+                raw = self.rfile.read(length) if length else b""
+                if self.headers.get("Content-Encoding") == "gzip":
+                    raw = gzip.decompress(raw)
+                if server.down:
+                    self._reply(503, {"error": "service unavailable"})
+                    return
+
+                for route_method, pattern, handler, delay in server.routes:
+                    match = pattern.fullmatch(path)
+                    if route_method != method or not match:
+                        continue
+                    start = time.perf_counter()
+                    if delay:
+                        time.sleep(server.latency.sample())
+                    try:
+                        status, body = handler(match, raw)
+                    except Exception as e:
+                        status, body = 500, {"error": repr(e)}
+                    size = self._reply(status, body)
+                    server.record(handler.__name__, time.perf_counter() - start, size)
+                    return
+                self._reply(404, {"error": f"no route for {method} {path}"})
+
+            def _reply(self, status, body):
+                payload = b"" if body is None else json.dumps(body).encode("utf-8")
+                compress = server.compress and payload and "gzip" in (self.headers.get("Accept-Encoding") or "")
+                if compress:
+                    payload = gzip.compress(payload, compresslevel=1)
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                if compress:
+                    self.send_header("Content-Encoding", "gzip")
+                self.send_header("Content-Length", str(len(payload)))
+                self.send_header("X-Elastic-Product", "Elasticsearch")
+                self.end_headers()
+                if self.command != "HEAD":
+                    self.wfile.write(payload)
+                return len(payload)
+
+            def do_GET(self):
+                self._dispatch("GET")
+
+            def do_POST(self):
+                self._dispatch("POST")
+
+            def do_PUT(self):
+                self._dispatch("PUT")
+
+            def do_HEAD(self):
+                self._dispatch("HEAD")
+
+            def do_DELETE(self):
+                self._dispatch("DELETE")
+
+            def do_PATCH(self):
+                self._dispatch("PATCH")
+
+        return Handler
+
+
+class FakeElasticsearch(FakeServer):
+    '''
+    Serves index existence/count/create/mapping and `_search` with a term-overlap scorer,
+    exact knn over the document vectors and the rrf retriever
+    '''
+
+    def __init__(self, docs: List[Dict], latency: LatencyModel, index_name: str = "culturax",
+                 text_analyzer: str = "pl_morfologik"):
+        super().__init__(latency)
+        self.index_name = index_name
+        self.text_analyzer = text_analyzer
+        self.docs = docs
+        self.matrix = normalized_matrix(docs)
+        self.postings = defaultdict(set)
+        for pos, doc in enumerate(docs):
+            for token in set(TOKEN_RE.findall(doc["text"].lower())):
+                self.postings[token].add(pos)
+
+        self.route("GET", r"/", self.info, delay=False)
+        self.route("HEAD", r"/[^/_][^/]*", self.index_exists, delay=False)
+        self.route("PUT", r"/[^/_][^/]*", self.create_index, delay=False)
+        self.route("DELETE", r"/[^/_][^/]*", self.delete_index, delay=False)
+        self.route("GET", r"/[^/]+/_mapping", self.mapping, delay=False)
+        self.route("POST", r"/[^/]+/_count", self.count, delay=False)
+        self.route("POST", r"/[^/]+/_search", self.search)
+
+    def info(self, match, raw):
+        return 200, {"version": {"number": "8.19.4", "build_flavor": "default"}, "tagline": "You Know, for Search"}
+
+    def index_exists(self, match, raw):
+        return 200, None
+
+    def create_index(self, match, raw):
+        return 200, {"acknowledged": True, "index": self.index_name}
+
+    def delete_index(self, match, raw):
+        return 200, {"acknowledged": True}
+
+    def mapping(self, match, raw):
+        return 200, {self.index_name: {"mappings": {"properties": {
+            "text": {"type": "text", "analyzer": self.text_analyzer}
+        }}}}
+
+    def count(self, match, raw):
+        return 200, {"count": len(self.docs)}
+
+    def _query_terms(self, query: Dict) -> List[str]:
+        if "bool" in query:
+            query = query["bool"].get("must", {})
+        for kind in ("query_string", "match", "multi_match"):
+            if kind in query:
+                clause = query[kind]
+                text = clause.get("query", "") if "query" in clause else next(iter(clause.values()), {}).get("query", "")
+                return TOKEN_RE.findall(text.lower().replace(" or ", " "))
+        return []
+
+    def _filter(self, clauses: List[Dict]) -> Callable[[Dict], bool]:
+        conditions = []
+        for clause in clauses:
+            if "range" in clause:
+                conditions.append(("date", clause["range"]["date"]))
+            elif "terms" in clause:
+                conditions.append(("domain", {"any": clause["terms"]["domain"]}))
+        return lambda doc: passes_filter(doc, conditions)
+
+    def _lexical_scores(self, query: Dict) -> Dict[int, float]:
+        allowed = self._filter(query.get("bool", {}).get("filter", []))
+        scores = defaultdict(float)
+        for term in self._query_terms(query):
+            posting = self.postings.get(term, ())
+            if not posting:
+                continue
+            idf = math.log(1 + len(self.docs) / len(posting))
+            for pos in posting:
+                if allowed(self.docs[pos]):
+                    scores[pos] += idf
+        return scores
+
+    def _knn_scores(self, knn: Dict) -> Dict[int, float]:
+        # cosine similarity mapped to (1 + cos) / 2 as in ES, top k only
+        scores = (1 + self.matrix @ np.asarray(knn["query_vector"], dtype=np.float32)) / 2
+        if knn.get("filter"):
+            allowed = self._filter(knn["filter"])
+            scores = np.where([allowed(doc) for doc in self.docs], scores, -np.inf)
+        k = min(int(knn.get("k", 10)), int(np.isfinite(scores).sum()))
+        if k == 0:
+            return {}
+        top = np.argpartition(-scores, k - 1)[:k]
+        return {int(pos): float(scores[pos]) for pos in top}
+
+    @staticmethod
+    def _ranking(scores: Dict[int, float]) -> List[int]:
+        return sorted(scores, key=scores.get, reverse=True)
+
+    def search(self, match, raw):
+        body = json.loads(raw or b"{}")
+        size = int(body.get("size", 10))
+        if "retriever" in body:
+            spec = body["retriever"]["rrf"]
+            window = int(spec.get("rank_window_size", size))
+            rankings = [
+                self._ranking(self._lexical_scores(child["standard"]["query"]) if "standard" in child
+                              else self._knn_scores(child["knn"]))[:window]
+                for child in spec["retrievers"]
+            ]
+            scores = rrf(rankings, int(spec.get("rank_constant", 60)))
+        else:
+            query = body.get("query", {})
+            scores = self._lexical_scores(query)
+            if "knn" in body:
+                boost = query.get("bool", {}).get("boost", 1.0)
+                scores = defaultdict(float, {pos: s * boost for pos, s in scores.items()})
+                for pos, s in self._knn_scores(body["knn"]).items():
+                    scores[pos] += s * body["knn"].get("boost", 1.0)
+
+        ranked = sorted(scores.items(), key=lambda x: x[1], reverse=True)[:size]
+        source = body.get("_source", True)
+        hits = [
+            {
+                "_index": self.index_name,
+                "_id": self.docs[pos]["id"],
+                "_score": score,
+                "_source": select_fields(self.docs[pos], source),
+            }
+            for pos, score in ranked
+        ]
+        return 200, {
+            "took": 1,
+            "timed_out": False,
+            "_shards": {"total": 1, "successful": 1, "skipped": 0, "failed": 0},
+            "hits": {"total": {"value": len(scores), "relation": "eq"}, "max_score": ranked[0][1] if ranked else None, "hits": hits},
+        }
+
+
+class FakeQdrant(FakeServer):
+    '''
+    Serves collection metadata and `points/query` with exact cosine search,
+    sparse dot products and RRF over prefetches
+    '''
+
+    def __init__(self, docs: List[Dict], latency: LatencyModel, collection_name: str = "culturax"):
+        super().__init__(latency)
+        self.collection_name = collection_name
+        self.docs = docs
+        self.matrix = normalized_matrix(docs)
+        self._sparse = None
+
+        self.route("GET", r"/collections", self.list_collections, delay=False)
+        self.route("GET", r"/collections/[^/]+", self.get_collection, delay=False)
+        self.route("PUT", r"/collections/[^/]+", self.ok, delay=False)
+        self.route("DELETE", r"/collections/[^/]+", self.ok, delay=False)
+        self.route("PATCH", r"/collections/[^/]+", self.ok, delay=False)
+        self.route("GET", r"/collections/[^/]+/exists", self.exists, delay=False)
+        self.route("PUT", r"/collections/[^/]+/points", self.upsert, delay=False)
+        self.route("POST", r"/collections/[^/]+/points/query", self.query)
+        self.route("PUT", r"/collections/[^/]+/index", self.upsert, delay=False)
+
+    def _wrap(self, result):
+        return 200, {"result": result, "status": "ok", "time": 0.0}
+
+    def list_collections(self, match, raw):
+        return self._wrap({"collections": [{"name": self.collection_name}]})
+
+    def get_collection(self, match, raw):
+        return self._wrap({
+            "status": "green",
+            "optimizer_status": "ok",
+            "segments_count": 1,
+            "points_count": len(self.docs),
+            "indexed_vectors_count": len(self.docs),
+            "config": {
+                "params": {
+                    "vectors": {"size": VECTOR_DIM, "distance": "Cosine"},
+                    "sparse_vectors": {"text": {"modifier": "idf"}},
+                },
+                "hnsw_config": {"m": 16, "ef_construct": 100, "full_scan_threshold": 10000},
+                "optimizer_config": {
+                    "deleted_threshold": 0.2,
+                    "vacuum_min_vector_number": 1000,
+                    "default_segment_number": 0,
+                    "flush_interval_sec": 5,
+                },
+                "wal_config": {"wal_capacity_mb": 32, "wal_segments_ahead": 0},
+            },
+            "payload_schema": {},
+        })
+
+    def ok(self, match, raw):
+        return self._wrap(True)
+
+    def exists(self, match, raw):
+        return self._wrap({"exists": True})
+
+    def upsert(self, match, raw):
+        return self._wrap({"operation_id": 0, "status": "completed"})
+
+    def _sparse_scores(self, query: Dict) -> np.ndarray:
+        if self._sparse is None:
+            # imported late: `common` reads config at import, load tests set the env after importing fakes
+            from common.sparse import sparse_document_vector
+            # hashed term -> (rows, weights) with idf, as Qdrant's IDF modifier computes it
+            postings = defaultdict(list)
+            for pos, doc in enumerate(self.docs):
+                vector = sparse_document_vector(doc["text"])
+                for index, value in zip(vector.indices, vector.values):
+                    postings[index].append((pos, value))
+            n = len(self.docs)
+            self._sparse = {
+                index: [(pos, value * math.log(1 + (n - len(rows) + 0.5) / (len(rows) + 0.5))) for pos, value in rows]
+                for index, rows in postings.items()
+            }
+        scores = np.full(len(self.docs), -np.inf)
+        for index, value in zip(query["indices"], query["values"]):
+            for pos, weight in self._sparse.get(index, ()):
+                scores[pos] = max(scores[pos], 0.0) + value * weight
+        return scores
+
+    def _search(self, query, query_filter: Optional[Dict], limit: int) -> tuple[np.ndarray, np.ndarray]:
+        '''
+        Rows of the top `limit` points, best first, and their scores
+        '''
+        if isinstance(query, dict) and "indices" in query:
+            scores = self._sparse_scores(query)
+        else:
+            if isinstance(query, dict):
+                query = query.get("nearest", [])
+            vector = np.asarray(query, dtype=np.float32)
+            if vector.shape != (VECTOR_DIM,):
+                return np.zeros(0, dtype=np.int64), np.zeros(0)
+            scores = self.matrix @ vector
+        conditions = [
+            (c["key"], c.get("range") or c.get("match"))
+            for c in (query_filter or {}).get("must") or []
+        ]
+        if conditions:
+            allowed = np.asarray([passes_filter(doc, conditions) for doc in self.docs])
+            scores = np.where(allowed, scores, -np.inf)
+        limit = min(limit, int(np.isfinite(scores).sum()))
+        if limit == 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(0)
+        top = np.argpartition(-scores, min(limit, len(scores) - 1))[:limit]
+        top = top[np.argsort(-scores[top])]
+        return top, scores[top]
+
+    def query(self, match, raw):
+        body = json.loads(raw or b"{}")
+        limit = int(body.get("limit", 10))
+        if body.get("prefetch"):
+            rankings = [
+                self._search(p["query"], p.get("filter"), int(p.get("limit", 10)))[0].tolist()
+                for p in body["prefetch"]
+            ]
+            fused = rrf(rankings, 2)
+            top = sorted(fused, key=fused.get, reverse=True)[:limit]
+            scores = np.asarray([fused[pos] for pos in top])
+        else:
+            top, scores = self._search(body.get("query", []), body.get("filter"), limit)
+        points = [
+            {
+                "id": int(self.docs[pos]["id"]),
+                "version": 0,
+                "score": float(score),
+                "payload": select_fields({k: v for k, v in self.docs[pos].items() if k != "vector"},
+                                         body.get("with_payload", False)),
+            }
+            for pos, score in zip(top, scores)
+        ]
+        return self._wrap({"points": points})
+
+
+def parse_keep_alive(value) -> float:
+    '''
+    Ollama keep_alive (seconds or "30s" / "5m" / "1h", negative = forever) in seconds
+    '''
+    if value is None:
+        return 300.0
+    match = DURATION_RE.match(str(value).strip())
+    if not match:
+        raise ValueError(f"Bad keep_alive: {value}")
+    seconds = float(match.group(1)) * DURATION_UNITS[match.group(2)]
+    return math.inf if seconds < 0 else seconds
+
+
+class FakeOllama(FakeServer):
+    '''
+    Serves `/api/tags`, `/api/pull` and `/api/chat`.
+    Chat replies are shaped after the prompt: JSON for decomposition,
+    interpretation lines for clarification, and a cited answer quoting
+    fragment [1] for the main RAG prompt, so validation passes.
+
+    Like an Ollama runner with OLLAMA_NUM_PARALLEL=`slots`, at most `slots` chats are
+    processed at once and the rest queue. Each slot's KV cache keeps the last prompt
+    it evaluated, a request takes the free slot sharing
+    the longest token prefix and pays `prefill_ms` per token after it. A prefix shorter
+    than its slot's content is copied to the least recently used slot, as Ollama does,
+    so the longer cached prompt survives. The model is
+    (re)loaded, paying `load_ms` and emptying the caches, on the first call, after
+    `keep_alive` expires and whenever `num_ctx` changes.
+    `refusal_share` of answer prompts (chosen by prompt hash, so the same prompt always
+    gets the same reply) are answered "BRAK ODPOWIEDZI" to drive the retry strategies.
+    '''
+
+    def __init__(self, latency: LatencyModel, model_name: str = "gemma2:2b", sub_questions: int = 0,
+                 prefill_ms: float = 0.0, load_ms: float = 0.0, slots: int = 4, refusal_share: float = 0.0):
+        super().__init__(latency)
+        self.model_name = model_name
+        self.sub_questions = sub_questions
+        self.refusal_share = refusal_share
+        self.prefill_ms = prefill_ms
+        self.load_ms = load_ms
+        self.slots: List[List[str]] = [[] for _ in range(slots)]
+        self._busy = [False] * slots
+        self._last_used = [0.0] * slots
+        self._loaded_num_ctx = None
+        self._expires_at = 0.0
+        self._model_lock = threading.Lock()
+        self._parallel = threading.Semaphore(slots)
+
+        self.route("GET", r"/api/tags", self.tags, delay=False)
+        self.route("POST", r"/api/pull", self.pull, delay=False)
+        # generation latency is slept inside chat, while holding a slot
+        self.route("POST", r"/api/chat", self.chat, delay=False)
+
+    def tags(self, match, raw):
+        return 200, {"models": [{"name": self.model_name, "model": self.model_name, "size": 0}]}
+
+    def pull(self, match, raw):
+        return 200, {"status": "success"}
+
+    def _answer(self, prompt: str) -> str:
+        if "main_question" in prompt:
+            question = prompt.split("Pytanie:", 1)[-1].split("\n\n", 1)[0].strip()
+            return json.dumps({
+                "main_question": question,
+                "sub_questions": [f"{question} (aspekt {i + 1})" for i in range(self.sub_questions)],
+            }, ensure_ascii=False)
+
+        if "interpretacje" in prompt.lower() and "Fragmenty" not in prompt:
+            return "pytanie dotyczy pierwszej interpretacji\npytanie dotyczy drugiej interpretacji"
+
+        fragment = FRAGMENT_RE.search(prompt)
+        if not fragment or zlib.crc32(prompt.encode()) % 1000 < self.refusal_share * 1000:
+            return "BRAK ODPOWIEDZI"
+        quote = " ".join(fragment.group(1).split()[:8])
+        return f"Odpowiedź na podstawie fragmentów. [1] \"{quote}\""
+
+    def _acquire_slot(self, tokens: List[str], num_ctx) -> tuple[int, int, bool]:
+        '''
+        Returns (slot, cached prefix tokens, model loaded now), called with a free slot
+        '''
+        with self._model_lock:
+            now = time.monotonic()
+            load = self._loaded_num_ctx != num_ctx or now > self._expires_at
+            if load:
+                self._loaded_num_ctx = num_ctx
+                self.slots = [[] for _ in self.slots]
+            free = [i for i in range(len(self.slots)) if not self._busy[i]]
+            best, best_prefix = None, 0
+            for i in free:
+                prefix = 0
+                for a, b in zip(self.slots[i], tokens):
+                    if a != b:
+                        break
+                    prefix += 1
+                if prefix > best_prefix:
+                    best, best_prefix = i, prefix
+            if best is None or best_prefix < len(self.slots[best]):
+                best = min(free, key=lambda i: self._last_used[i])
+            self._busy[best] = True
+            return best, best_prefix, load
+
+    def _release_slot(self, slot: int, tokens: List[str], keep_alive):
+        with self._model_lock:
+            self.slots[slot] = tokens
+            self._busy[slot] = False
+            self._last_used[slot] = time.monotonic()
+            self._expires_at = time.monotonic() + parse_keep_alive(keep_alive)
+
+    def chat(self, match, raw):
+        body = json.loads(raw or b"{}")
+        messages = body.get("messages", [])
+        prompt = "\n".join(m.get("content", "") for m in messages)
+        tokens = [t for m in messages for t in [m.get("role", "user")] + TOKEN_RE.findall(m.get("content", ""))]
+        with self._parallel:
+            slot, cached, load = self._acquire_slot(tokens, (body.get("options") or {}).get("num_ctx"))
+            load_seconds = self.load_ms / 1000.0 if load else 0.0
+            prefill_seconds = (len(tokens) - cached) * self.prefill_ms / 1000.0
+            time.sleep(load_seconds + prefill_seconds)
+            time.sleep(self.latency.sample())
+            self._release_slot(slot, tokens, body.get("keep_alive"))
+        self.record("ttft", load_seconds + prefill_seconds)
+        if load:
+            self.record("model_load", load_seconds)
+
+        content = self._answer(prompt)
+        return 200, {
+            "model": body.get("model", self.model_name),
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "message": {"role": "assistant", "content": content},
+            "done": True,
+            "done_reason": "stop",
+            "load_duration": int(load_seconds * 1e9),
+            "prompt_eval_count": len(tokens) - cached,
+            "prompt_eval_duration": int(prefill_seconds * 1e9),
+            "eval_count": len(TOKEN_RE.findall(content)),
+        }
+
+
+class FakeStack:
+    '''
+    Starts all three fakes over a shared corpus; several Ollama hosts and separate
+    planner hosts (their own model and latency) when asked
+    '''
+
+    def __init__(
+            self,
+            docs: List[Dict],
+            es_latency: str = "0",
+            qdrant_latency: str = "0",
+            ollama_latency: str = "0",
+            sub_questions: int = 0,
+            seed: int = 0,
+            ollama_prefill_ms: float = 0.0,
+            ollama_load_ms: float = 0.0,
+            ollama_slots: int = 4,
+            ollama_hosts: int = 1,
+            planner_hosts: int = 0,
+            planner_latency: str = "0",
+            planner_model: str = "gemma2:2b",
+            refusal_share: float = 0.0):
+        self.es = FakeElasticsearch(docs, LatencyModel(es_latency, seed))
+        self.qdrant = FakeQdrant(docs, LatencyModel(qdrant_latency, seed + 1))
+        ollama = dict(sub_questions=sub_questions, prefill_ms=ollama_prefill_ms, load_ms=ollama_load_ms,
+                      slots=ollama_slots, refusal_share=refusal_share)
+        self.ollamas = [FakeOllama(LatencyModel(ollama_latency, seed + 2 + i), **ollama)
+                        for i in range(ollama_hosts)]
+        self.planners = [FakeOllama(LatencyModel(planner_latency, seed + 100 + i), model_name=planner_model, **ollama)
+                         for i in range(planner_hosts)]
+        self.ollama = self.ollamas[0]
+
+    @property
+    def servers(self) -> Dict[str, FakeServer]:
+        servers = {"elasticsearch": self.es, "qdrant": self.qdrant}
+        for name, group in (("ollama", self.ollamas), ("planner", self.planners)):
+            for i, server in enumerate(group):
+                servers[name if i == 0 else f"{name}{i + 1}"] = server
+        return servers
+
+    def start(self):
+        for server in self.servers.values():
+            server.start()
+        return self
+
+    def stop(self):
+        for server in self.servers.values():
+            server.stop()
+
+    def reset_stats(self):
+        for server in self.servers.values():
+            server.stats.clear()
+
+    def stats(self) -> Dict:
+        return {
+            name: {route: dict(values) for route, values in server.stats.items()}
+            for name, server in self.servers.items()
+        }
@@ -0,0 +1,128 @@
+"""
+Two-engine retrieval (Qdrant + ES, fused in Python) vs. single-engine hybrid search.
+
+Run from the `rag` directory:
+    python -m bench.hybrid --corpus-size 20000 --queries 200 --es-latency lognormal:15:0.4 --qdrant-latency lognormal:10:0.4
+    python -m bench.hybrid --corpus data/culturax_vectors.ndjson --es-url http://localhost:9200 --qdrant-url http://localhost:6333
+
+Every query runs the current path (search_qdrant, search_es, rrf_fusion_weighted,
+one after another as in `retrieve_chunks`) and each hybrid mode (one request).
+`hit@k` is how often the source document is among the fused results, `overlap@k`
+how many of the two-engine results the hybrid mode also returns. Query vectors
+are the source document vector plus noise, query text a few of its words.
+Without URLs both engines are the in-process fakes with the given latencies,
+with real engines the Qdrant collection is recreated with sparse vectors when needed.
+"""
+from typing import Callable, Dict, List
+import argparse
+import tempfile
+import time
+import os
+
+import numpy as np
+from qdrant_client import QdrantClient
+from elasticsearch import Elasticsearch
+
+import config
+from common import DEFAULT_DEPTH, make_queries, create_es_index, populate_index, create_qdrant_collection, populate_collection
+from retrieval.elastic import search_es
+from retrieval.qdrant import search_qdrant
+from retrieval.hybrid import search_es_hybrid, search_qdrant_hybrid
+from retrieval.fusion import rrf_fusion_weighted
+from bench.fakes import FakeElasticsearch, FakeQdrant, LatencyModel, synthetic_corpus, load_corpus, write_corpus
+from bench.retrieval import sample_queries
+
+
+def two_engines(es_client: Elasticsearch, qdrant_client: QdrantClient) -> Callable:
+    def search(vec, es_query: str, weights: Dict[str, float]) -> List[tuple[str, float]]:
+        ids_qdrant, texts_qdrant, _ = search_qdrant(vec, qdrant_client, config.QDRANT_INDEX_NAME)
+        ids_es, texts_es, _ = search_es(es_query, es_client, config.ES_INDEX_NAME)
+        return rrf_fusion_weighted(ids_qdrant, ids_es, texts_qdrant, texts_es,
+                                   qdrant_weight=weights["qdrant"], es_weight=weights["es"], k=15)
+    return search
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark single-engine hybrid search against the two-engine path")
+    parser.add_argument("--corpus", help="ndjson data file; synthetic corpus when omitted")
+    parser.add_argument("--corpus-size", type=int, default=5000)
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--es-url", help="running Elasticsearch (index created and filled when empty)")
+    parser.add_argument("--qdrant-url", help="running Qdrant (collection created and filled when empty)")
+    parser.add_argument("--es-latency", default="lognormal:15:0.4")
+    parser.add_argument("--qdrant-latency", default="lognormal:10:0.4")
+    parser.add_argument("--modes", nargs="*", default=["es:rrf", "es:linear", "qdrant"])
+    parser.add_argument("--weights", type=float, nargs=2, default=[0.55, 0.45], metavar=("ES", "QDRANT"))
+    parser.add_argument("--noise", type=float, default=0.05, help="std of the noise added to query vectors")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    docs = load_corpus(args.corpus) if args.corpus else synthetic_corpus(args.corpus_size, args.seed)
+    data_path = args.corpus
+    if not data_path:
+        data_path = os.path.join(tempfile.mkdtemp(prefix="rag_hybrid_bench_"), "corpus.ndjson")
+        write_corpus(docs, data_path)
+
+    fakes = []
+    if args.es_url:
+        es_client = Elasticsearch(args.es_url)
+        create_es_index(config.ES_INDEX_NAME, es_client)
+        populate_index(data_path, config.ES_INDEX_NAME, es_client)
+    else:
+        fakes.append(FakeElasticsearch(docs, LatencyModel(args.es_latency, args.seed)))
+        fakes[-1].start()
+        es_client = Elasticsearch(fakes[-1].url)
+    if args.qdrant_url:
+        qdrant_client = QdrantClient(args.qdrant_url, timeout=300)
+        create_qdrant_collection(config.QDRANT_INDEX_NAME, qdrant_client, sparse=True)
+        populate_collection(data_path, config.QDRANT_INDEX_NAME, qdrant_client, sparse=True)
+    else:
+        fakes.append(FakeQdrant(docs, LatencyModel(args.qdrant_latency, args.seed + 1)))
+        fakes[-1].start()
+        qdrant_client = QdrantClient(fakes[-1].url)
+
+    weights = {"es": args.weights[0], "qdrant": args.weights[1]}
+    modes = {"two engines + python rrf": two_engines(es_client, qdrant_client)}
+    for mode in args.modes:
+        engine, _, fusion = mode.partition(":")
+        if engine == "es":
+            modes[f"es hybrid ({fusion or 'rrf'})"] = lambda vec, q, w, fusion=fusion or "rrf": search_es_hybrid(
+                vec, q, w, DEFAULT_DEPTH, es_client, config.ES_INDEX_NAME, fusion=fusion)
+        elif engine == "qdrant":
+            modes["qdrant hybrid (dense+sparse rrf)"] = lambda vec, q, w: search_qdrant_hybrid(
+                vec, q, w, DEFAULT_DEPTH, qdrant_client, config.QDRANT_INDEX_NAME)
+        else:
+            raise ValueError(f"Unknown mode: {mode}")
+
+    rng = np.random.default_rng(args.seed)
+    by_id = {int(d["id"]): d for d in docs}
+    queries = []
+    for doc_id, text in sample_queries(docs, args.queries, args.seed):
+        vec = np.asarray(by_id[doc_id]["vector"], dtype=np.float32)
+        vec = vec / np.linalg.norm(vec) + rng.normal(0, args.noise, len(vec)).astype(np.float32)
+        queries.append((by_id[doc_id]["text"], vec / np.linalg.norm(vec), make_queries(text)[1]))
+
+    results = {name: ([], []) for name in modes}
+    try:
+        for source, vec, es_query in queries:
+            for name, search in modes.items():
+                start = time.perf_counter()
+                fused = search(vec, es_query, weights)
+                results[name][0].append((time.perf_counter() - start) * 1000.0)
+                results[name][1].append([text for text, _ in fused])
+    finally:
+        for fake in fakes:
+            fake.stop()
+
+    reference = results["two engines + python rrf"][1]
+    print(f"{'mode':<34}{'p50 ms':>9}{'p95 ms':>9}{'mean ms':>9}{'hit@k':>8}{'overlap@k':>11}")
+    for name, (latency, found) in results.items():
+        latency = np.asarray(latency)
+        hits = np.mean([source in texts for (source, _, _), texts in zip(queries, found)])
+        overlap = np.mean([len(set(texts) & set(ref)) / len(ref) for texts, ref in zip(found, reference) if ref])
+        print(f"{name:<34}{np.percentile(latency, 50):>9.2f}{np.percentile(latency, 95):>9.2f}"
+              f"{latency.mean():>9.2f}{hits:>8.3f}{overlap:>11.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,326 @@
+"""
+End-to-end load test of `/ask` against in-process fakes.
+
+Run from the `rag` directory:
+    python -m bench.loadtest --rps 2 --duration 30 --ollama-latency lognormal:800:0.3
+
+The FastAPI app is served by uvicorn in a background thread and driven
+open-loop at the target RPS, so queueing inside the app shows up as latency.
+"""
+from collections import defaultdict
+from functools import wraps
+from typing import Dict, List
+import threading
+import argparse
+import asyncio
+import socket
+import tempfile
+import random
+import json
+import time
+import os
+
+import numpy as np
+import httpx
+import uvicorn
+
+from bench.fakes import FakeStack, synthetic_corpus, load_corpus, write_corpus
+
+DEFAULT_QUERIES = [
+    "pomysł na prezent",
+    "jak zarządzać zespołem w firmie?",
+    "co to jest inflacja",
+    "przepis na ciasto z kawą",
+    "program dla szkoły",
+    "rozwój gospodarki po 2015",
+    "najlepszy telefon w promocji",
+    "dlaczego warto uprawiać sport?",
+    "formularz PIT-37",
+    "NFZ",
+]
+
+# Stage name -> name of the callable looked up from the `rag` module globals
+STAGES = {
+    "clarification": "clarify_query",
+    "decomposition": "decompose_query",
+    "make_queries": "make_queries",
+    "embed": "embed",
+    "search_qdrant": "search_qdrant",
+    "search_local_vectors": "search_local_vectors",
+    "search_es": "search_es",
+    "search_local_bm25": "search_local_bm25",
+    "search_es_hybrid": "search_es_hybrid",
+    "search_qdrant_hybrid": "search_qdrant_hybrid",
+    "fusion": "rrf_fusion_weighted",
+    "chunking": "chunk_documents",
+    "redundancy": "suppress_near_duplicates",
+    "filtering": "filter_retrieved_with_stats",
+    "packing": "pack_chunks",
+    "ask_model": "ask_model",
+}
+
+
+class StageRecorder:
+    '''
+    Wraps pipeline functions in the `rag` module namespace and records durations
+    '''
+
+    def __init__(self):
+        self.samples = defaultdict(list)
+        self._lock = threading.Lock()
+
+    def wrap(self, stage: str, fn):
+        @wraps(fn)
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - start
+                with self._lock:
+                    self.samples[stage].append(elapsed)
+        return timed
+
+    def install(self, rag_module):
+        for stage, attr in STAGES.items():
+            setattr(rag_module, attr, self.wrap(stage, getattr(rag_module, attr)))
+        rag_module.RAG.evaluate_answer = self.wrap("validation", rag_module.RAG.evaluate_answer)
+
+    def reset(self):
+        with self._lock:
+            self.samples.clear()
+
+    def summary(self) -> Dict:
+        with self._lock:
+            return {stage: describe(values) for stage, values in self.samples.items()}
+
+
+def describe(values: List[float]) -> Dict:
+    if not values:
+        return {"count": 0}
+    arr = np.asarray(values) * 1000.0
+    return {
+        "count": len(values),
+        "mean_ms": float(arr.mean()),
+        "p50_ms": float(np.percentile(arr, 50)),
+        "p95_ms": float(np.percentile(arr, 95)),
+        "p99_ms": float(np.percentile(arr, 99)),
+        "max_ms": float(arr.max()),
+    }
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_app(port: int) -> uvicorn.Server:
+    import main
+
+    server = uvicorn.Server(uvicorn.Config(main.app, host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.05)
+    return server
+
+
+async def drive(base_url: str, queries: List[str], rps: float, duration: float,
+                arrival: str, timeout: float, retry_strats: List[str], seed: int,
+                deadline_ms: int = 0) -> Dict:
+    '''
+    Open-loop driver: requests are fired on schedule regardless of completions.
+    Goodput counts answers that came back within `deadline_ms` (all answers without one).
+    '''
+    rng = random.Random(seed)
+    latencies, statuses, profiles = [], defaultdict(int), defaultdict(int)
+    coalesced = 0
+    body = {"retry_strats": retry_strats}
+    if deadline_ms:
+        body["deadline_ms"] = deadline_ms
+
+    async with httpx.AsyncClient(base_url=base_url, timeout=timeout,
+                                 limits=httpx.Limits(max_connections=None)) as client:
+        async def one(query: str):
+            nonlocal coalesced
+            start = time.perf_counter()
+            try:
+                resp = await client.post("/ask", params={"query": query}, json=body)
+                statuses[resp.status_code] += 1
+                if resp.status_code == 200:
+                    latencies.append(time.perf_counter() - start)
+                    data = resp.json()
+                    profiles[data.get("profile", "full")] += 1
+                    coalesced += bool(data.get("coalesced"))
+            except httpx.HTTPError as e:
+                statuses[type(e).__name__] += 1
+
+        tasks = []
+        started = time.perf_counter()
+        next_at = started
+        while next_at - started < duration:
+            delay = next_at - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            tasks.append(asyncio.create_task(one(rng.choice(queries))))
+            gap = rng.expovariate(rps) if arrival == "poisson" else 1.0 / rps
+            next_at += gap
+
+        await asyncio.gather(*tasks)
+        wall = time.perf_counter() - started
+
+    in_time = sum(1 for latency in latencies if not deadline_ms or latency * 1000.0 <= deadline_ms)
+    return {
+        "sent": len(tasks),
+        "ok": len(latencies),
+        "goodput_rps": in_time / wall if wall else 0.0,
+        "statuses": {str(k): v for k, v in statuses.items()},
+        "profiles": dict(profiles),
+        "coalesced": coalesced,
+        "wall_s": wall,
+        "throughput_rps": len(latencies) / wall if wall else 0.0,
+        "latency": describe(latencies),
+    }
+
+
+def print_report(report: Dict):
+    lat = report["latency"]
+    print(f"\nsent={report['sent']} ok={report['ok']} statuses={report['statuses']} profiles={report['profiles']} "
+          f"coalesced={report['coalesced'] / max(report['ok'], 1):.2f}")
+    print(f"throughput={report['throughput_rps']:.2f} req/s goodput={report['goodput_rps']:.2f} req/s "
+          f"over {report['wall_s']:.1f}s")
+    if lat.get("count"):
+        print(f"latency p50={lat['p50_ms']:.0f}ms p95={lat['p95_ms']:.0f}ms p99={lat['p99_ms']:.0f}ms max={lat['max_ms']:.0f}ms")
+
+    print(f"\n{'stage':<22}{'calls':>8}{'mean':>10}{'p50':>10}{'p95':>10}{'p99':>10}")
+    for stage, s in report["stages"].items():
+        if s["count"]:
+            print(f"{stage:<22}{s['count']:>8}{s['mean_ms']:>10.1f}{s['p50_ms']:>10.1f}{s['p95_ms']:>10.1f}{s['p99_ms']:>10.1f}")
+
+    requests = max(report["ok"], 1)
+    print(f"\n{'backend call':<30}{'calls':>8}{'per req':>9}{'mean ms':>9}{'KiB/call':>10}{'KiB/req':>9}")
+    for backend, routes in report["backends"].items():
+        for route, s in routes.items():
+            if not s["calls"]:
+                continue
+            print(f"{backend + '.' + route:<30}{s['calls']:>8}{s['calls'] / requests:>9.2f}"
+                  f"{s['seconds'] * 1000 / s['calls']:>9.1f}{s['bytes'] / 1024 / s['calls']:>10.1f}{s['bytes'] / 1024 / requests:>9.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test /ask against fake ES, Qdrant and Ollama")
+    parser.add_argument("--rps", type=float, default=1.0)
+    parser.add_argument("--duration", type=float, default=30.0, help="seconds of request arrivals")
+    parser.add_argument("--warmup", type=int, default=2, help="sequential requests before measuring")
+    parser.add_argument("--arrival", choices=["uniform", "poisson"], default="poisson")
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--queries", help="file with one query per line")
+    parser.add_argument("--corpus", help="ndjson data file; synthetic corpus when omitted")
+    parser.add_argument("--corpus-size", type=int, default=2000)
+    parser.add_argument("--es-latency", default="lognormal:15:0.4")
+    parser.add_argument("--qdrant-latency", default="lognormal:10:0.4")
+    parser.add_argument("--ollama-latency", default="lognormal:600:0.3")
+    parser.add_argument("--ollama-prefill-ms", type=float, default=1.0,
+                        help="fake Ollama prompt evaluation per token not in a cached prefix")
+    parser.add_argument("--ollama-load-ms", type=float, default=1500.0,
+                        help="fake Ollama model load (first call, keep_alive expired, num_ctx changed)")
+    parser.add_argument("--ollama-slots", type=int, default=4, help="fake Ollama parallel KV cache slots")
+    parser.add_argument("--ollama-keep-alive", default="30m")
+    parser.add_argument("--no-ollama-warmup", action="store_true", help="skip the warmup request at startup")
+    parser.add_argument("--ollama-hosts", type=int, default=1, help="fake Ollama hosts behind the pooled client")
+    parser.add_argument("--planner-hosts", type=int, default=0,
+                        help="separate fake Ollama hosts for clarification / decomposition")
+    parser.add_argument("--planner-latency", default="lognormal:200:0.3")
+    parser.add_argument("--planner-model", default="gemma2:2b")
+    parser.add_argument("--vector-backend", choices=["qdrant", "local"], default="qdrant")
+    parser.add_argument("--lexical-backend", choices=["es", "local"], default="es")
+    parser.add_argument("--hybrid-search", choices=["off", "es", "qdrant"], default="off",
+                        help="serve both retrievals from one engine, fused server-side")
+    parser.add_argument("--es-hybrid-fusion", choices=["rrf", "linear"], default="rrf")
+    parser.add_argument("--fixed-depth", action="store_true",
+                        help="always fetch 35 per engine from both engines (disables adaptive retrieval)")
+    parser.add_argument("--chunk-dedup-threshold", type=float, default=0.7,
+                        help="query-time near-duplicate chunk suppression, 0 disables")
+    parser.add_argument("--sub-questions", type=int, default=0, help="sub-questions returned by fake decomposition")
+    parser.add_argument("--deadline-ms", type=int, default=0, help="per-request deadline sent with /ask")
+    parser.add_argument("--max-concurrent", type=int, help="MAX_CONCURRENT_REQUESTS, 0 = no admission limit")
+    parser.add_argument("--max-queue", type=int, help="MAX_QUEUED_REQUESTS")
+    parser.add_argument("--pipeline-profile", default="auto", choices=["auto", "full", "fast", "minimal"])
+    parser.add_argument("--retry-strats", nargs="*", default=["modify_prompt", "save_to_memory"])
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="write the full report to this path")
+    args = parser.parse_args()
+
+    docs = load_corpus(args.corpus, args.corpus_size) if args.corpus else synthetic_corpus(args.corpus_size, args.seed)
+    queries = DEFAULT_QUERIES
+    if args.queries:
+        with open(args.queries) as f:
+            queries = [line.strip() for line in f if line.strip()]
+
+    stack = FakeStack(docs, args.es_latency, args.qdrant_latency, args.ollama_latency,
+                      sub_questions=args.sub_questions, seed=args.seed,
+                      ollama_prefill_ms=args.ollama_prefill_ms, ollama_load_ms=args.ollama_load_ms,
+                      ollama_slots=args.ollama_slots, ollama_hosts=args.ollama_hosts,
+                      planner_hosts=args.planner_hosts, planner_latency=args.planner_latency,
+                      planner_model=args.planner_model).start()
+    os.environ["ES_URL"] = stack.es.url
+    os.environ["QDRANT_URL"] = stack.qdrant.url
+    os.environ["OLLAMA_HOST"] = stack.ollama.url
+    os.environ["OLLAMA_HOSTS"] = ",".join(server.url for server in stack.ollamas)
+    if stack.planners:
+        os.environ["PLANNER_HOSTS"] = ",".join(server.url for server in stack.planners)
+        os.environ["PLANNER_MODEL_NAME"] = args.planner_model
+    os.environ.setdefault("UNRESOLVED_STORAGE_PATH", os.path.join("memory", "loadtest_unresolved.json"))
+    os.environ["VECTOR_BACKEND"] = args.vector_backend
+    os.environ["LEXICAL_BACKEND"] = args.lexical_backend
+    os.environ["HYBRID_SEARCH"] = args.hybrid_search
+    os.environ["ES_HYBRID_FUSION"] = args.es_hybrid_fusion
+    os.environ["ADAPTIVE_RETRIEVAL"] = "false" if args.fixed_depth else "true"
+    os.environ["CHUNK_DEDUP_THRESHOLD"] = str(args.chunk_dedup_threshold)
+    os.environ["OLLAMA_KEEP_ALIVE"] = args.ollama_keep_alive
+    os.environ["OLLAMA_WARMUP"] = "false" if args.no_ollama_warmup else "true"
+    os.environ["PIPELINE_PROFILE"] = args.pipeline_profile
+    if args.max_concurrent is not None:
+        os.environ["MAX_CONCURRENT_REQUESTS"] = str(args.max_concurrent)
+    if args.max_queue is not None:
+        os.environ["MAX_QUEUED_REQUESTS"] = str(args.max_queue)
+    if "local" in (args.vector_backend, args.lexical_backend):
+        # local indexes are built from a data file, give them the same corpus the fakes serve
+        workdir = tempfile.mkdtemp(prefix="rag_loadtest_")
+        write_corpus(docs, os.path.join(workdir, "corpus.ndjson"))
+        os.environ["DATA_FILE_NAME"] = os.path.join(workdir, "corpus.ndjson")
+        os.environ["LOCAL_INDEX_DIR"] = os.path.join(workdir, "local_index")
+
+    import rag
+    recorder = StageRecorder()
+    recorder.install(rag)
+
+    port = free_port()
+    server = start_app(port)
+    base_url = f"http://127.0.0.1:{port}"
+
+    try:
+        with httpx.Client(base_url=base_url, timeout=args.timeout) as client:
+            for query in queries[:args.warmup]:
+                client.post("/ask", params={"query": query}, json={"retry_strats": args.retry_strats})
+        recorder.reset()
+        stack.reset_stats()
+
+        report = asyncio.run(drive(base_url, queries, args.rps, args.duration, args.arrival,
+                                   args.timeout, args.retry_strats, args.seed, args.deadline_ms))
+        report["stages"] = recorder.summary()
+        report["backends"] = stack.stats()
+        report["config"] = vars(args)
+    finally:
+        server.should_exit = True
+        stack.stop()
+
+    print_report(report)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""
+Pooled Ollama client: throughput and failover over several (fake) Ollama hosts.
+
+Run from the `rag` directory:
+    python -m bench.ollama_pool --host-latency lognormal:300:0.3 lognormal:300:0.3 lognormal:900:0.3
+    python -m bench.ollama_pool --requests 400 --concurrency 16 --kill-after 0.3
+
+`--concurrency` threads send `--requests` answer-sized chats in total. Every host is a
+fake Ollama processing `--slots` chats at once (the rest queue), with its own latency.
+Modes: the first host alone (today's single `Client`), a uniformly random host per call
+and `OllamaPool` (least requests in flight, per-host cap, ejection, one retry).
+With `--kill-after` the last host starts failing (503) after that share of the requests.
+"""
+from typing import Callable, List
+from concurrent.futures import ThreadPoolExecutor
+import argparse
+import random
+import threading
+import time
+
+import numpy as np
+from ollama import Client
+
+from common import OllamaPool
+from bench.fakes import FakeOllama, LatencyModel
+
+MESSAGES = [
+    {"role": "system", "content": "Odpowiadaj wyłącznie na podstawie fragmentów."},
+    {"role": "user", "content": "Fragmenty:\n[1] Inflacja w Polsce spadła w 2024 roku.\n\nPytanie:\nCo z inflacją?"},
+]
+
+
+def run(chat: Callable, fakes: List[FakeOllama], requests: int, concurrency: int, kill_after: float) -> dict:
+    latencies, errors = [], 0
+    lock = threading.Lock()
+    done = [0]
+
+    def one(i):
+        nonlocal errors
+        start = time.perf_counter()
+        try:
+            chat(model="gemma2:2b", messages=MESSAGES)
+            ok = True
+        except Exception:
+            ok = False
+        with lock:
+            done[0] += 1
+            if ok:
+                latencies.append((time.perf_counter() - start) * 1000.0)
+            else:
+                errors += 1
+            if kill_after and done[0] == int(requests * kill_after):
+                fakes[-1].down = True
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        list(pool.map(one, range(requests)))
+    elapsed = time.perf_counter() - start
+    return {
+        "throughput": len(latencies) / elapsed,
+        "latency": np.asarray(latencies or [0.0]),
+        "errors": errors,
+        "calls": [fake.stats["chat"]["calls"] for fake in fakes],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the pooled Ollama client against fake hosts")
+    parser.add_argument("--host-latency", nargs="*",
+                        default=["lognormal:300:0.3", "lognormal:300:0.3", "lognormal:900:0.3"])
+    parser.add_argument("--slots", type=int, default=2, help="chats processed at once per host")
+    parser.add_argument("--requests", type=int, default=300)
+    parser.add_argument("--concurrency", type=int, default=12)
+    parser.add_argument("--kill-after", type=float, default=0.0, help="make the last host fail after this share of requests")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    def start_fakes(n=None):
+        specs = args.host_latency[:n]
+        return [FakeOllama(LatencyModel(spec, args.seed + i), slots=args.slots).start() for i, spec in enumerate(specs)]
+
+    rng = random.Random(args.seed)
+    modes = {
+        "single host": lambda fakes: Client(fakes[0].url).chat,
+        "random host": lambda fakes: (lambda clients: lambda **kw: rng.choice(clients).chat(**kw))(
+            [Client(f.url) for f in fakes]),
+        "pool (least outstanding)": lambda fakes: OllamaPool([f.url for f in fakes], max_concurrency=args.slots,
+                                                             health_interval=1.0, eject_seconds=5.0).chat,
+    }
+    print(f"{'mode':<26}{'req/s':>8}{'p50 ms':>9}{'p95 ms':>9}{'errors':>8}  calls per host")
+    for name, make in modes.items():
+        fakes = start_fakes(1 if name == "single host" else None)
+        result = run(make(fakes), fakes, args.requests, args.concurrency,
+                     0.0 if name == "single host" else args.kill_after)
+        for fake in fakes:
+            fake.stop()
+        print(f"{name:<26}{result['throughput']:>8.2f}{np.percentile(result['latency'], 50):>9.0f}"
+              f"{np.percentile(result['latency'], 95):>9.0f}{result['errors']:>8}  {result['calls']}")
+
+
+if __name__ == "__main__":
+    main()
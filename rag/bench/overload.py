@@ -0,0 +1,57 @@
+"""
+Goodput under overload with and without admission control.
+
+Run from the `rag` directory:
+    python -m bench.overload --rps 2 4 8 16 --deadline-ms 4000
+    python -m bench.overload --rps 4 16 32 --max-concurrent 8 --max-queue 16 -- --ollama-latency const:300
+
+Runs `bench.loadtest` once per offered load, once with no limit (MAX_CONCURRENT_REQUESTS=0,
+every request starts at once) and once with the limiter, each in its own process.
+Every request carries `--deadline-ms`. `goodput` counts answers that arrived within it;
+429 / 503 are shed before running, 504 ran out of time while running.
+Arguments after `--` go to the load test unchanged.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+
+def run_loadtest(rps: float, max_concurrent: int, args, extra) -> dict:
+    with tempfile.TemporaryDirectory() as workdir:
+        path = os.path.join(workdir, "report.json")
+        command = [sys.executable, "-m", "bench.loadtest", "--rps", str(rps), "--duration", str(args.duration),
+                   "--deadline-ms", str(args.deadline_ms), "--max-concurrent", str(max_concurrent),
+                   "--max-queue", str(args.max_queue), "--seed", str(args.seed), "--json", path, *extra]
+        subprocess.run(command, check=True, stdout=subprocess.DEVNULL)
+        with open(path) as f:
+            return json.load(f)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Goodput vs offered load with and without admission control")
+    parser.add_argument("--rps", type=float, nargs="*", default=[2, 4, 8, 16])
+    parser.add_argument("--duration", type=float, default=20.0)
+    parser.add_argument("--deadline-ms", type=int, default=4000)
+    parser.add_argument("--max-concurrent", type=int, default=8)
+    parser.add_argument("--max-queue", type=int, default=16)
+    parser.add_argument("--seed", type=int, default=0)
+    args, extra = parser.parse_known_args()
+    extra = [a for a in extra if a != "--"]
+
+    modes = {"no limit": 0, f"limit {args.max_concurrent}/{args.max_queue}": args.max_concurrent}
+    print(f"{'mode':<16}{'rps':>6}{'goodput':>9}{'ok':>6}{'shed':>6}{'504':>6}{'p50 ms':>8}{'p95 ms':>8}")
+    for rps in args.rps:
+        for name, max_concurrent in modes.items():
+            report = run_loadtest(rps, max_concurrent, args, extra)
+            statuses = report["statuses"]
+            latency = report["latency"]
+            shed = statuses.get("429", 0) + statuses.get("503", 0)
+            print(f"{name:<16}{rps:>6g}{report['goodput_rps']:>9.2f}{report['ok']:>6}{shed:>6}"
+                  f"{statuses.get('504', 0):>6}{latency.get('p50_ms', 0):>8.0f}{latency.get('p95_ms', 0):>8.0f}")
+
+
+if __name__ == "__main__":
+    main()
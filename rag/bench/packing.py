@@ -0,0 +1,119 @@
+"""
+Prompt packing: regex-token greedy loop vs model-token knapsack.
+
+Run from the `rag` directory:
+    python -m bench.packing --tokenizer path/to/tokenizer.json --budget 250 500 1000
+    python -m bench.packing --corpus data/culturax_vectors.ndjson --tokenizer google/gemma-2-2b
+
+Each query takes the exact top `--depth` documents for a noisy copy of a document
+vector, chunks them as `retrieve_chunks` does and keeps the first `--max-docs`
+chunks (what filtering passes on), scored by cosine. Three packers fill `--budget`:
+the old loop (regex tokens, stops at the first chunk that does not fit), the same
+loop on model tokens, and `pack_chunks`. `model tokens` is the real prompt
+context size, `over` the share of prompts above the budget, `fill` the used share
+of the budget, `score` the packed score sum relative to the old loop.
+Without --tokenizer a BPE tokenizer trained on the corpus stands in for the model's.
+"""
+from typing import List
+import argparse
+import time
+
+import numpy as np
+import spacy
+
+from common import TokenCounter, load_tokenizer, tokenize_regex
+from reasoning.chunking import chunk_documents
+from reasoning.packing import pack_chunks
+from bench.fakes import synthetic_corpus, load_corpus
+
+
+def greedy(chunks: List[str], scores: List[float], max_tokens: int, count_tokens) -> tuple[List[str], int]:
+    used_chunks, used_len = [], 0
+    for chunk, n in zip(chunks, count_tokens(chunks)):
+        if used_len + n > max_tokens:
+            break
+        used_chunks.append(chunk)
+        used_len += n
+    return used_chunks, used_len
+
+
+def train_tokenizer(texts: List[str], vocab_size: int):
+    from tokenizers import Tokenizer, models, pre_tokenizers, trainers
+    tokenizer = Tokenizer(models.BPE(unk_token="[UNK]"))
+    tokenizer.pre_tokenizer = pre_tokenizers.Metaspace()
+    tokenizer.train_from_iterator(texts, trainers.BpeTrainer(vocab_size=vocab_size, special_tokens=["[UNK]"]))
+    return tokenizer
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark prompt packing in model tokens")
+    parser.add_argument("--corpus", help="ndjson data file; synthetic corpus when omitted")
+    parser.add_argument("--corpus-size", type=int, default=5000)
+    parser.add_argument("--tokenizer", help="tokenizer.json or HF repo id of the answering model")
+    parser.add_argument("--vocab-size", type=int, default=8000, help="stand-in BPE vocabulary without --tokenizer")
+    parser.add_argument("--budget", type=int, nargs="*", default=[250, 500, 1000])
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--depth", type=int, default=15)
+    parser.add_argument("--max-docs", type=int, default=10)
+    parser.add_argument("--max-chunk-tokens", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    docs = load_corpus(args.corpus) if args.corpus else synthetic_corpus(args.corpus_size, args.seed)
+    if args.tokenizer:
+        tokenizer = load_tokenizer(args.tokenizer)
+    else:
+        tokenizer = train_tokenizer([d["text"] for d in docs], args.vocab_size)
+    counter = TokenCounter(tokenizer)
+    regex = lambda texts: [len(tokenize_regex(t)) for t in texts]
+
+    matrix = np.asarray([d["vector"] for d in docs], dtype=np.float32)
+    matrix /= np.linalg.norm(matrix, axis=1, keepdims=True)
+    rng = np.random.default_rng(args.seed)
+    queries = matrix[rng.choice(len(matrix), args.queries)] + rng.normal(0, 0.05, (args.queries, matrix.shape[1]))
+
+    nlp = spacy.blank("pl")
+    nlp.add_pipe("sentencizer")
+    retrieved = []
+    for q in queries.astype(np.float32):
+        scores = matrix @ q
+        top = np.argpartition(-scores, args.depth)[:args.depth]
+        top = top[np.argsort(-scores[top])]
+        chunked = chunk_documents([docs[i]["text"] for i in top], nlp, max_tokens=args.max_chunk_tokens)
+        pairs = [(chunk, float(scores[i])) for i, chunks in zip(top, chunked) for chunk in chunks]
+        retrieved.append(pairs[:args.max_docs])
+
+    for label in ("cold", "warm"):
+        start = time.perf_counter()
+        for pairs in retrieved:
+            counter.count([chunk for chunk, _ in pairs])
+        print(f"token counts ({label} cache): {(time.perf_counter() - start) * 1000.0 / len(retrieved):.3f} ms/query")
+
+    packers = {
+        "greedy, regex tokens": (greedy, regex),
+        "greedy, model tokens": (greedy, counter.count),
+        "knapsack, model tokens": (pack_chunks, counter.count),
+    }
+    print(f"\n{'packer':<24}{'budget':>7}{'chunks':>8}{'model tokens':>14}{'p95':>6}{'max':>6}"
+          f"{'over':>7}{'fill':>7}{'score':>7}{'ms':>7}")
+    for budget in args.budget:
+        baseline = None
+        for name, (pack, count_tokens) in packers.items():
+            packed, elapsed = [], []
+            for pairs in retrieved:
+                start = time.perf_counter()
+                chunks, _ = pack([c for c, _ in pairs], [s for _, s in pairs], budget, count_tokens)
+                elapsed.append((time.perf_counter() - start) * 1000.0)
+                score = dict(pairs)
+                packed.append((chunks, sum(counter.count(chunks)), sum(score[c] for c in chunks)))
+            tokens = np.asarray([t for _, t, _ in packed])
+            total_score = sum(s for _, _, s in packed)
+            baseline = baseline or total_score
+            print(f"{name:<24}{budget:>7}{np.mean([len(c) for c, _, _ in packed]):>8.2f}{tokens.mean():>14.1f}"
+                  f"{np.percentile(tokens, 95):>6.0f}{tokens.max():>6}{np.mean(tokens > budget):>7.2f}"
+                  f"{np.mean(np.minimum(tokens, budget)) / budget:>7.2f}{total_score / baseline:>7.2f}"
+                  f"{np.mean(elapsed):>7.3f}")
+
+
+if __name__ == "__main__":
+    main()
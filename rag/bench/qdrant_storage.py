@@ -0,0 +1,117 @@
+"""
+Memory / latency / recall trade-offs of Qdrant storage settings.
+
+Needs a running Qdrant (docker compose up qdrant). From the `rag` directory:
+    python -m bench.qdrant_storage --qdrant-url http://localhost:6333 --corpus-size 50000 \
+        --settings none scalar binary scalar:disk binary:disk --hnsw-ef 32 64 128 --oversampling 1 2 4
+
+Every setting gets its own `bench_<setting>` collection filled with the same
+vectors. Recall@k is measured against exact numpy search over the corpus.
+RAM is an estimate from the collection layout: originals stay in RAM unless
+on disk, quantized vectors are always in RAM, HNSW level-0 links take m*2 ids
+per point. The rest of the footprint (payload, page cache) is the same for
+every setting.
+"""
+from typing import List, Optional
+import argparse
+import time
+
+import numpy as np
+from qdrant_client import QdrantClient
+from qdrant_client.models import PointStruct, CollectionStatus
+
+from common import create_qdrant_collection
+from retrieval.qdrant import search_qdrant
+from bench.fakes import synthetic_corpus, load_corpus
+
+BYTES_PER_DIM = {"none": 0.0, "scalar": 1.0, "binary": 1 / 8}
+
+
+def estimated_ram_mb(n: int, dim: int, quantization: str, on_disk: bool, m: int) -> float:
+    originals = 0 if on_disk else n * dim * 4
+    quantized = n * dim * BYTES_PER_DIM[quantization]
+    graph = n * m * 2 * 4
+    return (originals + quantized + graph) / 2**20
+
+
+def fill_collection(client: QdrantClient, name: str, docs: List[dict], quantization: str, on_disk: bool,
+                    m: int, ef_construct: int):
+    if client.collection_exists(name):
+        client.delete_collection(name)
+    create_qdrant_collection(name, client, quantization=quantization, on_disk=on_disk,
+                             hnsw_m=m, hnsw_ef_construct=ef_construct)
+    batch = 500
+    for i in range(0, len(docs), batch):
+        client.upsert(name, points=[
+            PointStruct(id=int(d["id"]), vector=d["vector"], payload={"text": d["text"]})
+            for d in docs[i:i + batch]
+        ], wait=True)
+    # wait for the optimizer to build HNSW / quantized segments, otherwise we measure full scans
+    while client.get_collection(name).status != CollectionStatus.GREEN:
+        time.sleep(1)
+
+
+def measure(client: QdrantClient, name: str, queries: np.ndarray, exact: List[set], limit: int,
+            hnsw_ef: Optional[int], oversampling: Optional[float], rescore: bool):
+    latency, recall = [], []
+    for q, expected in zip(queries, exact):
+        start = time.perf_counter()
+        ids, _, _ = search_qdrant(q.tolist(), client, name, limit=limit, hnsw_ef=hnsw_ef,
+                               oversampling=oversampling, rescore=rescore)
+        latency.append((time.perf_counter() - start) * 1000.0)
+        recall.append(len(set(ids) & expected) / len(expected))
+    return np.asarray(latency), float(np.mean(recall))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark Qdrant quantization / on-disk settings")
+    parser.add_argument("--qdrant-url", default="http://localhost:6333")
+    parser.add_argument("--corpus", help="ndjson data file; synthetic corpus when omitted")
+    parser.add_argument("--corpus-size", type=int, default=20000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--limit", type=int, default=35)
+    parser.add_argument("--settings", nargs="*", default=["none", "scalar", "binary"],
+                        help="quantization[:disk], e.g. scalar:disk keeps originals on disk")
+    parser.add_argument("--hnsw-m", type=int, default=16)
+    parser.add_argument("--hnsw-ef-construct", type=int, default=100)
+    parser.add_argument("--hnsw-ef", type=int, nargs="*", default=[64])
+    parser.add_argument("--oversampling", type=float, nargs="*", default=[1.0, 2.0])
+    parser.add_argument("--no-rescore", action="store_true", help="also measure quantized scores without rescoring")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    docs = load_corpus(args.corpus, args.corpus_size) if args.corpus else synthetic_corpus(args.corpus_size, args.seed)
+    ids = np.asarray([int(d["id"]) for d in docs])
+    matrix = np.asarray([d["vector"] for d in docs], dtype=np.float32)
+    matrix /= np.linalg.norm(matrix, axis=1, keepdims=True)
+    dim = matrix.shape[1]
+
+    rng = np.random.default_rng(args.seed)
+    queries = matrix[rng.choice(len(matrix), args.queries)] + rng.normal(0, 0.02, (args.queries, dim))
+    queries = (queries / np.linalg.norm(queries, axis=1, keepdims=True)).astype(np.float32)
+    scores = queries @ matrix.T
+    exact = [set(ids[np.argsort(-row)[:args.limit]].tolist()) for row in scores]
+
+    client = QdrantClient(args.qdrant_url, timeout=300)
+    print(f"{'setting':<16}{'hnsw_ef':>8}{'overs.':>8}{'rescore':>8}{'RAM MiB':>9}"
+          f"{'p50 ms':>9}{'p95 ms':>9}{'recall':>8}")
+    for setting in args.settings:
+        quantization, _, storage = setting.partition(":")
+        on_disk = storage == "disk"
+        name = f"bench_{quantization}_{'disk' if on_disk else 'ram'}"
+        fill_collection(client, name, docs, quantization, on_disk, args.hnsw_m, args.hnsw_ef_construct)
+        ram = estimated_ram_mb(len(docs), dim, quantization, on_disk, args.hnsw_m)
+
+        oversampling = args.oversampling if quantization != "none" else [None]
+        rescore = [True, False] if quantization != "none" and args.no_rescore else [True]
+        for ef in args.hnsw_ef:
+            for factor in oversampling:
+                for rs in rescore:
+                    latency, recall = measure(client, name, queries, exact, args.limit, ef, factor, rs)
+                    print(f"{setting:<16}{ef:>8}{factor or '-':>8}{str(rs):>8}{ram:>9.1f}"
+                          f"{np.percentile(latency, 50):>9.2f}{np.percentile(latency, 95):>9.2f}{recall:>8.3f}")
+        client.delete_collection(name)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+"""
+Query-time near-duplicate chunk suppression: prompt budget saved and stage cost.
+
+Run from the `rag` directory:
+    python -m bench.redundancy --corpus-size 20000 --duplicate-share 0.2 --threshold 0.5 0.7 0.9
+    python -m bench.redundancy --corpus data/culturax_vectors.ndjson --budget 250 1000
+
+Each query takes the exact top `--depth` documents for a noisy copy of a document
+vector, chunks them as `retrieve_chunks` does (sentencizer, 200 words, 30 overlap)
+and packs the chunks in rank order into `--budget` regex tokens, once as they come
+and once after `suppress_near_duplicates`. The synthetic corpus gets
+`--duplicate-share` lightly edited copies (the collection built with DEDUP_THRESHOLD=0,
+or copies the MinHash pass missed). `sources` is the number of distinct source
+documents in the prompt (a copy counts as its source), `distinct` the share of
+packed tokens in word 3-grams not already in an earlier packed chunk.
+
+First a containment check: a one-sentence chunk ranked first and a chunk repeating it
+plus ten new sentences must both stay, the same pair in reverse order loses the short one.
+"""
+from typing import List
+import argparse
+import time
+
+import numpy as np
+import spacy
+
+from common import tokenize_regex
+from reasoning.chunking import chunk_documents
+from reasoning.redundancy import suppress_near_duplicates, shingle_set
+from bench.fakes import synthetic_corpus, add_near_duplicates, load_corpus
+
+
+def pack(chunks: List[str], budget: int) -> List[int]:
+    used, packed = 0, []
+    for i, chunk in enumerate(chunks):
+        tokens = len(tokenize_regex(chunk))
+        if used + tokens > budget:
+            break
+        packed.append(i)
+        used += tokens
+    return packed
+
+
+def distinct_share(chunks: List[str]) -> float:
+    seen, distinct, total = set(), 0, 0
+    for chunk in chunks:
+        shingles = shingle_set(chunk)
+        distinct += len(shingles - seen)
+        total += len(shingles)
+        seen |= shingles
+    return distinct / max(total, 1)
+
+
+def containment_check(threshold: float) -> tuple[int, int]:
+    rng = np.random.default_rng(0)
+    words = ["słowo%d" % i for i in range(500)]
+    sentences = [" ".join(rng.choice(words, 12)) + "." for _ in range(11)]
+    short, long = sentences[0], " ".join(sentences)
+    _, short_first = suppress_near_duplicates([short, long], threshold)
+    _, long_first = suppress_near_duplicates([long, short], threshold)
+    return short_first["suppressed_chunks"], long_first["suppressed_chunks"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark query-time near-duplicate chunk suppression")
+    parser.add_argument("--corpus", help="ndjson data file; synthetic corpus with injected duplicates when omitted")
+    parser.add_argument("--corpus-size", type=int, default=5000)
+    parser.add_argument("--duplicate-share", type=float, default=0.2)
+    parser.add_argument("--threshold", type=float, nargs="*", default=[0.7])
+    parser.add_argument("--budget", type=int, nargs="*", default=[250, 1000])
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--depth", type=int, default=15)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    if args.corpus:
+        docs = load_corpus(args.corpus)
+    else:
+        docs = add_near_duplicates(synthetic_corpus(args.corpus_size, args.seed), args.duplicate_share, args.seed)
+    source = [str(d.get("near_duplicate_of", d["id"])) for d in docs]
+
+    matrix = np.asarray([d["vector"] for d in docs], dtype=np.float32)
+    matrix /= np.linalg.norm(matrix, axis=1, keepdims=True)
+    rng = np.random.default_rng(args.seed)
+    queries = matrix[rng.choice(len(matrix), args.queries)] + rng.normal(0, 0.05, (args.queries, matrix.shape[1]))
+
+    # ten sam sentencizer co profil `sentences` z load_nlp_profiles
+    nlp = spacy.blank("pl")
+    nlp.add_pipe("sentencizer")
+    retrieved = []
+    for q in queries.astype(np.float32):
+        scores = matrix @ q
+        top = np.argpartition(-scores, args.depth)[:args.depth]
+        top = top[np.argsort(-scores[top])]
+        chunked = chunk_documents([docs[i]["text"] for i in top], nlp, max_tokens=200)
+        retrieved.append([(chunk, source[i]) for i, chunks in zip(top, chunked) for chunk in chunks])
+
+    for threshold in args.threshold:
+        short_first, long_first = containment_check(threshold)
+        ok = short_first == 0 and long_first == 1
+        print(f"containment check at {threshold:.2f}: short first suppressed {short_first} (expected 0), "
+              f"long first suppressed {long_first} (expected 1){'' if ok else '  FAIL'}")
+
+    print(f"{'threshold':>9}{'budget':>8}{'chunks in':>11}{'suppressed':>12}{'packed':>8}"
+          f"{'sources':>9}{'distinct':>10}{'p50 ms':>8}{'p95 ms':>8}")
+    for threshold in [0.0] + args.threshold:
+        kept, elapsed = [], []
+        for chunks in retrieved:
+            texts = [chunk for chunk, _ in chunks]
+            start = time.perf_counter()
+            survivors, _ = suppress_near_duplicates(texts, threshold)
+            elapsed.append((time.perf_counter() - start) * 1000.0)
+            survivors = set(survivors)
+            kept.append([(chunk, src) for chunk, src in chunks if chunk in survivors])
+        elapsed = np.asarray(elapsed)
+
+        for budget in args.budget:
+            packed = [[chunks[i] for i in pack([c for c, _ in chunks], budget)] for chunks in kept]
+            print(f"{threshold:>9.2f}{budget:>8}{np.mean([len(c) for c in retrieved]):>11.1f}"
+                  f"{np.mean([len(r) - len(k) for r, k in zip(retrieved, kept)]):>12.1f}"
+                  f"{np.mean([len(p) for p in packed]):>8.2f}"
+                  f"{np.mean([len({src for _, src in p}) for p in packed]):>9.2f}"
+                  f"{np.mean([distinct_share([c for c, _ in p]) for p in packed]):>10.3f}"
+                  f"{np.percentile(elapsed, 50):>8.2f}{np.percentile(elapsed, 95):>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""
+Local BM25 backend vs. Elasticsearch: latency and recall for the same keyword queries.
+
+Run from the `rag` directory:
+    python -m bench.retrieval --corpus-size 20000 --queries 200
+    python -m bench.retrieval --corpus data/culturax_vectors.ndjson --es-url http://localhost:9200
+
+Queries are a few consecutive words cut from a random document, sent as the
+raw keyword query from `make_queries` exactly as at serving time (ES analyzes
+it with morfologik, the local index with the spaCy keywords pipeline).
+`hit@k` is how often the source document is retrieved, `overlap@k` how many
+of the ES top-k the local index also returns. Without --es-url the reference
+is the in-process fake ES (term-overlap scoring, not BM25).
+"""
+from pathlib import Path
+from typing import List
+import argparse
+import tempfile
+import random
+import time
+import os
+
+import numpy as np
+from elasticsearch import Elasticsearch
+
+import config
+from common import load_nlp_profiles, make_queries, create_es_index, populate_index
+from retrieval.elastic import search_es
+from retrieval.local_bm25 import LocalBM25Index, search_local_bm25
+from bench.fakes import FakeElasticsearch, LatencyModel, synthetic_corpus, load_corpus, write_corpus
+
+
+def sample_queries(docs: List[dict], n: int, seed: int) -> List[tuple[int, str]]:
+    rng = random.Random(seed)
+    queries = []
+    while len(queries) < n:
+        doc = rng.choice(docs)
+        words = doc["text"].split()
+        if len(words) < 8:
+            continue
+        start = rng.randrange(len(words) - 5)
+        queries.append((int(doc["id"]), " ".join(words[start:start + rng.randint(3, 5)])))
+    return queries
+
+
+def dir_size_mb(path) -> float:
+    return sum(f.stat().st_size for f in Path(path).iterdir()) / 2**20
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark local BM25 against Elasticsearch")
+    parser.add_argument("--corpus", help="ndjson data file; synthetic corpus when omitted")
+    parser.add_argument("--corpus-size", type=int, default=20000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--limit", type=int, default=35)
+    parser.add_argument("--es-url", help="compare against a running ES (index is created and filled when empty)")
+    parser.add_argument("--n-process", type=int, default=config.SPACY_N_PROCESS)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="rag_retrieval_bench_")
+    if args.corpus:
+        data_path = args.corpus
+        docs = load_corpus(args.corpus)
+    else:
+        data_path = os.path.join(workdir, "corpus.ndjson")
+        docs = synthetic_corpus(args.corpus_size, args.seed)
+        write_corpus(docs, data_path)
+
+    nlp = load_nlp_profiles(config.SPACY_MODEL_NAME, args.n_process, config.SPACY_BATCH_SIZE)
+    index_dir = os.path.join(workdir, "bm25")
+    start = time.perf_counter()
+    LocalBM25Index.open_or_build(index_dir, data_path, nlp.keywords, nlp.n_process, nlp.batch_size)
+    build_s = time.perf_counter() - start
+    start = time.perf_counter()
+    index = LocalBM25Index(index_dir)
+    load_s = time.perf_counter() - start
+    print(f"local bm25: {len(index)} docs, {len(index.vocab)} terms, {len(index.rows)} postings, "
+          f"{dir_size_mb(index_dir):.0f} MiB on disk, build {build_s:.1f}s, load {load_s * 1000:.0f}ms\n")
+
+    fake = None
+    if args.es_url:
+        es_client = Elasticsearch(args.es_url)
+        es_name = "elasticsearch"
+        create_es_index(config.ES_INDEX_NAME, es_client)
+        populate_index(data_path, config.ES_INDEX_NAME, es_client)
+    else:
+        fake = FakeElasticsearch(docs, LatencyModel("0"))
+        fake.start()
+        es_client = Elasticsearch(fake.url)
+        es_name = "elasticsearch (fake)"
+
+    queries = sample_queries(docs, args.queries, args.seed)
+    es_queries = [make_queries(text)[1] for _, text in queries]
+
+    results = {"local bm25": ([], []), es_name: ([], [])}
+    try:
+        for es_query in es_queries:
+            for name, search in (("local bm25", lambda q: search_local_bm25(q, index, nlp.keywords, args.limit)),
+                                 (es_name, lambda q: search_es(q, es_client, config.ES_INDEX_NAME, limit=args.limit))):
+                start = time.perf_counter()
+                ids = search(es_query)[0] if es_query else []
+                results[name][0].append((time.perf_counter() - start) * 1000.0)
+                results[name][1].append(ids[:args.limit])
+    finally:
+        if fake:
+            fake.stop()
+
+    reference = results[es_name][1]
+    print(f"{'backend':<24}{'p50 ms':>9}{'p95 ms':>9}{'mean ms':>9}{'hit@k':>8}{'overlap@k':>11}")
+    for name, (latency, found) in results.items():
+        latency = np.asarray(latency)
+        hits = np.mean([source in ids for (source, _), ids in zip(queries, found)])
+        overlap = np.mean([len(set(ids) & set(ref)) / len(ref) for ids, ref in zip(found, reference) if ref])
+        print(f"{name:<24}{np.percentile(latency, 50):>9.2f}{np.percentile(latency, 95):>9.2f}"
+              f"{latency.mean():>9.2f}{hits:>8.3f}{overlap:>11.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""
+Per-document cost of the full spaCy pipeline vs. task-specific profiles.
+
+Run from the `rag` directory:
+    python -m bench.spacy_profiles --docs 500 --n-process 1 2 4
+"""
+from typing import Callable, List
+import argparse
+import time
+
+import spacy
+
+import config
+from common import extract_keywords_lemmatized, load_nlp_profiles
+from reasoning.chunking import chunk_document, chunk_documents
+from bench.fakes import synthetic_corpus, load_corpus
+
+
+def per_doc_ms(fn: Callable, texts: List[str]) -> float:
+    start = time.perf_counter()
+    fn(texts)
+    return (time.perf_counter() - start) * 1000.0 / len(texts)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark spaCy pipeline profiles")
+    parser.add_argument("--corpus", help="ndjson data file; synthetic corpus when omitted")
+    parser.add_argument("--docs", type=int, default=300)
+    parser.add_argument("--batch-size", type=int, default=config.SPACY_BATCH_SIZE)
+    parser.add_argument("--n-process", type=int, nargs="*", default=[1])
+    args = parser.parse_args()
+
+    docs = load_corpus(args.corpus, args.docs) if args.corpus else synthetic_corpus(args.docs)
+    texts = [d["text"] for d in docs]
+    queries = [" ".join(t.split()[:8]) for t in texts]
+
+    full = spacy.load(config.SPACY_MODEL_NAME)
+    profiles = load_nlp_profiles(config.SPACY_MODEL_NAME, batch_size=args.batch_size)
+    print(f"full pipeline:      {full.pipe_names}")
+    print(f"keywords profile:   {profiles.keywords.pipe_names}")
+    print(f"sentences profile:  {profiles.sentences.pipe_names}\n")
+
+    rows = []
+
+    full_kw = per_doc_ms(lambda qs: [extract_keywords_lemmatized(q, full) for q in qs], queries)
+    prof_kw = per_doc_ms(lambda qs: [extract_keywords_lemmatized(q, profiles.keywords) for q in qs], queries)
+    rows.append(("keywords (per query)", full_kw, prof_kw))
+
+    full_chunk = per_doc_ms(lambda ts: [chunk_document(t, full) for t in ts], texts)
+    prof_chunk = per_doc_ms(lambda ts: [chunk_document(t, profiles.sentences) for t in ts], texts)
+    rows.append(("chunking, per call", full_chunk, prof_chunk))
+
+    for n_process in args.n_process:
+        piped = per_doc_ms(
+            lambda ts: chunk_documents(ts, profiles.sentences, n_process=n_process, batch_size=args.batch_size),
+            texts,
+        )
+        rows.append((f"chunking, pipe n_process={n_process}", full_chunk, piped))
+
+    print(f"{'task':<34}{'full ms/doc':>14}{'profile ms/doc':>16}{'speedup':>10}")
+    for name, base, fast in rows:
+        print(f"{name:<34}{base:>14.3f}{fast:>16.3f}{base / fast:>9.1f}x")
+
+    # Agreement: sentencizer boundaries differ from the parser, report how much
+    kw_overlap = []
+    for q in queries:
+        a = set(extract_keywords_lemmatized(q, full))
+        b = set(extract_keywords_lemmatized(q, profiles.keywords))
+        kw_overlap.append(len(a & b) / len(a | b) if a | b else 1.0)
+    full_chunks = sum(len(chunk_document(t, full)) for t in texts)
+    prof_chunks = sum(len(c) for c in chunk_documents(texts, profiles.sentences))
+    print(f"\nkeyword jaccard vs full: {sum(kw_overlap) / len(kw_overlap):.3f}")
+    print(f"chunks produced: full={full_chunks} profile={prof_chunks}")
+
+
+if __name__ == "__main__":
+    main()
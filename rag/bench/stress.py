@@ -0,0 +1,126 @@
+"""
+Cross-request isolation of the synchronous pipeline on a thread pool.
+
+Run from the `rag` directory:
+    python -m bench.stress --workers 64 --rounds 3
+    python -m bench.stress --refusal-share 0.6 --ollama-latency lognormal:20:0.5
+
+Every job is one query with its own retry strategies and pipeline profile. Each job is
+answered once alone, then all jobs `--rounds` times at once by `--workers` threads calling
+`RAG.full_rag_process` on the one shared instance (as `/ask` does from its worker pool),
+in shuffled order. Fake backends are deterministic, so a concurrent result that differs
+from the solo one is state leaking between requests. Also checked: the callers' strategy
+lists (one list is shared by many jobs, like the old `RagInfo` default), the attributes
+of the `RAG` instance, and the unresolved-queries store (unique ids, expected count,
+file on disk matching memory). `--refusal-share` of answer prompts are refused by the
+fake Ollama, so the retry strategies run. Exits 1 when anything leaked.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from collections import Counter
+import argparse
+import itertools
+import tempfile
+import random
+import json
+import sys
+import os
+
+from bench.fakes import FakeStack, synthetic_corpus
+from bench.loadtest import DEFAULT_QUERIES
+
+STRATEGY_SETS = [
+    [],
+    ["save_to_memory"],
+    ["modify_prompt", "save_to_memory"],
+    ["change_interpretation", "modify_prompt", "save_to_memory"],
+]
+PROFILES = ["full", "fast", "minimal"]
+
+
+def fingerprint(result: dict) -> str:
+    return json.dumps(result, sort_keys=True, ensure_ascii=False, default=str)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrent full_rag_process calls vs solo runs")
+    parser.add_argument("--workers", type=int, default=64)
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--corpus-size", type=int, default=1000)
+    parser.add_argument("--es-latency", default="lognormal:5:0.5")
+    parser.add_argument("--qdrant-latency", default="lognormal:5:0.5")
+    parser.add_argument("--ollama-latency", default="lognormal:10:0.5")
+    parser.add_argument("--refusal-share", type=float, default=0.4)
+    parser.add_argument("--sub-questions", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    stack = FakeStack(synthetic_corpus(args.corpus_size, args.seed), args.es_latency, args.qdrant_latency,
+                      args.ollama_latency, sub_questions=args.sub_questions, seed=args.seed,
+                      ollama_slots=args.workers, refusal_share=args.refusal_share).start()
+    workdir = tempfile.mkdtemp(prefix="rag_stress_")
+    os.environ["ES_URL"] = stack.es.url
+    os.environ["QDRANT_URL"] = stack.qdrant.url
+    os.environ["OLLAMA_HOST"] = stack.ollama.url
+    os.environ["OLLAMA_HOSTS"] = stack.ollama.url
+    os.environ["OLLAMA_MAX_CONCURRENCY"] = str(args.workers)
+    os.environ["BACKEND_CONNECTIONS"] = str(args.workers)
+    os.environ["UNRESOLVED_STORAGE_PATH"] = os.path.join(workdir, "unresolved.json")
+
+    import config
+    import main as app
+    from common import PIPELINE_PROFILES
+
+    rag, memory = app.rag, app.memory
+    shared = list(config.RETRY_STRATEGIES_LIST_DEFAULT)
+    jobs = []
+    for query, strategies, profile in itertools.product(DEFAULT_QUERIES, STRATEGY_SETS + [shared], PROFILES):
+        # the shared list goes to every job using it, the others get their own copy
+        jobs.append((query, strategies if strategies is shared else list(strategies), profile))
+    original = [list(strategies) for _, strategies, _ in jobs]
+    attributes = {name: id(value) for name, value in vars(rag).items()}
+
+    def run(i: int) -> tuple[str, int]:
+        query, strategies, profile = jobs[i]
+        result = rag.full_rag_process(query, strategies, pipeline=PIPELINE_PROFILES[profile])
+        return fingerprint(result), i
+
+    try:
+        solo, solo_saves = {}, 0
+        for i in range(len(jobs)):
+            before = len(memory.queries)
+            solo[i] = run(i)[0]
+            solo_saves += len(memory.queries) - before
+
+        order = [i for i in range(len(jobs)) for _ in range(args.rounds)]
+        random.Random(args.seed).shuffle(order)
+        before = len(memory.queries)
+        with ThreadPoolExecutor(args.workers) as pool:
+            results = list(pool.map(run, order))
+        saves = len(memory.queries) - before
+    finally:
+        stack.stop()
+
+    mismatched = Counter(jobs[i][0] for result, i in results if result != solo[i])
+    changed_lists = sum(1 for (_, strategies, _), before in zip(jobs, original) if strategies != before)
+    changed_attributes = sorted(name for name, value in vars(rag).items() if attributes.get(name) != id(value))
+    with open(os.environ["UNRESOLVED_STORAGE_PATH"]) as f:
+        on_disk = json.load(f)
+    ids = [q["id"] for q in memory.queries]
+
+    print(f"jobs={len(jobs)} concurrent calls={len(order)} workers={args.workers}")
+    print(f"results differing from the solo run: {sum(mismatched.values())}")
+    for query, n in mismatched.most_common():
+        print(f"  {n:>4}  {query}")
+    print(f"callers' strategy lists changed: {changed_lists}")
+    print(f"RAG attributes rebound: {changed_attributes or 'none'}")
+    print(f"unresolved saves: {saves} (expected {solo_saves * args.rounds}), "
+          f"duplicate ids: {len(ids) - len(set(ids))}, file entries: {len(on_disk)} / {len(memory.queries)}")
+
+    leaked = (mismatched or changed_lists or changed_attributes or saves != solo_saves * args.rounds
+              or len(ids) != len(set(ids)) or len(on_disk) != len(memory.queries))
+    print("LEAK" if leaked else "OK: no cross-request leakage")
+    sys.exit(1 if leaked else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,169 @@
+"""
+Per-call transport overhead of the Elasticsearch and Qdrant clients.
+
+Run from the `rag` directory:
+    python -m bench.transport --calls 2000 --concurrency 1 16
+    python -m bench.transport --es-url http://localhost:9200 --qdrant-url http://localhost:6333 --qdrant-grpc
+
+`--concurrency` threads send `--calls` searches in total (`search_es` / `search_qdrant`,
+35 hits with their text) through each client setup. Fakes answer with no added latency,
+so `ms/call` is client + HTTP overhead plus the fake's own search work; every new TCP
+connection waits `--connect-ms` (TCP + TLS handshakes between hosts, loopback has none).
+`conn/call` counts new connections (fakes only), `KiB/call` the response body on the wire. Setups: the stock clients as
+`RAG` built them (the Qdrant client disables keep-alive for localhost), the pooled
+clients from `create_es_client` / `create_qdrant_client` with `--connections` set to the
+concurrency, and ES with gzip. With real servers `--qdrant-grpc` adds the gRPC channel.
+
+The codec table compares one Qdrant query (384-float vector) and its response
+(35 points with text payload) as REST JSON and as the gRPC protobuf messages.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional
+import argparse
+import json
+import time
+
+import numpy as np
+from elasticsearch import Elasticsearch
+from qdrant_client import QdrantClient, grpc as qdrant_grpc
+
+from common import create_es_client, create_qdrant_client
+from retrieval.elastic import search_es
+from retrieval.qdrant import search_qdrant
+from bench.fakes import FakeElasticsearch, FakeQdrant, FakeServer, LatencyModel, synthetic_corpus
+
+LIMIT = 35
+
+
+def run(search: Callable[[int], object], calls: int, concurrency: int, server: Optional[FakeServer]) -> Dict:
+    search(0)  # connection / channel set up outside the measurement
+    if server:
+        server.stats.clear()
+    latencies = []
+
+    def one(i):
+        start = time.perf_counter()
+        search(i)
+        latencies.append((time.perf_counter() - start) * 1000.0)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        list(pool.map(one, range(calls)))
+    elapsed = time.perf_counter() - start
+    stats = dict(server.stats) if server else {}
+    searched = sum(s["calls"] for route, s in stats.items() if route != "connect")
+    return {
+        "throughput": calls / elapsed,
+        "latency": np.asarray(latencies),
+        "connections": stats.get("connect", {"calls": 0})["calls"] / calls if server else None,
+        "bytes": sum(s["bytes"] for s in stats.values()) / searched if searched else None,
+    }
+
+
+def codec_table(docs: List[Dict], vector: List[float], repeat: int = 2000):
+    hits = docs[:LIMIT]
+    rest_request = {"query": vector, "with_payload": ["text"], "limit": LIMIT}
+    rest_response = {"result": {"points": [
+        {"id": i, "version": 0, "score": 0.5, "payload": {"text": d["text"]}} for i, d in enumerate(hits)
+    ]}, "status": "ok", "time": 0.001}
+    grpc_request = qdrant_grpc.QueryPoints(
+        collection_name="culturax",
+        query=qdrant_grpc.Query(nearest=qdrant_grpc.VectorInput(dense=qdrant_grpc.DenseVector(data=vector))),
+        with_payload=qdrant_grpc.WithPayloadSelector(include=qdrant_grpc.PayloadIncludeSelector(fields=["text"])),
+        limit=LIMIT,
+    )
+    grpc_response = qdrant_grpc.QueryResponse(result=[
+        qdrant_grpc.ScoredPoint(id=qdrant_grpc.PointId(num=i), score=0.5,
+                                payload={"text": qdrant_grpc.Value(string_value=d["text"])})
+        for i, d in enumerate(hits)
+    ], time=0.001)
+
+    codecs = {
+        "REST JSON": (lambda: json.dumps(rest_request).encode(), lambda: json.dumps(rest_response).encode(),
+                      json.loads, json.loads),
+        "gRPC protobuf": (grpc_request.SerializeToString, grpc_response.SerializeToString,
+                          qdrant_grpc.QueryPoints.FromString, qdrant_grpc.QueryResponse.FromString),
+    }
+    print(f"\n{'codec':<16}{'request B':>11}{'response B':>12}{'encode+decode us':>18}")
+    for name, (encode_req, encode_resp, decode_req, decode_resp) in codecs.items():
+        request, response = encode_req(), encode_resp()
+        start = time.perf_counter()
+        for _ in range(repeat):
+            decode_req(encode_req())
+            decode_resp(encode_resp())
+        elapsed = (time.perf_counter() - start) * 1e6 / repeat
+        print(f"{name:<16}{len(request):>11}{len(response):>12}{elapsed:>18.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark per-call transport overhead of the ES and Qdrant clients")
+    parser.add_argument("--es-url", help="real Elasticsearch; fake when omitted")
+    parser.add_argument("--qdrant-url", help="real Qdrant; fake when omitted")
+    parser.add_argument("--qdrant-grpc", action="store_true", help="also run Qdrant over gRPC (real server only)")
+    parser.add_argument("--index", default="culturax")
+    parser.add_argument("--corpus-size", type=int, default=500)
+    parser.add_argument("--connect-ms", type=float, default=1.0, help="cost of a new connection to a fake")
+    parser.add_argument("--calls", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, nargs="*", default=[1, 16])
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    docs = synthetic_corpus(args.corpus_size, args.seed)
+    rng = np.random.default_rng(args.seed)
+    vectors = rng.normal(size=(64, len(docs[0]["vector"]))).astype(np.float32)
+    vectors = (vectors / np.linalg.norm(vectors, axis=1, keepdims=True)).tolist()
+    queries = [" ".join(d["text"].split()[:6]) for d in docs[:64]]
+
+    es_fake = qdrant_fake = None
+    if not args.es_url:
+        es_fake = FakeElasticsearch(docs, LatencyModel("0"), args.index).start()
+    if not args.qdrant_url:
+        qdrant_fake = FakeQdrant(docs, LatencyModel("0"), args.index).start()
+    for fake in (es_fake, qdrant_fake):
+        if fake:
+            fake.connect_ms = args.connect_ms
+    es_url = args.es_url or es_fake.url
+    qdrant_url = args.qdrant_url or qdrant_fake.url
+
+    def es_search(client: Elasticsearch):
+        return lambda i: search_es(queries[i % len(queries)], client, args.index, limit=LIMIT)
+
+    def qdrant_search(client: QdrantClient):
+        return lambda i: search_qdrant(vectors[i % len(vectors)], client, args.index, limit=LIMIT)
+
+    print(f"{'setup':<34}{'threads':>8}{'calls/s':>9}{'ms/call':>9}{'p95 ms':>8}{'conn/call':>10}{'KiB/call':>9}")
+    try:
+        for concurrency in args.concurrency:
+            pooled = dict(connections=concurrency)
+            setups = [
+                ("es stock client", lambda: Elasticsearch(es_url), es_search, es_fake, False),
+                ("es pooled", lambda: create_es_client(es_url, **pooled), es_search, es_fake, False),
+                ("es pooled + gzip", lambda: create_es_client(es_url, http_compress=True, **pooled),
+                 es_search, es_fake, True),
+                ("qdrant stock client (REST)", lambda: QdrantClient(qdrant_url), qdrant_search, qdrant_fake, False),
+                ("qdrant pooled (REST)", lambda: create_qdrant_client(qdrant_url, **pooled),
+                 qdrant_search, qdrant_fake, False),
+            ]
+            if args.qdrant_grpc and not qdrant_fake:
+                setups.append(("qdrant gRPC", lambda: create_qdrant_client(qdrant_url, prefer_grpc=True),
+                               qdrant_search, None, False))
+            for name, make, search, fake, compress in setups:
+                if fake:
+                    fake.compress = compress
+                client = make()
+                result = run(search(client), args.calls, concurrency, fake)
+                client.close()
+                connections = "-" if result["connections"] is None else f"{result['connections']:.3f}"
+                size = "-" if result["bytes"] is None else f"{result['bytes'] / 1024:.1f}"
+                print(f"{name:<34}{concurrency:>8}{result['throughput']:>9.0f}{result['latency'].mean():>9.3f}"
+                      f"{np.percentile(result['latency'], 95):>8.2f}{connections:>10}{size:>9}")
+    finally:
+        for fake in (es_fake, qdrant_fake):
+            if fake:
+                fake.stop()
+
+    codec_table(docs, vectors[0])
+
+
+if __name__ == "__main__":
+    main()
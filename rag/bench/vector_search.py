@@ -0,0 +1,114 @@
+"""
+Latency and recall of the local vector backend vs. Qdrant.
+
+Run from the `rag` directory:
+    python -m bench.vector_search --corpus-size 50000 --queries 200 --batch 4 --hnsw
+    python -m bench.vector_search --corpus data/culturax_vectors.ndjson --qdrant-url http://localhost:6333
+
+Without --qdrant-url the Qdrant column is the in-process fake (exact search
+behind HTTP), which isolates the transport cost of the remote backend.
+"""
+from typing import Callable, List
+import argparse
+import tempfile
+import time
+import os
+
+import numpy as np
+from qdrant_client import QdrantClient
+
+import config
+from retrieval.local_vector import LocalVectorIndex, search_local_vectors, search_local_vectors_batch
+from retrieval.qdrant import search_qdrant
+from bench.fakes import FakeQdrant, LatencyModel, synthetic_corpus, load_corpus, write_corpus
+
+
+def timed_ms(fn: Callable, items: List) -> np.ndarray:
+    samples = []
+    for item in items:
+        start = time.perf_counter()
+        fn(item)
+        samples.append((time.perf_counter() - start) * 1000.0)
+    return np.asarray(samples)
+
+
+def recall(found: List[List[int]], expected: List[List[int]]) -> float:
+    return float(np.mean([len(set(f) & set(e)) / max(len(e), 1) for f, e in zip(found, expected)]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark local vector search")
+    parser.add_argument("--corpus", help="ndjson data file; synthetic corpus when omitted")
+    parser.add_argument("--corpus-size", type=int, default=20000)
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--limit", type=int, default=35)
+    parser.add_argument("--batch", type=int, default=4, help="queries per batched search (question + sub-questions)")
+    parser.add_argument("--block-size", type=int, default=config.LOCAL_VECTOR_BLOCK_SIZE)
+    parser.add_argument("--hnsw", action="store_true", help="also build and measure an HNSW index (needs hnswlib)")
+    parser.add_argument("--hnsw-ef", type=int, nargs="*", default=[config.LOCAL_VECTOR_HNSW_EF])
+    parser.add_argument("--qdrant-url", help="compare against a running Qdrant with the corpus loaded")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="rag_vector_bench_")
+    if args.corpus:
+        data_path = args.corpus
+        docs = None
+    else:
+        data_path = os.path.join(workdir, "corpus.ndjson")
+        docs = synthetic_corpus(args.corpus_size, args.seed)
+        write_corpus(docs, data_path)
+
+    start = time.perf_counter()
+    index = LocalVectorIndex.open_or_build(os.path.join(workdir, "local_index"), data_path, block_size=args.block_size)
+    print(f"build: {len(index)} docs in {time.perf_counter() - start:.1f}s "
+          f"({index.matrix.nbytes / 2**20:.0f} MiB memory-mapped)\n")
+
+    # Queries: perturbed corpus vectors, so each has a meaningful neighbourhood
+    rng = np.random.default_rng(args.seed)
+    picked = rng.choice(len(index), size=args.queries, replace=len(index) < args.queries)
+    queries = np.asarray(index.matrix[np.sort(picked)]) + rng.normal(0, 0.02, (args.queries, index.matrix.shape[1]))
+    queries = queries.astype(np.float32)
+    exact = [search_local_vectors(q, index, args.limit)[0] for q in queries]
+
+    rows: List[tuple] = []
+    single = timed_ms(lambda q: search_local_vectors(q, index, args.limit), queries)
+    rows.append(("local exact", single, 1.0))
+
+    batches = [queries[i:i + args.batch] for i in range(0, len(queries), args.batch)]
+    batched = timed_ms(lambda b: search_local_vectors_batch(b, index, args.limit), batches) / args.batch
+    found = [ids for b in batches for ids, _, _ in search_local_vectors_batch(b, index, args.limit)]
+    rows.append((f"local exact, batch={args.batch} (per query)", batched, recall(found, exact)))
+
+    if args.hnsw:
+        for ef in args.hnsw_ef:
+            hnsw = LocalVectorIndex.open_or_build(index.index_dir, data_path, use_hnsw=True, hnsw_ef=max(ef, args.limit))
+            lat = timed_ms(lambda q: search_local_vectors(q, hnsw, args.limit), queries)
+            found = [search_local_vectors(q, hnsw, args.limit)[0] for q in queries]
+            rows.append((f"local hnsw ef={max(ef, args.limit)}", lat, recall(found, exact)))
+
+    fake = None
+    if args.qdrant_url:
+        client = QdrantClient(args.qdrant_url)
+        name = "qdrant"
+    else:
+        fake = FakeQdrant(docs or load_corpus(args.corpus), LatencyModel("0"))
+        fake.start()
+        client = QdrantClient(fake.url)
+        name = "qdrant (fake, http only)"
+    try:
+        lat = timed_ms(lambda q: search_qdrant(q.tolist(), client, config.QDRANT_INDEX_NAME), queries)
+        found = [search_qdrant(q.tolist(), client, config.QDRANT_INDEX_NAME)[0] for q in queries]
+        rows.append((name, lat, recall(found, exact)))
+    finally:
+        if fake:
+            fake.stop()
+
+    print(f"{'backend':<42}{'p50 ms':>9}{'p95 ms':>9}{'mean ms':>9}{'recall':>9}")
+    for label, samples, rec in rows:
+        print(f"{label:<42}{np.percentile(samples, 50):>9.2f}{np.percentile(samples, 95):>9.2f}"
+              f"{samples.mean():>9.2f}{rec:>9.3f}")
+
+
+if __name__ == "__main__":
+    main()
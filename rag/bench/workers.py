@@ -0,0 +1,154 @@
+"""
+Memory and throughput of several server workers, models preloaded in the master or not.
+
+Run from the `rag` directory:
+    python -m bench.workers --workers 1 2 4
+    python -m bench.workers --workers 4 --requests 400 --concurrency 32 --ollama-latency lognormal:300:0.3
+
+Starts `gunicorn -c gunicorn.conf.py main:app` against in-process fakes once per worker
+count, with WEB_PRELOAD=true (models loaded in the master, shared copy-on-write) and
+false (every worker loads its own). After `--requests` answers, reports startup time,
+memory per process from /proc/<pid>/smaps_rollup (PSS splits shared pages between the
+processes sharing them, so the PSS sum is what the box really spends; USS is what each
+process alone holds) and throughput. `requests counted` sums rag_requests_total over
+all workers from one /metrics call, it equals the answers not coalesced.
+"""
+from concurrent.futures import ThreadPoolExecutor
+import subprocess
+import threading
+import argparse
+import tempfile
+import random
+import time
+import sys
+import os
+import re
+
+import httpx
+
+from bench.fakes import FakeStack, synthetic_corpus
+from bench.loadtest import DEFAULT_QUERIES, free_port
+
+READY_LINE = "Application startup complete"
+
+
+def smaps(pid: int) -> dict:
+    values = {}
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        for line in f:
+            name, _, rest = line.partition(":")
+            if rest.strip().endswith("kB"):
+                values[name] = int(rest.split()[0]) / 1024.0
+    return {
+        "rss": values.get("Rss", 0.0),
+        "pss": values.get("Pss", 0.0),
+        "uss": values.get("Private_Clean", 0.0) + values.get("Private_Dirty", 0.0),
+    }
+
+
+def children(pid: int) -> list:
+    with open(f"/proc/{pid}/task/{pid}/children") as f:
+        return [int(child) for child in f.read().split()]
+
+
+def start_server(workers: int, preload: bool, port: int, env: dict, timeout: float):
+    env = {**env, "WEB_WORKERS": str(workers), "WEB_PRELOAD": str(preload).lower(), "PORT": str(port)}
+    process = subprocess.Popen([sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "main:app"],
+                               env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    ready = threading.Semaphore(0)
+
+    output = []
+
+    def watch():
+        for line in process.stderr:
+            output.append(line)
+            if READY_LINE in line:
+                ready.release()
+        ready.release()  # exited, wakes the waiting loop
+
+    threading.Thread(target=watch, daemon=True).start()
+    started = time.perf_counter()
+    for _ in range(workers):
+        if not ready.acquire(timeout=max(timeout - (time.perf_counter() - started), 0.1)) or process.poll() is not None:
+            process.kill()
+            sys.stderr.writelines(output[-20:])
+            raise RuntimeError(f"{workers} workers (preload={preload}) not ready after {timeout:.0f}s")
+    return process, time.perf_counter() - started
+
+
+def drive(base_url: str, requests: int, concurrency: int, seed: int) -> dict:
+    rng = random.Random(seed)
+    queries = [rng.choice(DEFAULT_QUERIES) for _ in range(requests)]
+    with httpx.Client(base_url=base_url, timeout=120.0, limits=httpx.Limits(max_connections=concurrency)) as client:
+        def one(query: str) -> dict:
+            resp = client.post("/ask", params={"query": query}, json={"retry_strats": ["save_to_memory"]})
+            resp.raise_for_status()
+            return resp.json()
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(concurrency) as pool:
+            answers = list(pool.map(one, queries))
+        elapsed = time.perf_counter() - started
+        metrics = client.get("/metrics").text
+    counted = sum(float(v) for v in re.findall(r"^rag_requests_total\{[^}]*\} (\S+)$", metrics, re.MULTILINE))
+    return {
+        "throughput": len(answers) / elapsed,
+        "not_coalesced": sum(1 for answer in answers if not answer.get("coalesced")),
+        "counted": counted,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Server workers with and without preloaded models")
+    parser.add_argument("--workers", type=int, nargs="*", default=[1, 2, 4])
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--corpus-size", type=int, default=2000)
+    parser.add_argument("--es-latency", default="lognormal:15:0.4")
+    parser.add_argument("--qdrant-latency", default="lognormal:10:0.4")
+    parser.add_argument("--ollama-latency", default="lognormal:100:0.3")
+    parser.add_argument("--startup-timeout", type=float, default=300.0)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    stack = FakeStack(synthetic_corpus(args.corpus_size, args.seed), args.es_latency, args.qdrant_latency,
+                      args.ollama_latency, seed=args.seed, ollama_slots=args.concurrency).start()
+    workdir = tempfile.mkdtemp(prefix="rag_workers_")
+    env = {
+        **os.environ,
+        "ES_URL": stack.es.url,
+        "QDRANT_URL": stack.qdrant.url,
+        "OLLAMA_HOST": stack.ollama.url,
+        "OLLAMA_HOSTS": stack.ollama.url,
+        "OLLAMA_MAX_CONCURRENCY": str(args.concurrency),
+        "UNRESOLVED_STORAGE_PATH": os.path.join(workdir, "unresolved.json"),
+        "LOG_LEVEL": "WARNING",
+    }
+
+    print(f"{'workers':>8}{'preload':>9}{'startup s':>11}{'master MiB':>12}{'worker PSS':>12}{'worker USS':>12}"
+          f"{'total PSS':>11}{'req/s':>8}{'counted':>9}")
+    try:
+        for workers in args.workers:
+            for preload in (False, True):
+                port = free_port()
+                process, startup = start_server(workers, preload, port, env, args.startup_timeout)
+                try:
+                    report = drive(f"http://127.0.0.1:{port}", args.requests, args.concurrency, args.seed)
+                    master = smaps(process.pid)
+                    pids = children(process.pid)
+                    per_worker = [smaps(pid) for pid in pids]
+                finally:
+                    process.terminate()
+                    process.wait(timeout=30)
+                worker_pss = sum(m["pss"] for m in per_worker) / len(per_worker)
+                worker_uss = sum(m["uss"] for m in per_worker) / len(per_worker)
+                total_pss = master["pss"] + sum(m["pss"] for m in per_worker)
+                print(f"{workers:>8}{str(preload):>9}{startup:>11.1f}{master['pss']:>12.0f}{worker_pss:>12.0f}"
+                      f"{worker_uss:>12.0f}{total_pss:>11.0f}{report['throughput']:>8.1f}"
+                      f"{report['counted']:>5.0f}/{report['not_coalesced']:<3}")
+    finally:
+        stack.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,10 @@
 from .util import (
     extract_keywords_lemmatized,
     make_queries,
-    analyze_query,
     choose_weights,
+    choose_depth,
+    scale_depth,
+    DEFAULT_DEPTH,
     embed,
     tokenize_regex,
     count_citations,
@@ -12,11 +14,89 @@ from .util import (
     YEAR_RE,
 )
 
+from .filters import (
+    QueryFilter,
+    extract_query_filter,
+)
+
+from .query_profile import (
+    QueryProfile,
+    build_query_profile,
+    analyze_query,
+)
+
+from .nlp import (
+    NlpProfiles,
+    load_nlp_profiles,
+)
+
+from .sparse import (
+    SPARSE_VECTOR_NAME,
+    sparse_document_vector,
+    sparse_query_vector,
+)
+
+from .tokens import (
+    TokenCounter,
+    load_tokenizer,
+)
+
+from .ollama_pool import OllamaPool
+
+from .deadline import (
+    DeadlineExceeded,
+    deadline_scope,
+    remaining,
+    has_time,
+    check_deadline,
+)
+
+from .pipeline_profiles import (
+    PipelineProfile,
+    PIPELINE_PROFILES,
+    ProfileSelector,
+)
+
+from .threads import (
+    limit_threads,
+)
+
+from .encoder import (
+    load_encoder,
+    export_onnx_model,
+    ENCODER_BACKENDS,
+)
+
+from .request_context import (
+    RequestContext,
+    new_result,
+)
+
+from .single_flight import (
+    SingleFlight,
+    AsyncSingleFlight,
+    normalize_query,
+)
+
+from .admission import (
+    AdmissionController,
+    Rejected,
+    PRIORITIES,
+)
+
+from .clients import (
+    create_es_client,
+    create_qdrant_client,
+)
+
 from .data import (
     create_es_index,
     populate_index,
     create_qdrant_collection,
-    populate_collection
+    populate_collection,
+    iter_documents,
+    load_duplicate_map,
+    format_dedup_report,
 )
 
 __all__ = [
@@ -24,6 +104,9 @@ __all__ = [
     "make_queries",
     "analyze_query",
     "choose_weights",
+    "choose_depth",
+    "scale_depth",
+    "DEFAULT_DEPTH",
     "embed",
     "tokenize_regex",
     "count_citations",
@@ -31,8 +114,45 @@ __all__ = [
     "ID_RE",
     "ACRONYM_RE",
     "YEAR_RE",
+    "QueryFilter",
+    "extract_query_filter",
+    "QueryProfile",
+    "build_query_profile",
+    "NlpProfiles",
+    "load_nlp_profiles",
+    "SPARSE_VECTOR_NAME",
+    "sparse_document_vector",
+    "sparse_query_vector",
+    "TokenCounter",
+    "load_tokenizer",
+    "OllamaPool",
+    "DeadlineExceeded",
+    "deadline_scope",
+    "remaining",
+    "has_time",
+    "check_deadline",
+    "PipelineProfile",
+    "PIPELINE_PROFILES",
+    "ProfileSelector",
+    "limit_threads",
+    "load_encoder",
+    "export_onnx_model",
+    "ENCODER_BACKENDS",
+    "RequestContext",
+    "new_result",
+    "SingleFlight",
+    "AsyncSingleFlight",
+    "normalize_query",
+    "AdmissionController",
+    "Rejected",
+    "PRIORITIES",
+    "create_es_client",
+    "create_qdrant_client",
     "create_es_index",
     "populate_index",
     "create_qdrant_collection",
     "populate_collection",
+    "iter_documents",
+    "load_duplicate_map",
+    "format_dedup_report",
 ]
\ No newline at end of file
@@ -0,0 +1,151 @@
+from contextlib import asynccontextmanager
+from typing import List, Optional
+import asyncio
+import heapq
+import itertools
+import math
+import time
+
+from observability import record_admission, INFLIGHT_REQUESTS, QUEUED_REQUESTS
+
+PRIORITIES = {"high": 0, "normal": 1, "low": 2}
+SERVICE_ESTIMATE_ALPHA = 0.2
+
+
+class Rejected(Exception):
+    '''
+    Request not admitted. reason: "queue_full" / "evicted" (a higher priority request took
+    its place in the queue) or "deadline" (could not start before its deadline)
+    '''
+
+    def __init__(self, reason: str, retry_after: float):
+        super().__init__(f"Request rejected: {reason}")
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    '''
+    Bounded concurrency in front of the pipeline, for the event loop of one process.
+    At most `max_concurrency` requests run at once, up to `max_queue` more wait for a slot,
+    highest priority first, then in arrival order. A full queue rejects the newcomer, or
+    evicts the newest lowest-priority waiter when the newcomer outranks it. Requests whose
+    deadline passes in the queue, or that would wait longer than their deadline at the
+    current service rate, are rejected without running. max_concurrency 0 admits everything.
+    '''
+
+    def __init__(self, max_concurrency: int, max_queue: int):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.running = 0
+        self.queued = 0
+        self._queue: List[list] = []
+        self._seq = itertools.count()
+        self._service_seconds: Optional[float] = None
+
+    @asynccontextmanager
+    async def slot(self, priority: str = "normal", deadline: Optional[float] = None):
+        '''
+        Holds a slot for the block. deadline: time.monotonic() value or None
+        '''
+        await self._acquire(priority, deadline)
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self._observe(time.monotonic() - start)
+            self._release()
+
+    def expected_latency(self) -> float:
+        '''
+        Queue wait plus service time a request arriving now can expect
+        '''
+        busy = self.queued or (self.max_concurrency and self.running >= self.max_concurrency)
+        return (self.expected_wait(self.queued) if busy else 0.0) + (self._service_seconds or 0.0)
+
+    def expected_wait(self, ahead: int) -> float:
+        '''
+        Seconds until a request with `ahead` requests queued before it starts
+        '''
+        if not self._service_seconds or not self.max_concurrency:
+            return 0.0
+        return self._service_seconds * (ahead + 1) / self.max_concurrency
+
+    def retry_after(self) -> int:
+        return max(1, math.ceil(self.expected_wait(self.queued)))
+
+    async def _acquire(self, priority: str, deadline: Optional[float]):
+        rank = PRIORITIES[priority]
+        now = time.monotonic()
+        if deadline is not None and deadline <= now:
+            self._reject("deadline", priority)
+        if not self.max_concurrency or (self.running < self.max_concurrency and not self.queued):
+            self.running += 1
+            self._update_gauges()
+            record_admission("admitted", priority)
+            return
+
+        ahead = sum(1 for entry in self._queue if not entry[2].done() and entry[0] <= rank)
+        if deadline is not None and now + self.expected_wait(ahead) > deadline:
+            self._reject("deadline", priority)
+        if self.queued >= self.max_queue:
+            self._make_room(rank, priority)
+
+        future = asyncio.get_running_loop().create_future()
+        entry = [rank, next(self._seq), future, priority]
+        heapq.heappush(self._queue, entry)
+        self.queued += 1
+        self._update_gauges()
+        try:
+            await asyncio.wait_for(future, None if deadline is None else deadline - now)
+        except Rejected:
+            raise
+        except asyncio.TimeoutError:
+            self._leave_queue()
+            self._reject("deadline", priority)
+        except asyncio.CancelledError:
+            # klient rozłączył się w kolejce; slot mógł już zostać przekazany
+            if future.done() and not future.cancelled() and future.exception() is None:
+                self._release()
+            elif not future.done() or future.cancelled():
+                self._leave_queue()
+            raise
+        record_admission("admitted", priority)
+
+    def _make_room(self, rank: int, priority: str):
+        waiting = [entry for entry in self._queue if not entry[2].done()]
+        worst = max(waiting, key=lambda entry: (entry[0], entry[1]), default=None)
+        if worst is None or worst[0] <= rank:
+            self._reject("queue_full", priority)
+        self.queued -= 1
+        record_admission("evicted", worst[3])
+        worst[2].set_exception(Rejected("evicted", self.retry_after()))
+
+    def _release(self):
+        while self._queue:
+            entry = heapq.heappop(self._queue)
+            if entry[2].done():
+                continue
+            # slot przechodzi na oczekującego, liczba działających bez zmian
+            self.queued -= 1
+            entry[2].set_result(None)
+            self._update_gauges()
+            return
+        self.running -= 1
+        self._update_gauges()
+
+    def _leave_queue(self):
+        self.queued -= 1
+        self._update_gauges()
+
+    def _reject(self, reason: str, priority: str):
+        record_admission(reason, priority)
+        raise Rejected(reason, self.retry_after())
+
+    def _observe(self, seconds: float):
+        previous = self._service_seconds
+        self._service_seconds = seconds if previous is None else previous + SERVICE_ESTIMATE_ALPHA * (seconds - previous)
+
+    def _update_gauges(self):
+        INFLIGHT_REQUESTS.set(self.running)
+        QUEUED_REQUESTS.set(self.queued)
@@ -0,0 +1,85 @@
+import json
+
+import httpx
+from elasticsearch import Elasticsearch
+from qdrant_client import QdrantClient
+
+# overloaded / restarting node, any other status is an answer
+RETRY_ON_STATUS = (429, 502, 503, 504)
+KEEPALIVE_SECONDS = 60.0
+
+
+def create_es_client(url: str,
+                     connections: int = 10,
+                     timeout: float = 10.0,
+                     max_retries: int = 2,
+                     http_compress: bool = False) -> Elasticsearch:
+    '''
+    Elasticsearch client keeping up to `connections` keep-alive connections per node
+    (size it to the requests served at once, extra callers open short-lived ones).
+    Each call times out after `timeout` s and is retried up to `max_retries` times on
+    connection errors, timeouts and 429/502/503/504.
+    http_compress gzips request bodies and asks for gzipped responses, worth it only
+    over a slow network
+    '''
+    return Elasticsearch(
+        url,
+        connections_per_node=connections,
+        http_compress=http_compress,
+        request_timeout=timeout,
+        max_retries=max_retries,
+        retry_on_timeout=True,
+        retry_on_status=RETRY_ON_STATUS,
+    )
+
+
+def _grpc_options(max_retries: int) -> dict:
+    # ponowienia po stronie kanału gRPC, tylko dla UNAVAILABLE (serwer nie przyjął wywołania)
+    service_config = {"methodConfig": [{
+        "name": [{}],
+        "retryPolicy": {
+            "maxAttempts": max_retries + 1,
+            "initialBackoff": "0.1s",
+            "maxBackoff": "1s",
+            "backoffMultiplier": 2,
+            "retryableStatusCodes": ["UNAVAILABLE"],
+        },
+    }]}
+    return {
+        "grpc.enable_retries": int(max_retries > 0),
+        "grpc.service_config": json.dumps(service_config),
+        "grpc.keepalive_time_ms": int(KEEPALIVE_SECONDS * 1000),
+        "grpc.keepalive_permit_without_calls": 1,
+    }
+
+
+def create_qdrant_client(url: str,
+                         connections: int = 10,
+                         timeout: float = 10.0,
+                         max_retries: int = 2,
+                         prefer_grpc: bool = False,
+                         grpc_port: int = 6334,
+                         compress: bool = False) -> QdrantClient:
+    '''
+    Qdrant client over a pool of `connections` keep-alive HTTP connections, or over one
+    multiplexed gRPC channel (`prefer_grpc`, port `grpc_port`) where vectors and payloads
+    travel as protobuf instead of JSON text.
+    The stock client turns keep-alive off for localhost, so every call would open a new
+    connection. `timeout` (whole seconds, rounded up) applies to each call; over gRPC calls
+    the server did not take (UNAVAILABLE) are retried up to `max_retries` times, the REST
+    client has no retries. compress gzips gRPC messages, REST bodies are always plain JSON
+    '''
+    if prefer_grpc:
+        import grpc
+        return QdrantClient(
+            url=url,
+            prefer_grpc=True,
+            grpc_port=grpc_port,
+            timeout=timeout,
+            grpc_options=_grpc_options(max_retries),
+            grpc_compression=grpc.Compression.Gzip if compress else None,
+        )
+
+    limits = httpx.Limits(max_connections=connections, max_keepalive_connections=connections,
+                          keepalive_expiry=KEEPALIVE_SECONDS)
+    return QdrantClient(url=url, timeout=timeout, limits=limits)
@@ -2,35 +2,74 @@ from elasticsearch import Elasticsearch
 from elasticsearch.helpers import bulk
 from qdrant_client import QdrantClient
 from qdrant_client.http.models import PointStruct
-from qdrant_client.models import Distance, VectorParams
+from qdrant_client.models import (
+    Distance,
+    VectorParams,
+    VectorParamsDiff,
+    HnswConfigDiff,
+    ScalarQuantization,
+    ScalarQuantizationConfig,
+    ScalarType,
+    BinaryQuantization,
+    BinaryQuantizationConfig,
+    Disabled,
+    PayloadSchemaType,
+    SparseVectorParams,
+    Modifier,
+)
+from typing import Dict, Optional
 import json
+import os
+
+from observability import get_logger
+
+from .sparse import SPARSE_VECTOR_NAME, sparse_document_vector
+from .dedup import build_duplicate_map, NUM_PERM, SHINGLE_SIZE
+
+logger = get_logger(__name__)
+
+ES_TEXT_ANALYZER = "pl_morfologik"
 
 def create_es_index(index_name: str, es_client: Elasticsearch):
-    if not es_client.indices.exists(index=index_name):
-        index_body = {
-            "settings": {
-                "analysis": {
-                    "analyzer": {
-                        "pl_lemma": {
-                            "tokenizer": "standard",
-                            "filter": ["lowercase"]
-                        }
+    if es_client.indices.exists(index=index_name):
+        mapping = es_client.indices.get_mapping(index=index_name)[index_name]["mappings"]
+        analyzer = mapping.get("properties", {}).get("text", {}).get("analyzer")
+        if analyzer == ES_TEXT_ANALYZER:
+            return
+        # index content comes from the data file, so an outdated analyzer is fixed by rebuilding it
+        logger.warning("Indeks ma inny analizator, odtwarzanie", index=index_name, analyzer=analyzer,
+                       expected=ES_TEXT_ANALYZER)
+        es_client.indices.delete(index=index_name)
+
+    index_body = {
+        "settings": {
+            "analysis": {
+                "analyzer": {
+                    # same chain for documents and queries: morfologik emits every possible lemma
+                    # of a form at one position, unique drops repeats after lowercasing
+                    ES_TEXT_ANALYZER: {
+                        "tokenizer": "standard",
+                        "filter": ["lowercase", "polish_stop", "morfologik_stem", "lowercase", "unique_stem"]
                     }
+                },
+                "filter": {
+                    "unique_stem": {"type": "unique", "only_on_same_position": True}
                 }
-            },
-            "mappings": {
-                "properties": {
-                    "id": {"type": "keyword"},
-                    "domain": {"type": "keyword"},
-                    "date": {"type": "date"},
-                    "text": {"type": "text", "analyzer": "pl_lemma"},
-                    "vector": {"type": "dense_vector", "dims": 384, "index": True, "similarity": "cosine"}
-                }
+            }
+        },
+        "mappings": {
+            "properties": {
+                "id": {"type": "keyword"},
+                "domain": {"type": "keyword"},
+                "date": {"type": "date"},
+                "text": {"type": "text", "analyzer": ES_TEXT_ANALYZER},
+                "vector": {"type": "dense_vector", "dims": 384, "index": True, "similarity": "cosine"}
             }
         }
-        es_client.indices.create(index=index_name, body=index_body)
+    }
+    es_client.indices.create(index=index_name, body=index_body)
 
-def populate_index(data_file_path: str, index_name: str, es_client: Elasticsearch):
+def populate_index(data_file_path: str, index_name: str, es_client: Elasticsearch, dedup_threshold: Optional[float] = None):
     if es_client.indices.exists(index=index_name):
         doc_count = es_client.count(index=index_name)['count']
         if doc_count > 0:
@@ -41,31 +80,91 @@ def populate_index(data_file_path: str, index_name: str, es_client: Elasticsearc
         es_client.indices.create(index=index_name)
 
     actions = []
-    with open(data_file_path, "r") as f:
-        for i, line in enumerate(f, start=1):
-            line = line.strip()
-            if not line or line.startswith("{\"index\""):  # skip metadata lines
-                continue
-            doc = json.loads(line)
-            if is_json_invalid(doc):
-                print(f"Data row {i} invalid, skipping...")
-                continue
-            actions.append({
-                "_index": index_name,
-                "_id": doc["id"],
-                "_source": doc
-            })
+    for doc in iter_documents(data_file_path, dedup_threshold):
+        actions.append({
+            "_index": index_name,
+            "_id": doc["id"],
+            "_source": doc
+        })
     success, _ = bulk(es_client, actions)
     print(f"Inserted {success} documents into ES")
 
-def create_qdrant_collection(collection_name: str, qdrant_client: QdrantClient):
-    if collection_name not in [c.name for c in qdrant_client.get_collections().collections]:
+def qdrant_quantization_config(quantization: str):
+    '''
+    "none", "scalar" (int8, 4x smaller) or "binary" (1 bit per dimension, 32x smaller).
+    Quantized vectors stay in RAM, originals are only read for rescoring.
+    '''
+    if quantization == "none":
+        return None
+    if quantization == "scalar":
+        return ScalarQuantization(scalar=ScalarQuantizationConfig(type=ScalarType.INT8, quantile=0.99, always_ram=True))
+    if quantization == "binary":
+        return BinaryQuantization(binary=BinaryQuantizationConfig(always_ram=True))
+    raise ValueError(f"Unknown quantization: {quantization}")
+
+def create_qdrant_collection(
+        collection_name: str,
+        qdrant_client: QdrantClient,
+        quantization: str = "none",
+        on_disk: bool = False,
+        hnsw_m: int = 16,
+        hnsw_ef_construct: int = 100,
+        sparse: bool = False
+    ):
+    '''
+    sparse: also keep a hashed lexical vector per point (hybrid search), idf is computed by Qdrant
+    '''
+    quantization_config = qdrant_quantization_config(quantization)
+    hnsw_config = HnswConfigDiff(m=hnsw_m, ef_construct=hnsw_ef_construct)
+
+    exists = collection_name in [c.name for c in qdrant_client.get_collections().collections]
+    if exists and sparse and SPARSE_VECTOR_NAME not in (qdrant_client.get_collection(collection_name).config.params.sparse_vectors or {}):
+        # sparse vectors can't be added to existing points, the collection is refilled from the data file
+        logger.warning("Kolekcja bez wektorów rzadkich, odtwarzanie dla wyszukiwania hybrydowego",
+                       collection=collection_name)
+        qdrant_client.delete_collection(collection_name)
+        exists = False
+
+    if not exists:
         qdrant_client.recreate_collection(
             collection_name=collection_name,
-            vectors_config=VectorParams(size=384, distance=Distance.COSINE),
-        ),
+            vectors_config=VectorParams(size=384, distance=Distance.COSINE, on_disk=on_disk),
+            sparse_vectors_config={SPARSE_VECTOR_NAME: SparseVectorParams(modifier=Modifier.IDF)} if sparse else None,
+            hnsw_config=hnsw_config,
+            quantization_config=quantization_config,
+        )
+        ensure_payload_indexes(collection_name, qdrant_client)
+        return
+
+    # Existing collection: apply changed storage settings in place, Qdrant rebuilds segments in background
+    config = qdrant_client.get_collection(collection_name).config
+    current_quantization = config.quantization_config
+    if (bool(config.params.vectors.on_disk) != on_disk
+            or config.hnsw_config.m != hnsw_m
+            or config.hnsw_config.ef_construct != hnsw_ef_construct
+            or (current_quantization is None) != (quantization_config is None)
+            or (quantization_config is not None and type(current_quantization) is not type(quantization_config))):
+        logger.info("Aktualizacja ustawień przechowywania kolekcji", collection=collection_name, on_disk=on_disk,
+                    hnsw_m=hnsw_m, hnsw_ef_construct=hnsw_ef_construct, quantization=quantization)
+        qdrant_client.update_collection(
+            collection_name=collection_name,
+            vectors_config={"": VectorParamsDiff(on_disk=on_disk)},
+            hnsw_config=hnsw_config,
+            quantization_config=quantization_config or Disabled.DISABLED,
+        )
+    ensure_payload_indexes(collection_name, qdrant_client)
+
+# Payload fields used by query filters, indexed so filtered search doesn't scan payloads
+QDRANT_PAYLOAD_INDEXES = {"date": PayloadSchemaType.DATETIME, "domain": PayloadSchemaType.KEYWORD}
 
-def populate_collection(data_file_path: str, collection_name: str, qdrant_client: QdrantClient):
+def ensure_payload_indexes(collection_name: str, qdrant_client: QdrantClient):
+    existing = qdrant_client.get_collection(collection_name).payload_schema
+    for field, schema in QDRANT_PAYLOAD_INDEXES.items():
+        if field not in existing:
+            qdrant_client.create_payload_index(collection_name, field_name=field, field_schema=schema, wait=True)
+
+def populate_collection(data_file_path: str, collection_name: str, qdrant_client: QdrantClient, sparse: bool = False,
+                        dedup_threshold: Optional[float] = None):
     collection_stats = qdrant_client.get_collection(collection_name)
     num_points = collection_stats.points_count
     if num_points > 0:
@@ -73,20 +172,12 @@ def populate_collection(data_file_path: str, collection_name: str, qdrant_client
         return
 
     points = []
-    with open(data_file_path, "r") as f:
-        for i, line in enumerate(f, start=1):
-            line = line.strip()
-            if not line or line.startswith("{\"index\""):
-                continue
-            doc = json.loads(line)
-            if is_json_invalid(doc):
-                print(f"Data row {i} invalid, skipping...")
-                continue
-            points.append(PointStruct(
-                id=int(doc["id"]),
-                vector=doc["vector"],
-                payload={k: v for k, v in doc.items() if k != "vector"}  # store text, date, etc.
-            ))
+    for doc in iter_documents(data_file_path, dedup_threshold):
+        points.append(PointStruct(
+            id=int(doc["id"]),
+            vector={"": doc["vector"], SPARSE_VECTOR_NAME: sparse_document_vector(doc["text"])} if sparse else doc["vector"],
+            payload={k: v for k, v in doc.items() if k != "vector"}  # store text, date, etc.
+        ))
 
     BATCH_SIZE = 500
     for i in range(0, len(points), BATCH_SIZE):
@@ -97,6 +188,55 @@ def populate_collection(data_file_path: str, collection_name: str, qdrant_client
         )
         print(f"Upserted points {i}-{i+len(batch)}")
 
+def iter_documents(data_file_path: str, dedup_threshold: Optional[float] = None):
+    '''
+    Valid documents from the ndjson data file (bulk metadata lines skipped).
+    With dedup_threshold only one representative of every near-duplicate cluster is yielded.
+    '''
+    duplicate_of = load_duplicate_map(data_file_path, dedup_threshold) if dedup_threshold else {}
+    with open(data_file_path, "r") as f:
+        for i, line in enumerate(f, start=1):
+            line = line.strip()
+            if not line or line.startswith("{\"index\""):  # skip metadata lines
+                continue
+            doc = json.loads(line)
+            if is_json_invalid(doc):
+                print(f"Data row {i} invalid, skipping...")
+                continue
+            if str(doc["id"]) in duplicate_of:
+                continue
+            yield doc
+
+def load_duplicate_map(data_file_path: str, threshold: float) -> Dict[str, str]:
+    '''
+    {duplicate id: representative id} of the data file. Computed once and kept next to it
+    in <data file>.dedup.json (with the savings report), so every index skips the same documents.
+    '''
+    sidecar_path = f"{data_file_path}.dedup.json"
+    stat = os.stat(data_file_path)
+    signature = {"size": stat.st_size, "mtime": int(stat.st_mtime), "threshold": threshold,
+                 "num_perm": NUM_PERM, "shingle_size": SHINGLE_SIZE}
+    if os.path.exists(sidecar_path):
+        with open(sidecar_path, "r") as f:
+            sidecar = json.load(f)
+        if sidecar.get("signature") == signature:
+            return sidecar["duplicate_of"]
+
+    duplicate_of, report = build_duplicate_map(iter_documents(data_file_path), threshold)
+    logger.info("Deduplikacja", report=format_dedup_report(report), path=sidecar_path)
+    with open(sidecar_path, "w") as f:
+        json.dump({"signature": signature, "report": report, "duplicate_of": duplicate_of}, f)
+    return duplicate_of
+
+def format_dedup_report(report: dict, vector_dim: int = 384) -> str:
+    documents = max(report["documents"], 1)
+    # every skipped document saves its float32 vector in each dense index (Qdrant, ES dense_vector)
+    vector_mb = report["duplicates"] * vector_dim * 4 / 2**20
+    return (f"Dedup: {report['duplicates']} of {report['documents']} documents "
+            f"({100 * report['duplicates'] / documents:.1f}%) are near-duplicates of {report['clusters']} representatives "
+            f"(largest cluster {report['largest_cluster']}); not indexed: "
+            f"{report['duplicate_text_bytes'] / 2**20:.1f} MiB of text, {vector_mb:.1f} MiB of vectors per dense index")
+
 def is_json_invalid(json_obj):
     obligatory_data_keys = ['id', 'text', 'vector']
     return any([key not in json_obj for key in obligatory_data_keys])
\ No newline at end of file
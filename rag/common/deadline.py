@@ -0,0 +1,55 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional
+import time
+
+# absolute time.monotonic() by which the current request has to be answered
+_deadline: ContextVar[Optional[float]] = ContextVar("deadline", default=None)
+
+
+class DeadlineExceeded(Exception):
+    '''
+    The request ran out of time before `stage` could run
+    '''
+
+    def __init__(self, stage: str):
+        super().__init__(f"Deadline exceeded before {stage}")
+        self.stage = stage
+
+
+@contextmanager
+def deadline_scope(deadline: Optional[float]):
+    '''
+    Sets the request deadline (time.monotonic() value, None = no deadline) for the block
+    and everything it calls, including threads started with a copied context
+    '''
+    token = _deadline.set(deadline)
+    try:
+        yield deadline
+    finally:
+        _deadline.reset(token)
+
+
+def remaining() -> Optional[float]:
+    '''
+    Seconds left until the deadline, None without one
+    '''
+    deadline = _deadline.get()
+    return None if deadline is None else deadline - time.monotonic()
+
+
+def has_time(seconds: float) -> bool:
+    '''
+    Whether a step expected to take `seconds` still fits before the deadline
+    '''
+    left = remaining()
+    return left is None or left > seconds
+
+
+def check_deadline(stage: str, seconds: float = 0.0):
+    '''
+    Raises DeadlineExceeded when a required step expected to take `seconds` can no longer
+    finish before the deadline, instead of doing work nobody will wait for
+    '''
+    if not has_time(seconds):
+        raise DeadlineExceeded(stage)
@@ -0,0 +1,100 @@
+from collections import defaultdict
+from typing import Dict, Iterable, Optional
+import zlib
+import re
+
+import numpy as np
+
+# MinHash over word 5-gram shingles with LSH banding: 64 permutations in 8 bands of 8 rows
+# make pairs with Jaccard >= ~0.77 collide in some band, candidates are then checked
+# against DEDUP_THRESHOLD on the signature estimate.
+SHINGLE_SIZE = 5
+NUM_PERM = 64
+BANDS = 8
+DEDUP_THRESHOLD = 0.8
+
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+_PRIME = np.uint64(4294967311)   # smallest prime above 2**32
+_ROLL = np.uint64(1000003)
+_MASK = np.uint64(0xFFFFFFFF)
+
+
+class MinHasher:
+    '''
+    Fixed random permutations h(x) = (a*x + b) mod p, same seed gives the same signatures
+    '''
+
+    def __init__(self, num_perm: int = NUM_PERM, shingle_size: int = SHINGLE_SIZE, seed: int = 1):
+        rng = np.random.default_rng(seed)
+        # a < 2**31 keeps a*x (x < 2**32) inside uint64
+        self.a = rng.integers(1, 2**31, num_perm, dtype=np.uint64)[:, None]
+        self.b = rng.integers(0, 2**32, num_perm, dtype=np.uint64)[:, None]
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+
+    def shingles(self, text: str) -> np.ndarray:
+        words = _WORD_RE.findall(text.lower())
+        if not words:
+            return np.zeros(0, dtype=np.uint64)
+        hashes = np.fromiter((zlib.crc32(w.encode("utf-8")) for w in words), dtype=np.uint64, count=len(words))
+        k = min(self.shingle_size, len(hashes))
+        # rolling hash of k consecutive words, computed for all windows at once
+        shingles = np.zeros(len(hashes) - k + 1, dtype=np.uint64)
+        for j in range(k):
+            shingles = (shingles * _ROLL + hashes[j:len(hashes) - k + 1 + j]) & _MASK
+        return np.unique(shingles)
+
+    def signature(self, text: str) -> Optional[np.ndarray]:
+        shingles = self.shingles(text)
+        if not len(shingles):
+            return None
+        return ((self.a * shingles[None, :] + self.b) % _PRIME).min(axis=1).astype(np.uint32)
+
+
+def build_duplicate_map(documents: Iterable[dict], threshold: float = DEDUP_THRESHOLD,
+                        num_perm: int = NUM_PERM, bands: int = BANDS) -> tuple[Dict[str, str], dict]:
+    '''
+    One streaming pass: a document whose signature agrees with an earlier representative on
+    at least `threshold` of the permutations becomes its duplicate, otherwise it is a new
+    representative. Returns {duplicate id: representative id} and a savings report.
+    '''
+    hasher = MinHasher(num_perm)
+    rows = num_perm // bands
+    buckets = [defaultdict(list) for _ in range(bands)]
+    representatives = {}     # id -> signature
+    duplicate_of = {}
+    cluster_size = defaultdict(int)
+    report = {"documents": 0, "duplicates": 0, "text_bytes": 0, "duplicate_text_bytes": 0}
+
+    for doc in documents:
+        doc_id = str(doc["id"])
+        size = len(doc["text"].encode("utf-8"))
+        report["documents"] += 1
+        report["text_bytes"] += size
+        signature = hasher.signature(doc["text"])
+        if signature is None:
+            continue
+
+        keys = [signature[band * rows:(band + 1) * rows].tobytes() for band in range(bands)]
+        best, best_similarity = None, threshold
+        for band, key in enumerate(keys):
+            for candidate in buckets[band].get(key, ()):
+                similarity = float(np.mean(representatives[candidate] == signature))
+                if similarity >= best_similarity:
+                    best, best_similarity = candidate, similarity
+
+        if best is not None:
+            duplicate_of[doc_id] = best
+            cluster_size[best] += 1
+            report["duplicates"] += 1
+            report["duplicate_text_bytes"] += size
+            continue
+
+        representatives[doc_id] = signature
+        for band, key in enumerate(keys):
+            buckets[band][key].append(doc_id)
+
+    report["representatives"] = report["documents"] - report["duplicates"]
+    report["clusters"] = len(cluster_size)
+    report["largest_cluster"] = max(cluster_size.values(), default=0) + 1
+    return duplicate_of, report
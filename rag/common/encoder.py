@@ -0,0 +1,85 @@
+from pathlib import Path
+from typing import Optional
+import fcntl
+import re
+
+from sentence_transformers import SentenceTransformer
+
+from observability import get_logger
+
+logger = get_logger(__name__)
+
+ENCODER_BACKENDS = ("torch", "onnx", "onnx-int8")
+QUANTIZATIONS = ("avx2", "avx512", "avx512_vnni", "arm64")
+
+
+def _import_onnx():
+    try:
+        import onnxruntime
+        from sentence_transformers.backend import export_dynamic_quantized_onnx_model
+        import optimum.onnxruntime  # noqa: F401, used by sentence-transformers' ONNX backend
+    except ImportError as e:
+        raise ImportError("ENCODER_BACKEND=onnx requires optimum and onnxruntime "
+                          "(pip install optimum[onnxruntime])") from e
+    return onnxruntime, export_dynamic_quantized_onnx_model
+
+
+def onnx_file_name(backend: str, quantization: str) -> str:
+    if backend == "onnx-int8":
+        return f"onnx/model_int8_{quantization}.onnx"
+    return "onnx/model.onnx"
+
+
+def export_onnx_model(model_name: str, backend: str, onnx_dir: str, quantization: str = "avx2") -> Path:
+    '''
+    Exports the model to ONNX once (and the int8 dynamically quantized graph for
+    "onnx-int8") into `onnx_dir/<model name>`, reused on later starts. Server workers
+    starting together wait for the one exporting (file lock).
+    '''
+    _, export_quantized = _import_onnx()
+    target = Path(onnx_dir) / re.sub(r"[^\w.-]+", "--", model_name).strip("-")
+    target.parent.mkdir(parents=True, exist_ok=True)
+    with open(f"{target}.lock", "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        if not (target / onnx_file_name("onnx", quantization)).is_file():
+            logger.info("Eksport enkodera do ONNX", model=model_name, path=str(target))
+            SentenceTransformer(model_name, backend="onnx").save(str(target))
+        if backend == "onnx-int8" and not (target / onnx_file_name(backend, quantization)).is_file():
+            logger.info("Kwantyzacja enkodera int8", model=model_name, quantization=quantization)
+            model = SentenceTransformer(str(target), backend="onnx",
+                                        model_kwargs={"file_name": onnx_file_name("onnx", quantization)})
+            export_quantized(model, quantization, str(target), file_suffix=f"int8_{quantization}")
+    return target
+
+
+def load_encoder(model_name: str,
+                 backend: str = "torch",
+                 onnx_dir: str = "data/onnx",
+                 quantization: str = "avx2",
+                 threads: Optional[int] = None) -> SentenceTransformer:
+    '''
+    Query encoder. "torch" is the stock model, "onnx" runs the exported graph on ONNX
+    Runtime (CPU) and "onnx-int8" its int8 dynamically quantized version (int8 weights,
+    activations quantized per call). All return a SentenceTransformer, `embed` works the
+    same. ONNX Runtime uses at most `threads` threads per call.
+    '''
+    if backend not in ENCODER_BACKENDS:
+        raise ValueError(f"Unknown encoder backend {backend!r}, expected one of {ENCODER_BACKENDS}")
+    if backend == "torch":
+        return SentenceTransformer(model_name)
+    if quantization not in QUANTIZATIONS:
+        raise ValueError(f"Unknown quantization {quantization!r}, expected one of {QUANTIZATIONS}")
+
+    onnxruntime, _ = _import_onnx()
+    path = export_onnx_model(model_name, backend, onnx_dir, quantization)
+    options = onnxruntime.SessionOptions()
+    if threads:
+        options.intra_op_num_threads = threads
+        options.inter_op_num_threads = 1
+    model = SentenceTransformer(str(path), backend="onnx", model_kwargs={
+        "file_name": onnx_file_name(backend, quantization),
+        "provider": "CPUExecutionProvider",
+        "session_options": options,
+    })
+    logger.info("Enkoder ONNX", model=model_name, backend=backend, file=onnx_file_name(backend, quantization))
+    return model
@@ -0,0 +1,97 @@
+from typing import Optional, Tuple
+import re
+
+from qdrant_client.models import Filter, FieldCondition, DatetimeRange, MatchAny
+
+# Explicit constraints only: a bare year ("Euro 2012") stays a search term, not a filter
+YEAR = r"((?:19|20)\d{2})"
+RANGE_RE = re.compile(rf"\b(?:w\s+latach\s+|latach\s+|od\s+(?:roku\s+)?|między\s+(?:rokiem\s+)?)?{YEAR}\s*(?:-|–|—|do|a)\s*(?:rokiem\s+|roku\s+)?{YEAR}\b")
+AFTER_RE = re.compile(rf"\bpo\s+(?:roku\s+)?{YEAR}\b")
+BEFORE_RE = re.compile(rf"\bprzed\s+(?:rokiem\s+)?{YEAR}\b")
+SINCE_RE = re.compile(rf"\b(?:od|począwszy\s+od)\s+(?:roku\s+)?{YEAR}\b")
+UNTIL_RE = re.compile(rf"\bdo\s+(?:roku\s+)?{YEAR}\b")
+IN_YEAR_RE = re.compile(rf"\b(?:w|z)\s+(?:roku\s+{YEAR}|{YEAR}\s+r(?:oku\b|\.|\b))")
+DOMAIN_RE = re.compile(r"\b(?:site:)?((?:www\.)?[a-z0-9][a-z0-9-]*(?:\.[a-z0-9-]+)*\.(?:pl|com|eu|org|net|info|edu|gov))\b")
+
+
+class QueryFilter:
+    '''
+    Metadata constraints of a query: ISO date range [date_from, date_before) and allowed domains.
+    Empty filter is falsy, engines then search unfiltered.
+    '''
+    __slots__ = ("date_from", "date_before", "domains")
+
+    def __init__(self, date_from: Optional[str] = None, date_before: Optional[str] = None, domains: Tuple[str, ...] = ()):
+        self.date_from = date_from
+        self.date_before = date_before
+        self.domains = domains
+
+    def __bool__(self) -> bool:
+        return bool(self.date_from or self.date_before or self.domains)
+
+    def __repr__(self) -> str:
+        return f"QueryFilter(date_from={self.date_from}, date_before={self.date_before}, domains={self.domains})"
+
+    def to_dict(self) -> dict:
+        return {"date_from": self.date_from, "date_before": self.date_before, "domains": list(self.domains)}
+
+    def to_es(self) -> list:
+        '''
+        Clauses for bool.filter (non-scoring, cached by ES)
+        '''
+        clauses = []
+        if self.date_from or self.date_before:
+            date_range = {}
+            if self.date_from:
+                date_range["gte"] = self.date_from
+            if self.date_before:
+                date_range["lt"] = self.date_before
+            clauses.append({"range": {"date": date_range}})
+        if self.domains:
+            clauses.append({"terms": {"domain": list(self.domains)}})
+        return clauses
+
+    def to_qdrant(self) -> Filter:
+        must = []
+        if self.date_from or self.date_before:
+            must.append(FieldCondition(key="date", range=DatetimeRange(gte=self.date_from, lt=self.date_before)))
+        if self.domains:
+            must.append(FieldCondition(key="domain", match=MatchAny(any=list(self.domains))))
+        return Filter(must=must)
+
+
+def _domains(text: str) -> Tuple[str, ...]:
+    domains = []
+    for domain in DOMAIN_RE.findall(text):
+        bare = domain[4:] if domain.startswith("www.") else domain
+        domains.extend([bare, f"www.{bare}"])
+    return tuple(dict.fromkeys(domains))
+
+
+def extract_query_filter(text: str) -> QueryFilter:
+    '''
+    Date constraints ("w latach 2010-2015", "po 2015", "przed 2015", "od 2015", "do 2015",
+    "w 2015 roku") and domains ("ze strony onet.pl") from the query text
+    '''
+    text = text.lower()
+    start = end = None   # years, inclusive
+
+    if match := RANGE_RE.search(text):
+        start, end = sorted((int(match.group(1)), int(match.group(2))))
+    elif match := IN_YEAR_RE.search(text):
+        start = end = int(match.group(1) or match.group(2))
+    else:
+        if match := AFTER_RE.search(text):
+            start = int(match.group(1)) + 1
+        elif match := SINCE_RE.search(text):
+            start = int(match.group(1))
+        if match := BEFORE_RE.search(text):
+            end = int(match.group(1)) - 1
+        elif match := UNTIL_RE.search(text):
+            end = int(match.group(1))
+
+    return QueryFilter(
+        f"{start}-01-01" if start is not None else None,
+        f"{end + 1}-01-01" if end is not None else None,
+        _domains(text)
+    )
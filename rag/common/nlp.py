@@ -0,0 +1,53 @@
+from typing import Optional
+
+import spacy
+from spacy.language import Language
+
+# Components kept for lemmatization when the model uses a trainable (edit tree) lemmatizer
+LEMMA_COMPONENTS = {"tok2vec", "lemmatizer", "trainable_lemmatizer"}
+# Rule-based lemmatizers (e.g. Polish "pos_lookup") additionally need POS from these
+POS_COMPONENTS = {"morphologizer", "tagger", "attribute_ruler"}
+
+
+class NlpProfiles:
+    '''
+    Task-specific views of one spaCy model:
+    - keywords: only what lemma_ needs (is_stop / is_alpha are lexical),
+      None when nothing lemmatizes client-side (ES analyzes queries itself)
+    - sentences: tokenizer + rule-based sentencizer
+    '''
+    __slots__ = ("keywords", "sentences", "n_process", "batch_size")
+
+    def __init__(self, keywords: Optional[Language], sentences: Language, n_process: int = 1, batch_size: int = 64):
+        self.keywords = keywords
+        self.sentences = sentences
+        self.n_process = n_process
+        self.batch_size = batch_size
+
+
+def _lemma_components(nlp: Language) -> set:
+    keep = set(LEMMA_COMPONENTS)
+    for name in nlp.pipe_names:
+        meta = nlp.get_pipe_meta(name)
+        if meta.factory == "lemmatizer" and getattr(nlp.get_pipe(name), "mode", "lookup") != "lookup":
+            keep |= POS_COMPONENTS
+    return keep
+
+
+def load_nlp_profiles(spacy_model_name: str, n_process: int = 1, batch_size: int = 64,
+                      with_keywords: bool = True) -> NlpProfiles:
+    full = spacy.load(spacy_model_name)
+    all_components = list(full.component_names)
+
+    keywords = None
+    if with_keywords:
+        keywords = full
+        keep = _lemma_components(keywords)
+        for name in list(keywords.component_names):
+            if name not in keep:
+                keywords.remove_pipe(name)
+
+    sentences = spacy.load(spacy_model_name, exclude=all_components)
+    sentences.add_pipe("sentencizer")
+
+    return NlpProfiles(keywords, sentences, n_process, batch_size)
@@ -0,0 +1,159 @@
+from typing import Dict, List, Optional
+import threading
+import time
+
+import httpx
+from ollama import Client, ResponseError
+
+from observability import get_logger, record_llm_host
+
+from .deadline import DeadlineExceeded, remaining
+
+logger = get_logger(__name__)
+
+
+def _is_host_failure(error: Exception) -> bool:
+    '''
+    Errors that say nothing about the request itself: host down, timing out, overloaded
+    or missing the model. Any other host can answer the same request.
+    '''
+    if isinstance(error, ResponseError):
+        return error.status_code >= 500 or error.status_code == 404
+    return isinstance(error, (ConnectionError, httpx.TransportError))
+
+
+class _Host:
+    __slots__ = ("url", "client", "outstanding", "failures", "ejected_until")
+
+    def __init__(self, url: str, timeout: Optional[float]):
+        self.url = url
+        self.client = Client(url, timeout=timeout)
+        self.outstanding = 0
+        self.failures = 0
+        self.ejected_until = 0.0
+
+
+class OllamaPool:
+    '''
+    Ollama client spread over several hosts, with the same `chat` signature as `ollama.Client`.
+    Each call goes to the healthy host with the fewest requests in flight, at most
+    `max_concurrency` per host (callers wait for a free one, Ollama would queue them anyway).
+    A host failing `max_failures` calls in a row, or the background health check
+    (GET /api/tags every `health_interval` s), ejects it for `eject_seconds`, renewed
+    while the checks keep failing. Calls failed by the host are retried once on another one.
+    '''
+
+    def __init__(self,
+                 hosts: List[str],
+                 max_concurrency: int = 4,
+                 max_failures: int = 3,
+                 eject_seconds: float = 30.0,
+                 health_interval: float = 5.0,
+                 health_timeout: float = 2.0,
+                 timeout: Optional[float] = None,
+                 acquire_timeout: Optional[float] = None):
+        if not hosts:
+            raise ValueError("OllamaPool needs at least one host")
+        self.hosts = [_Host(url, timeout) for url in dict.fromkeys(hosts)]
+        self.max_concurrency = max_concurrency
+        self.max_failures = max_failures
+        self.eject_seconds = eject_seconds
+        self.acquire_timeout = acquire_timeout
+        self.health_timeout = health_timeout
+        self._cond = threading.Condition()
+        self._next = 0
+        self._stop = threading.Event()
+        self._health_thread = None
+        if health_interval and len(self.hosts) > 1:
+            self._health_thread = threading.Thread(target=self._health_loop, args=(health_interval,), daemon=True)
+            self._health_thread.start()
+
+    @property
+    def clients(self) -> Dict[str, Client]:
+        return {host.url: host.client for host in self.hosts}
+
+    def healthy(self) -> List[str]:
+        now = time.monotonic()
+        with self._cond:
+            return [host.url for host in self.hosts if host.ejected_until <= now]
+
+    def chat(self, *args, **kwargs):
+        attempts = 2 if len(self.hosts) > 1 else 1
+        tried = set()
+        for attempt in range(attempts):
+            host = self._acquire(exclude=tried)
+            tried.add(host.url)
+            try:
+                response = host.client.chat(*args, **kwargs)
+            except Exception as e:
+                failed = _is_host_failure(e)
+                self._release(host, ok=not failed)
+                # host failures count against the host, other errors are the request's (bad model, options)
+                record_llm_host(host.url, "error" if failed else "request_error")
+                if not failed or attempt == attempts - 1:
+                    raise
+                logger.warning("Błąd hosta Ollama, ponowienie na innym", host=host.url, error=str(e))
+                continue
+            self._release(host, ok=True)
+            record_llm_host(host.url, "ok")
+            return response
+
+    def close(self):
+        self._stop.set()
+        for host in self.hosts:
+            # ollama.Client has no close(), its httpx client does
+            host.client._client.close()
+
+    def _acquire(self, exclude=()) -> _Host:
+        # nie czekamy na wolny host dłużej, niż pozwala termin żądania
+        timeouts = [t for t in (self.acquire_timeout, remaining()) if t is not None]
+        deadline = time.monotonic() + min(timeouts) if timeouts else None
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                live = [h for h in self.hosts if h.ejected_until <= now] or self.hosts  # wszystkie wyrzucone: próbuj dalej
+                candidates = [h for h in live if h.url not in exclude] or live
+                free = [h for h in candidates if h.outstanding < self.max_concurrency]
+                if free:
+                    # najmniej zajęty, remisy rozkładane po kolei
+                    self._next += 1
+                    host = min(free, key=lambda h: (h.outstanding, (self.hosts.index(h) - self._next) % len(self.hosts)))
+                    host.outstanding += 1
+                    return host
+                left = None if deadline is None else deadline - now
+                if left is not None and left <= 0:
+                    request_left = remaining()
+                    if request_left is not None and request_left <= 0:
+                        raise DeadlineExceeded("llm")
+                    raise TimeoutError("No Ollama host available")
+                self._cond.wait(left)
+
+    def _release(self, host: _Host, ok: bool):
+        with self._cond:
+            host.outstanding -= 1
+            self._mark(host, ok)
+            self._cond.notify()
+
+    def _mark(self, host: _Host, ok: bool):
+        if ok:
+            host.failures = 0
+            return
+        host.failures += 1
+        if host.failures >= self.max_failures:
+            self._eject(host)
+
+    def _eject(self, host: _Host):
+        if host.ejected_until <= time.monotonic():
+            logger.warning("Host Ollama wyłączony z puli", host=host.url, failures=host.failures,
+                           seconds=self.eject_seconds)
+        host.ejected_until = time.monotonic() + self.eject_seconds
+
+    def _health_loop(self, interval: float):
+        while not self._stop.wait(interval):
+            for host in self.hosts:
+                try:
+                    httpx.get(f"{host.url}/api/tags", timeout=self.health_timeout).raise_for_status()
+                except httpx.HTTPError:
+                    # martwy host od razu poza pulą, bez czekania na błędy zapytań
+                    with self._cond:
+                        self._eject(host)
@@ -0,0 +1,65 @@
+from dataclasses import dataclass
+from typing import Optional
+
+
+@dataclass(frozen=True)
+class PipelineProfile:
+    '''
+    What one request may spend. llm_clarification False keeps only the heuristic
+    ambiguity detection, depth_scale shrinks the retrieval depth of every engine,
+    retries False leaves only saving unresolved queries to memory
+    '''
+    name: str
+    llm_clarification: bool
+    decomposition: bool
+    depth_scale: float
+    retries: bool
+
+
+PIPELINE_PROFILES = {
+    "full": PipelineProfile("full", llm_clarification=True, decomposition=True, depth_scale=1.0, retries=True),
+    "fast": PipelineProfile("fast", llm_clarification=False, decomposition=False, depth_scale=0.75, retries=True),
+    "minimal": PipelineProfile("minimal", llm_clarification=False, decomposition=False, depth_scale=0.5, retries=False),
+}
+# od najpełniejszego do najtańszego
+PROFILE_ORDER = ("full", "fast", "minimal")
+
+
+class ProfileSelector:
+    '''
+    Picks the profile from the current load: requests waiting for admission and the
+    expected latency of a new request (queue wait plus recent service time).
+    Either signal crossing its `fast_*` threshold gives "fast", its `minimal_*` one
+    "minimal" (0 disables a threshold). `forced` pins one profile regardless of load.
+    '''
+
+    def __init__(self,
+                 fast_queue: int = 0,
+                 minimal_queue: int = 0,
+                 fast_latency_ms: float = 0.0,
+                 minimal_latency_ms: float = 0.0,
+                 forced: Optional[str] = None):
+        if forced is not None and forced not in PIPELINE_PROFILES:
+            raise ValueError(f"Unknown pipeline profile: {forced}")
+        self.fast_queue = fast_queue
+        self.minimal_queue = minimal_queue
+        self.fast_latency_ms = fast_latency_ms
+        self.minimal_latency_ms = minimal_latency_ms
+        self.forced = forced
+
+    def choose(self, queued: int, latency_seconds: float, requested: Optional[str] = None) -> PipelineProfile:
+        '''
+        Profile for a request starting now; a caller asking for a cheaper one gets it
+        '''
+        if self.forced:
+            name = self.forced
+        else:
+            latency_ms = latency_seconds * 1000.0
+            name = "full"
+            if (self.fast_queue and queued >= self.fast_queue) or (self.fast_latency_ms and latency_ms >= self.fast_latency_ms):
+                name = "fast"
+            if (self.minimal_queue and queued >= self.minimal_queue) or (self.minimal_latency_ms and latency_ms >= self.minimal_latency_ms):
+                name = "minimal"
+        if requested and PROFILE_ORDER.index(requested) > PROFILE_ORDER.index(name):
+            name = requested
+        return PIPELINE_PROFILES[name]
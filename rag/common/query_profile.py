@@ -0,0 +1,177 @@
+from collections import OrderedDict, defaultdict, deque
+from types import MappingProxyType
+from typing import Dict, Iterable, List
+import threading
+import json
+
+import config
+from observability import record_cache
+
+from .filters import extract_query_filter
+from .util import (
+    TOKEN_RE,
+    ID_RE,
+    ACRONYM_RE,
+    YEAR_RE,
+)
+
+# Lexicon categories matched as substrings of the lowercased query
+MATCHED_CATEGORIES = (
+    "abstract_phrases",
+    "ambiguous_entities",
+    "entity_disambiguators",
+    "abstract_concepts",
+    "concept_context",
+    "scope_triggers",
+    "scope_markers",
+)
+
+
+class KeywordMatcher:
+    '''
+    Aho-Corasick automaton over all lexicon terms.
+    One pass over the text finds every (category, term) occurring as a substring,
+    cost doesn't depend on how many terms the lexicon holds.
+    '''
+
+    def __init__(self, categories: Dict[str, Iterable[str]]):
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._out: List[List[tuple]] = [[]]
+        self.order: Dict[tuple, int] = {}
+
+        for category, terms in categories.items():
+            for term in terms:
+                self._insert(term.lower(), (category, term))
+        self._build_failure_links()
+
+    def _insert(self, term: str, label: tuple):
+        if label in self.order:
+            return
+        self.order[label] = len(self.order)
+        state = 0
+        for ch in term:
+            nxt = self._goto[state].get(ch)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[state][ch] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append([])
+            state = nxt
+        self._out[state].append(label)
+
+    def _build_failure_links(self):
+        # BFS, so failure targets (always shallower) are complete before they're used
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, nxt in self._goto[state].items():
+                queue.append(nxt)
+                fail = self._fail[state]
+                while fail and ch not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[nxt] = self._goto[fail].get(ch, 0)
+                self._out[nxt] = self._out[nxt] + self._out[self._fail[nxt]]
+
+    def find(self, text: str) -> Dict[str, List[str]]:
+        '''
+        Matched terms per category, in lexicon order
+        '''
+        goto, fail, out = self._goto, self._fail, self._out
+        found = set()
+        state = 0
+        for ch in text:
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            if out[state]:
+                found.update(out[state])
+
+        matches = defaultdict(list)
+        for category, term in sorted(found, key=self.order.__getitem__):
+            matches[category].append(term)
+        return matches
+
+
+class Lexicon:
+    '''
+    Heuristic word lists loaded from json, see common/lexicon.json
+    '''
+
+    def __init__(self, data: Dict):
+        self.factual_verbs = frozenset(data.get("factual_verbs", []))
+        self.filter_words = frozenset(data.get("filter_words", []))
+        self.ambiguous_entities: Dict[str, str] = data.get("ambiguous_entities", {})
+        self.abstract_concepts: Dict[str, str] = data.get("abstract_concepts", {})
+        self.matcher = KeywordMatcher({category: data.get(category, []) for category in MATCHED_CATEGORIES})
+
+    @classmethod
+    def from_file(cls, path) -> "Lexicon":
+        with open(path, "r", encoding="utf-8") as f:
+            return cls(json.load(f))
+
+
+class QueryProfile:
+    '''
+    Everything the heuristic stages need to know about one query, computed once:
+    tokens, lexicon matches, analyze_query features and metadata filters.
+    Cached profiles are shared by concurrent requests, so matches and features are read-only.
+    '''
+    __slots__ = ("text", "text_lower", "tokens", "overlap_tokens", "matches", "features", "query_filter")
+
+    def __init__(self, query: str, lexicon: "Lexicon"):
+        self.text = query.strip()
+        self.text_lower = self.text.lower()
+        self.tokens = TOKEN_RE.findall(self.text_lower)
+        self.overlap_tokens = frozenset(t for t in self.tokens if len(t) > 2)
+        self.matches = MappingProxyType({category: tuple(terms) for category, terms in lexicon.matcher.find(self.text_lower).items()})
+        self.features = MappingProxyType({
+            "has_number": any(t.isdigit() for t in self.tokens),
+            "has_year": bool(YEAR_RE.search(self.text)),
+            "has_id": bool(ID_RE.search(self.text)),
+            "is_acronym": bool(ACRONYM_RE.fullmatch(self.text)),
+            "has_filter": any(t in lexicon.filter_words for t in self.tokens),
+            "is_question": self.text.endswith("?"),
+            "abstract": bool(self.matches.get("abstract_phrases")),
+            "token_len": len(self.tokens),
+        })
+        self.query_filter = extract_query_filter(self.text)
+
+    def matched(self, category: str) -> tuple:
+        return self.matches.get(category, ())
+
+
+LEXICON = Lexicon.from_file(config.QUERY_LEXICON_PATH)
+
+_PROFILE_CACHE_SIZE = 4096
+_profile_cache: OrderedDict = OrderedDict()
+_profile_lock = threading.Lock()
+
+
+def build_query_profile(query: str) -> QueryProfile:
+    '''
+    Profiles are cached per query string, so stages that only get the raw
+    query (clarification, filtering) reuse the one built at request start
+    '''
+    with _profile_lock:
+        profile = _profile_cache.get(query)
+        if profile is not None:
+            _profile_cache.move_to_end(query)
+    record_cache("query_profile", profile is not None)
+    if profile is not None:
+        return profile
+
+    profile = QueryProfile(query, LEXICON)
+    with _profile_lock:
+        _profile_cache[query] = profile
+        if len(_profile_cache) > _PROFILE_CACHE_SIZE:
+            _profile_cache.popitem(last=False)
+    return profile
+
+
+def analyze_query(query: str) -> dict:
+    '''
+    Analyze query for keywords and types
+    '''
+    return dict(build_query_profile(query).features)
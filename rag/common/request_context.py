@@ -0,0 +1,61 @@
+from dataclasses import dataclass, field, replace
+from typing import Dict, Iterable, Mapping, Optional
+
+from .pipeline_profiles import PipelineProfile, PIPELINE_PROFILES
+from .query_profile import QueryProfile, build_query_profile
+
+
+def new_result(query: str) -> Dict:
+    return {
+        "original_query": query,
+        "answer": "",
+        "chunks": [],
+        "decomposition": None,
+        "stats": {}
+    }
+
+
+@dataclass(frozen=True, slots=True)
+class RequestContext:
+    '''
+    What one request carries through the pipeline: the query and its (shared, read-only)
+    profile, retry strategies, pipeline profile and token budget. Frozen, a retry that
+    gives up a strategy works on a copy (`without`), so nothing a request decides leaks
+    into the caller's list or into other requests. `result` is the request's own output,
+    created fresh for every context.
+    '''
+    query: str
+    profile: QueryProfile
+    retry_strategies: tuple[str, ...]
+    pipeline: PipelineProfile
+    result: Dict = field(compare=False, repr=False)
+    max_chunk_tokens: int = 200
+    max_tokens_len: Optional[int] = None
+
+    @classmethod
+    def create(cls,
+               query: str,
+               retry_strategies: Iterable[str] = (),
+               pipeline: PipelineProfile = PIPELINE_PROFILES["full"],
+               max_chunk_tokens: int = 200,
+               max_tokens_len: Optional[int] = None) -> "RequestContext":
+        strategies = tuple(retry_strategies or ())
+        if not pipeline.retries:
+            # tani profil: bez ponownych prób, nierozwiązane pytania nadal trafiają do pamięci
+            strategies = tuple(s for s in strategies if s == "save_to_memory")
+        result = new_result(query)
+        result["profile"] = pipeline.name
+        return cls(query, build_query_profile(query), strategies, pipeline, result, max_chunk_tokens, max_tokens_len)
+
+    @property
+    def features(self) -> Mapping:
+        return self.profile.features
+
+    def allows(self, strategy: str) -> bool:
+        return strategy in self.retry_strategies
+
+    def without(self, strategy: str) -> "RequestContext":
+        '''
+        Same request with one retry strategy exhausted
+        '''
+        return replace(self, retry_strategies=tuple(s for s in self.retry_strategies if s != strategy))
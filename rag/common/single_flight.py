@@ -0,0 +1,110 @@
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+from typing import Awaitable, Callable, Dict, Hashable, Optional, TypeVar
+import asyncio
+import threading
+import unicodedata
+
+from observability import record_coalesced
+
+from .deadline import DeadlineExceeded, remaining
+
+T = TypeVar("T")
+
+
+def normalize_query(query: str) -> str:
+    '''
+    Coalescing key of a query: NFC, single spaces, no outer whitespace.
+    Case is kept, acronym detection ("PAN" vs "pan") depends on it.
+    '''
+    return " ".join(unicodedata.normalize("NFC", query).split())
+
+
+class SingleFlight:
+    '''
+    Threads calling `do` with the same key while a call is running wait for it and get
+    its result (or exception) instead of running `fn` again. Nothing is cached: the key
+    is forgotten as soon as the leading call returns. Followers wait at most until the
+    request deadline.
+    '''
+
+    def __init__(self, name: str):
+        self.name = name
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, Future] = {}
+
+    def do(self, key: Hashable, fn: Callable[[], T]) -> T:
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = Future()
+
+        if not leader:
+            record_coalesced(self.name, "follower")
+            try:
+                return call.result(timeout=remaining())
+            except FutureTimeout:
+                raise DeadlineExceeded(self.name)
+
+        record_coalesced(self.name, "leader")
+        try:
+            result = fn()
+        except BaseException as e:
+            call.set_exception(e)
+            raise
+        else:
+            call.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                del self._calls[key]
+
+
+class AsyncSingleFlight:
+    '''
+    SingleFlight for coroutines on one event loop. `do` returns (result, coalesced).
+    Followers get the leader's result or error, except for outcomes that belong to the
+    leader alone: exceptions in `retry_on` (e.g. its admission was refused or it ran out of
+    its own time) and cancellation (its client went away). Then a follower tries again,
+    joining a newer call or leading one itself.
+    '''
+
+    def __init__(self, name: str, retry_on: tuple[type[BaseException], ...] = ()):
+        self.name = name
+        self.retry_on = retry_on
+        self._calls: Dict[Hashable, asyncio.Future] = {}
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[T]], timeout: Optional[float] = None) -> tuple[T, bool]:
+        loop = asyncio.get_running_loop()
+        until = None if timeout is None else loop.time() + timeout
+        while (call := self._calls.get(key)) is not None:
+            record_coalesced(self.name, "follower")
+            try:
+                # shield: follower leaving early must not cancel the leader's call
+                return await asyncio.wait_for(asyncio.shield(call), None if until is None else until - loop.time()), True
+            except asyncio.TimeoutError:
+                raise DeadlineExceeded(self.name)
+            except asyncio.CancelledError:
+                # lider anulowany (klient się rozłączył), chyba że anulowano nas
+                if not call.cancelled() or asyncio.current_task().cancelling():
+                    raise
+            except self.retry_on:
+                pass
+
+        call = self._calls[key] = loop.create_future()
+        # bez oczekujących wyjątek lidera nie zostałby odebrany (ostrzeżenie asyncio)
+        call.add_done_callback(lambda f: f.cancelled() or f.exception())
+        record_coalesced(self.name, "leader")
+        try:
+            result = await fn()
+        except asyncio.CancelledError:
+            call.cancel()
+            raise
+        except BaseException as e:
+            call.set_exception(e)
+            raise
+        else:
+            call.set_result(result)
+            return result, False
+        finally:
+            del self._calls[key]
@@ -0,0 +1,42 @@
+from collections import Counter
+from typing import Dict, List
+import zlib
+import re
+
+from qdrant_client.models import SparseVector
+from spacy.lang.pl.stop_words import STOP_WORDS
+
+# Sparse (lexical) vectors stored next to the dense one in Qdrant for single-engine hybrid search.
+# No spaCy pipeline at ingest: words are cut to a prefix as a cheap stemmer ("gospodarki",
+# "gospodarka" -> "gospod") and hashed into the u32 index space, idf is applied by Qdrant.
+SPARSE_VECTOR_NAME = "text"
+SPARSE_PREFIX_LEN = 6
+SPARSE_WORD_RE = re.compile(r"[^\W\d_]+", re.UNICODE)
+
+
+def sparse_terms(text: str) -> List[str]:
+    return [
+        word[:SPARSE_PREFIX_LEN]
+        for word in SPARSE_WORD_RE.findall(text.lower())
+        if len(word) > 2 and word not in STOP_WORDS
+    ]
+
+
+def _hashed(weights: Dict[str, float]) -> SparseVector:
+    # colliding terms share one dimension, Qdrant requires unique indices
+    hashed = Counter()
+    for term, weight in weights.items():
+        hashed[zlib.crc32(term.encode("utf-8"))] += weight
+    return SparseVector(indices=list(hashed), values=list(hashed.values()))
+
+
+def sparse_document_vector(text: str, k1: float = 1.2) -> SparseVector:
+    '''
+    BM25 term-frequency saturation per term (without length normalization)
+    '''
+    counts = Counter(sparse_terms(text))
+    return _hashed({term: tf * (k1 + 1) / (tf + k1) for term, tf in counts.items()})
+
+
+def sparse_query_vector(text: str) -> SparseVector:
+    return _hashed(dict.fromkeys(sparse_terms(text), 1.0))
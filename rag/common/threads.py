@@ -0,0 +1,24 @@
+import os
+
+from observability import get_logger
+
+logger = get_logger(__name__)
+
+
+def limit_threads(threads: int):
+    '''
+    Caps the threads one embedding / spaCy / numpy call of this process may use: torch
+    intra-op threads and the BLAS / OpenMP pools already loaded (threadpoolctl). Every
+    server worker gets its share of the cores instead of one thread per core each.
+    Pools loading later read the environment set by config.py.
+    '''
+    import torch
+
+    torch.set_num_threads(threads)
+    try:
+        from threadpoolctl import threadpool_limits
+    except ImportError:
+        logger.warning("Brak threadpoolctl, limit wątków BLAS tylko przez zmienne środowiskowe")
+    else:
+        threadpool_limits(threads)
+    logger.info("Limit wątków", threads=threads, pid=os.getpid())
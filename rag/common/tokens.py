@@ -0,0 +1,78 @@
+from collections import OrderedDict
+from pathlib import Path
+from typing import List, Optional
+import threading
+
+from observability import get_logger, record_cache
+
+from .util import tokenize_regex
+
+logger = get_logger(__name__)
+
+_COUNT_CACHE_SIZE = 65536
+
+
+def _import_tokenizers():
+    try:
+        import tokenizers
+    except ImportError as e:
+        raise ImportError("LLM_TOKENIZER requires tokenizers (pip install tokenizers)") from e
+    return tokenizers
+
+
+def load_tokenizer(name: str):
+    '''
+    HF tokenizer of the answering model: path to a tokenizer.json or a Hugging Face repo id
+    '''
+    tokenizers = _import_tokenizers()
+    if Path(name).is_file():
+        return tokenizers.Tokenizer.from_file(str(name))
+    return tokenizers.Tokenizer.from_pretrained(name)
+
+
+class TokenCounter:
+    '''
+    Lengths of texts in the answering model's tokens, counted once per text (LRU cache
+    shared by all requests). Without a tokenizer regex tokens are the estimate.
+    '''
+
+    def __init__(self, tokenizer=None, cache_size: int = _COUNT_CACHE_SIZE):
+        self.tokenizer = tokenizer
+        self.cache_size = cache_size
+        self._cache: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_name(cls, name: Optional[str], cache_size: int = _COUNT_CACHE_SIZE) -> "TokenCounter":
+        if not name:
+            logger.warning("Brak LLM_TOKENIZER, limit tokenów liczony tokenami regex")
+            return cls(None, cache_size)
+        return cls(load_tokenizer(name), cache_size)
+
+    def count(self, texts: List[str]) -> List[int]:
+        counts = [None] * len(texts)
+        with self._lock:
+            for i, text in enumerate(texts):
+                cached = self._cache.get(text)
+                if cached is not None:
+                    self._cache.move_to_end(text)
+                    counts[i] = cached
+        missing = [i for i, c in enumerate(counts) if c is None]
+        for i in range(len(texts)):
+            record_cache("token_count", counts[i] is not None)
+        if not missing:
+            return counts
+
+        if self.tokenizer is not None:
+            encodings = self.tokenizer.encode_batch([texts[i] for i in missing], add_special_tokens=False)
+            fresh = [len(e.ids) for e in encodings]
+        else:
+            fresh = [len(tokenize_regex(texts[i])) for i in missing]
+
+        with self._lock:
+            for i, n in zip(missing, fresh):
+                counts[i] = n
+                self._cache[texts[i]] = n
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return counts
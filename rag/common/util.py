@@ -13,13 +13,14 @@ def extract_keywords_lemmatized(text: str, nlp):
     ]
     return list(dict.fromkeys(keywords))
 
-def make_queries(text: str, nlp):
+def make_queries(text: str):
     '''
-    Build queries for qdrant and es
+    Build queries for qdrant and es.
+    Keyword query is the raw text, lemmatization and stop words are left to the
+    lexical engine (ES morfologik analyzer, spaCy in the local BM25 index)
     '''
     semantic_query = f"query: {text}"
-    keywords = extract_keywords_lemmatized(text, nlp)
-    keyword_query = " OR ".join(keywords)
+    keyword_query = text.strip()
     return semantic_query, keyword_query
 
 
@@ -27,33 +28,8 @@ ACRONYM_RE = re.compile(r"^[A-ZĄĆĘŁŃÓŚŻŹ]{2,}$")
 ID_RE = re.compile(r"[A-Z]{1,5}[-_]?\d+")
 YEAR_RE = re.compile(r"\b(19|20)\d{2}\b")
 
-FACTUAL_VERBS = {"być", "wynosić", "mieć", "było", "jest"}
-FILTER_WORDS = {"autor", "dokumenty", "po", "przed", "od", "dotyczące"}
-ABSTRACT_WORDS = {"czym", "co to", "jak", "dlaczego", "sens", "znaczenie"}
-
 TOKEN_RE = re.compile(r"\w+", re.UNICODE)
 
-def analyze_query(query: str) -> dict:
-    '''
-    Analyze query for keywords and types
-    '''
-    text = query.strip()
-    text_lower = text.lower()
-    tokens = TOKEN_RE.findall(text_lower)
-
-    features = {
-        "has_number": any(t.isdigit() for t in tokens),
-        "has_year": bool(YEAR_RE.search(text)),
-        "has_id": bool(ID_RE.search(text)),
-        "is_acronym": bool(ACRONYM_RE.fullmatch(text)),
-        "has_filter": any(t in FILTER_WORDS for t in tokens),
-        "is_question": text.endswith("?"),
-        "abstract": any(phrase in text_lower for phrase in ABSTRACT_WORDS),
-        "token_len": len(tokens),
-    }
-
-    return features
-
 def choose_weights(f: dict) -> dict:
     '''
     Choose qdrant and es RRF weights based on query type
@@ -82,6 +58,46 @@ def choose_weights(f: dict) -> dict:
     # 6. Domyślne
     return {"es": 0.55, "qdrant": 0.45}
 
+# Engines weighted below this are not queried at all
+SKIP_WEIGHT = 0.15
+MIN_DEPTH = 5
+DEFAULT_DEPTH = {"qdrant": 35, "es": 35, "fused": 15}
+
+def choose_depth(f: dict, weights: dict) -> dict:
+    '''
+    Candidates fetched per engine (0 = engine skipped) and fused documents kept, based on query type.
+    The stronger engine gets the full depth, the weaker one proportionally less.
+    '''
+    # lookup (ID / akronim): jeden trafiony dokument zwykle wystarcza
+    if f["is_acronym"] or f["has_id"]:
+        max_depth, fused = 10, 5
+    # fakty / liczby
+    elif f["has_number"] or f["has_year"]:
+        max_depth, fused = 20, 10
+    # pozostałe: pełny kontekst
+    else:
+        max_depth, fused = 35, 15
+
+    top = max(weights.values())
+    depth = {
+        engine: 0 if weight < SKIP_WEIGHT else max(MIN_DEPTH, round(max_depth * weight / top))
+        for engine, weight in weights.items()
+    }
+    depth["fused"] = fused
+    return depth
+
+
+def scale_depth(depth: dict, scale: float) -> dict:
+    '''
+    Depths shrunk by `scale` for cheaper requests, skipped engines stay skipped
+    '''
+    if scale == 1.0:
+        return depth
+    return {
+        key: 0 if not value else max(1 if key == "fused" else MIN_DEPTH, round(value * scale))
+        for key, value in depth.items()
+    }
+
 
 def embed(text: str, transformer_model: SentenceTransformer):
     return transformer_model.encode(text, normalize_embeddings=True, convert_to_numpy=True)
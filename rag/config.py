@@ -1,12 +1,77 @@
 from dotenv import load_dotenv
 import os
+import platform
 from pathlib import Path
 
 load_dotenv()
 
 OLLAMA_MODEL_NAME = os.getenv('OLLAMA_MODEL_NAME', 'gemma2:2b')
 TRANSFORMER_MODEL_NAME = os.getenv('TRANSFORMER_MODEL_NAME', 'intfloat/multilingual-e5-small')
+# Query encoder backend: "torch" (sentence-transformers), "onnx" (exported graph on ONNX Runtime, CPU) or
+# "onnx-int8" (dynamically quantized int8 graph); onnx needs optimum[onnxruntime], exported once to ENCODER_ONNX_DIR
+ENCODER_BACKEND = os.getenv('ENCODER_BACKEND', 'torch')
+ENCODER_ONNX_DIR = Path(os.getenv('ENCODER_ONNX_DIR', Path(__file__).resolve().parent / "data" / "onnx"))
+# int8 kernels the quantized graph is tuned for: avx2, avx512, avx512_vnni (x86) or arm64
+ENCODER_QUANTIZATION = os.getenv('ENCODER_QUANTIZATION',
+                                 'arm64' if platform.machine() in ('arm64', 'aarch64') else 'avx2')
 SPACY_MODEL_NAME = os.getenv('SPACY_MODEL_NAME', 'pl_core_news_sm')
+# nlp.pipe workers for batched spaCy work; >1 only pays off for bulk jobs (index builds, benchmarks)
+SPACY_N_PROCESS = int(os.getenv('SPACY_N_PROCESS', '1'))
+SPACY_BATCH_SIZE = int(os.getenv('SPACY_BATCH_SIZE', '64'))
+# Heuristic word lists used by analyze_query / detect_ambiguity_hybrid
+QUERY_LEXICON_PATH = Path(os.getenv('QUERY_LEXICON_PATH', Path(__file__).resolve().parent / "common" / "lexicon.json"))
+# Dense retrieval backend: "qdrant" or "local" (in-process index over a memory-mapped matrix, no Qdrant needed)
+VECTOR_BACKEND = os.getenv('VECTOR_BACKEND', 'qdrant')
+# Lexical retrieval backend: "es" or "local" (in-process BM25 over spaCy lemmas, no Elasticsearch needed)
+LEXICAL_BACKEND = os.getenv('LEXICAL_BACKEND', 'es')
+# How many analyzed query terms a document must match, ES minimum_should_match syntax
+ES_MINIMUM_SHOULD_MATCH = os.getenv('ES_MINIMUM_SHOULD_MATCH', '2<60%')
+# Single-engine hybrid search: "off" (dense + lexical backends above, fused in Python),
+# "es" (knn + match in one ES request) or "qdrant" (dense + sparse prefetch fused with RRF by Qdrant)
+HYBRID_SEARCH = os.getenv('HYBRID_SEARCH', 'off')
+# "rrf" needs an Enterprise / trial ES license, "linear" (weighted score sum) works on basic
+ES_HYBRID_FUSION = os.getenv('ES_HYBRID_FUSION', 'rrf')
+ES_HYBRID_NUM_CANDIDATES = int(os.getenv('ES_HYBRID_NUM_CANDIDATES', '100'))
+# Retrieval depth from query type (choose_depth) and skipping the weaker engine when
+# the stronger one's top hit leads the runner-up by this relative margin (0 disables)
+ADAPTIVE_RETRIEVAL = os.getenv('ADAPTIVE_RETRIEVAL', 'true').lower() == 'true'
+EARLY_EXIT_MARGIN_ES = float(os.getenv('EARLY_EXIT_MARGIN_ES', '0.5'))
+EARLY_EXIT_MARGIN_QDRANT = float(os.getenv('EARLY_EXIT_MARGIN_QDRANT', '0.1'))
+# Near-duplicate documents (MinHash Jaccard estimate >= threshold) are indexed once, 0 disables
+DEDUP_THRESHOLD = float(os.getenv('DEDUP_THRESHOLD', '0.8')) or None
+# Retrieved chunks whose word 3-grams are mostly (containment >= threshold) in a better-ranked
+# chunk are left out of the prompt, 0 disables
+CHUNK_DEDUP_THRESHOLD = float(os.getenv('CHUNK_DEDUP_THRESHOLD', '0.7'))
+# Chunks in the prompt are limited to CONTEXT_TOKEN_BUDGET tokens of the answering model, counted with
+# LLM_TOKENIZER (tokenizer.json path or Hugging Face repo id of OLLAMA_MODEL_NAME, regex tokens when empty)
+LLM_TOKENIZER = os.getenv('LLM_TOKENIZER', '') or None
+CONTEXT_TOKEN_BUDGET = int(os.getenv('CONTEXT_TOKEN_BUDGET', '250'))
+# Keeps the model loaded between bursts (Ollama duration, "-1" = forever); num_ctx 0 = sized to
+# CONTEXT_TOKEN_BUDGET; warmup loads the model and caches the system prompt at startup
+OLLAMA_KEEP_ALIVE = os.getenv('OLLAMA_KEEP_ALIVE', '30m')
+OLLAMA_NUM_CTX = int(os.getenv('OLLAMA_NUM_CTX', '0'))
+OLLAMA_WARMUP = os.getenv('OLLAMA_WARMUP', 'true').lower() == 'true'
+# Both local backends keep their files here (vectors/, bm25/)
+LOCAL_INDEX_DIR = Path(os.getenv('LOCAL_INDEX_DIR', Path(__file__).resolve().parent / "data" / "local_index"))
+LOCAL_VECTOR_BLOCK_SIZE = int(os.getenv('LOCAL_VECTOR_BLOCK_SIZE', '65536'))
+LOCAL_VECTOR_HNSW = os.getenv('LOCAL_VECTOR_HNSW', 'false').lower() == 'true' # requires hnswlib
+LOCAL_VECTOR_HNSW_EF = int(os.getenv('LOCAL_VECTOR_HNSW_EF', '64'))
+# Qdrant storage / search trade-offs: quantization none|scalar|binary, original vectors on disk
+QDRANT_QUANTIZATION = os.getenv('QDRANT_QUANTIZATION', 'none')
+QDRANT_ON_DISK = os.getenv('QDRANT_ON_DISK', 'false').lower() == 'true'
+QDRANT_HNSW_M = int(os.getenv('QDRANT_HNSW_M', '16'))
+QDRANT_HNSW_EF_CONSTRUCT = int(os.getenv('QDRANT_HNSW_EF_CONSTRUCT', '100'))
+QDRANT_HNSW_EF = int(os.getenv('QDRANT_HNSW_EF')) if os.getenv('QDRANT_HNSW_EF') else None
+QDRANT_OVERSAMPLING = float(os.getenv('QDRANT_OVERSAMPLING')) if os.getenv('QDRANT_OVERSAMPLING') else None
+QDRANT_RESCORE = os.getenv('QDRANT_RESCORE', 'true').lower() == 'true'
+# Per-call timeout (s) and retries on connection errors / overload for ES / Qdrant
+BACKEND_TIMEOUT = float(os.getenv('BACKEND_TIMEOUT', '10'))
+BACKEND_MAX_RETRIES = int(os.getenv('BACKEND_MAX_RETRIES', '2'))
+ES_HTTP_COMPRESS = os.getenv('ES_HTTP_COMPRESS', 'false').lower() == 'true'
+# Qdrant over gRPC (protobuf, one multiplexed channel) instead of REST/JSON; compression gzips gRPC messages
+QDRANT_PREFER_GRPC = os.getenv('QDRANT_PREFER_GRPC', 'false').lower() == 'true'
+QDRANT_GRPC_PORT = int(os.getenv('QDRANT_GRPC_PORT', '6334'))
+QDRANT_GRPC_COMPRESS = os.getenv('QDRANT_GRPC_COMPRESS', 'false').lower() == 'true'
 QDRANT_INDEX_NAME = os.getenv('QDRANT_INDEX_NAME', 'culturax')
 ES_INDEX_NAME = os.getenv('ES_INDEX_NAME', 'culturax')
 
@@ -24,6 +89,43 @@ DATA_FILE_NAME = os.getenv('DATA_FILE_NAME', 'culturax_vectors.ndjson')
 es_url = os.getenv("ES_URL", "http://elasticsearch:9200")
 qdrant_url = os.getenv("QDRANT_URL", "http://qdrant:6333")
 ollama_host = os.getenv("OLLAMA_HOST", "http://ollama:11434")
+# Comma separated Ollama hosts are load balanced (least requests in flight, at most
+# OLLAMA_MAX_CONCURRENCY each, failing hosts ejected); OLLAMA_HOST alone when empty
+ollama_hosts = [h.strip() for h in os.getenv("OLLAMA_HOSTS", "").split(",") if h.strip()] or [ollama_host]
+OLLAMA_MAX_CONCURRENCY = int(os.getenv('OLLAMA_MAX_CONCURRENCY', '4'))
+# Server worker processes (gunicorn.conf.py). With WEB_PRELOAD models and indexes load once in the master
+# and are shared copy-on-write, otherwise every worker loads its own; per-process limits below are split
+WEB_WORKERS = max(1, int(os.getenv('WEB_WORKERS', '1')))
+WEB_PRELOAD = os.getenv('WEB_PRELOAD', 'true').lower() == 'true'
+# torch / BLAS / OpenMP threads per worker for embeddings, spaCy and numpy, 0 = cores / WEB_WORKERS
+WORKER_THREADS = int(os.getenv('WORKER_THREADS', '0')) or max(1, (os.cpu_count() or 1) // WEB_WORKERS)
+# Ollama calls in flight per host from this worker, the host's slots shared by all workers
+OLLAMA_WORKER_CONCURRENCY = max(1, -(-OLLAMA_MAX_CONCURRENCY // WEB_WORKERS))
+# native thread pools read these when they load; effective when config is imported before torch / numpy (gunicorn.conf.py)
+NATIVE_THREAD_VARS = ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS", "NUMEXPR_NUM_THREADS",
+                      "VECLIB_MAXIMUM_THREADS")
+for _var in NATIVE_THREAD_VARS:
+    os.environ.setdefault(_var, str(WORKER_THREADS))
+# requests already run in parallel, no extra Hugging Face tokenizer threads
+os.environ.setdefault("TOKENIZERS_PARALLELISM", "false")
+# Clarification / decomposition may use a smaller model on their own hosts (main ones when empty)
+PLANNER_MODEL_NAME = os.getenv('PLANNER_MODEL_NAME', '') or None
+planner_hosts = [h.strip() for h in os.getenv("PLANNER_HOSTS", "").split(",") if h.strip()] or None
+# /ask admission per worker: requests processed at once (0 = no limit), more wait in a queue of MAX_QUEUED_REQUESTS
+# (then 429); each has REQUEST_DEADLINE_MS unless the caller sends its own (X-Deadline-Ms / deadline_ms)
+MAX_CONCURRENT_REQUESTS = int(os.getenv('MAX_CONCURRENT_REQUESTS', str(2 * OLLAMA_WORKER_CONCURRENCY * len(ollama_hosts))))
+MAX_QUEUED_REQUESTS = int(os.getenv('MAX_QUEUED_REQUESTS', str(4 * max(MAX_CONCURRENT_REQUESTS, 1))))
+REQUEST_DEADLINE_MS = int(os.getenv('REQUEST_DEADLINE_MS', '60000'))
+# Pipeline profile per request: "auto" picks full / fast (no LLM clarification, no decomposition,
+# 3/4 retrieval depth) / minimal (also half depth, no retries) from the load; a profile name pins it.
+# Thresholds on requests waiting for admission and on the expected latency of a new request, 0 disables
+PIPELINE_PROFILE = os.getenv('PIPELINE_PROFILE', 'auto')
+PROFILE_FAST_QUEUE = int(os.getenv('PROFILE_FAST_QUEUE', str(max(MAX_QUEUED_REQUESTS // 4, 1))))
+PROFILE_MINIMAL_QUEUE = int(os.getenv('PROFILE_MINIMAL_QUEUE', str(max(MAX_QUEUED_REQUESTS // 2, 2))))
+PROFILE_FAST_LATENCY_MS = float(os.getenv('PROFILE_FAST_LATENCY_MS', str(REQUEST_DEADLINE_MS / 4)))
+PROFILE_MINIMAL_LATENCY_MS = float(os.getenv('PROFILE_MINIMAL_LATENCY_MS', str(REQUEST_DEADLINE_MS / 2)))
+# Keep-alive connections to ES / Qdrant per process, one per request processed at once
+BACKEND_CONNECTIONS = int(os.getenv('BACKEND_CONNECTIONS', str(MAX_CONCURRENT_REQUESTS or 16)))
 
 PROMPT_CORES_LIST = [
     """Twoim zadaniem jest odpowiedzieć na pytanie WYŁĄCZNIE na podstawie fragmentów poniżej.
@@ -45,4 +147,15 @@ Zasady:
 "Jesteś asystentem, który odpowiada na pytania wyłącznie na podstawie dostarczonych fragmentów."
 ]
 
-RETRY_STRATEGIES_LIST_DEFAULT = ["change_interpretation", "modify_prompt", "save_to_memory"]
\ No newline at end of file
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+LOG_MAX_FIELD_CHARS = int(os.getenv("LOG_MAX_FIELD_CHARS", "300"))
+
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "0.1"))
+TRACE_BUFFER_SIZE = int(os.getenv("TRACE_BUFFER_SIZE", "1000"))
+TRACE_EXPORT_PATH = os.getenv("TRACE_EXPORT_PATH") # OTLP/JSON lines, disabled when unset
+# Sampled traces of all server workers (a file each), so /debug/traces/{id} works on any worker;
+# gunicorn.conf.py uses a fresh temporary directory when unset and WEB_WORKERS > 1
+TRACE_SHARED_DIR = os.getenv("TRACE_SHARED_DIR")
+
+# tuple: the default is shared by every request, each one gets its own copy
+RETRY_STRATEGIES_LIST_DEFAULT = ("change_interpretation", "modify_prompt", "save_to_memory")
\ No newline at end of file
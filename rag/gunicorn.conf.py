@@ -0,0 +1,63 @@
+"""
+Several server processes sharing one copy of the models:
+    gunicorn -c gunicorn.conf.py main:app        (WEB_WORKERS workers, WEB_PRELOAD, see config.py)
+
+With preload_app the master imports main.py once. The SentenceTransformer, spaCy pipelines,
+lexicon and local indexes are loaded, and ES / Qdrant populated, before the workers fork;
+the workers share those pages copy-on-write instead of loading a copy each. The master
+closes its connections and freezes the objects it created out of the garbage collector
+(whose bookkeeping writes would copy the pages), every worker opens its own connections
+and caps its torch / BLAS threads at WORKER_THREADS. An ONNX Runtime encoder
+(ENCODER_BACKEND=onnx*) is not fork-safe: the master drops it, every worker loads its own.
+Metrics of all workers are summed through PROMETHEUS_MULTIPROC_DIR and sampled traces are
+shared through TRACE_SHARED_DIR.
+"""
+import gc
+import os
+import shutil
+import tempfile
+
+# before anything imports torch / numpy / prometheus_client;
+# not as `config`, gunicorn reads module-level names of this file as settings
+import config as app_config
+
+if app_config.WEB_WORKERS > 1:
+    metrics_dir = os.environ.setdefault("PROMETHEUS_MULTIPROC_DIR", tempfile.mkdtemp(prefix="rag_metrics_"))
+    # samples of a previous run would be summed in
+    shutil.rmtree(metrics_dir, ignore_errors=True)
+    os.makedirs(metrics_dir)
+    # a trace is looked up on whichever worker gets /debug/traces, not only the one that recorded it
+    app_config.TRACE_SHARED_DIR = app_config.TRACE_SHARED_DIR or tempfile.mkdtemp(prefix="rag_traces_")
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8000')}"
+workers = app_config.WEB_WORKERS
+worker_class = "uvicorn_worker.UvicornWorker"
+preload_app = app_config.WEB_PRELOAD
+
+
+def when_ready(server):
+    if not server.cfg.preload_app:
+        return
+    import main
+
+    main.rag.close()
+    # a dropped ONNX Runtime encoder session must be gone before the workers fork
+    gc.collect()
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    if not server.cfg.preload_app:
+        return
+    import main
+    from common import limit_threads
+
+    main.rag.connect()
+    limit_threads(app_config.WORKER_THREADS)
+
+
+def child_exit(server, worker):
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+
+        multiprocess.mark_process_dead(worker.pid)
@@ -1,13 +1,34 @@
-from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel
-from typing import List
+from fastapi import FastAPI, Header, HTTPException, Response
+from fastapi.concurrency import run_in_threadpool
+from prometheus_client import CONTENT_TYPE_LATEST
+from pydantic import BaseModel, Field
+from typing import List, Literal
+import time
 import os
 
 from rag import RAG
 import config
 from memory.unresolved_memory import UnresolvedQueriesMemory
+from common import (
+    AdmissionController,
+    AsyncSingleFlight,
+    PipelineProfile,
+    ProfileSelector,
+    Rejected,
+    DeadlineExceeded,
+    deadline_scope,
+    normalize_query,
+    limit_threads,
+)
+from observability import configure_tracing, start_trace, get_trace, setup_logging, get_logger, render_metrics
+
+setup_logging(config.LOG_LEVEL, config.LOG_MAX_FIELD_CHARS)
+logger = get_logger(__name__)
+limit_threads(config.WORKER_THREADS)
 
 app = FastAPI()
+configure_tracing(config.TRACE_SAMPLE_RATE, config.TRACE_BUFFER_SIZE, config.TRACE_EXPORT_PATH,
+                  config.TRACE_SHARED_DIR)
 memory = UnresolvedQueriesMemory(storage_path=config.UNRESOLVED_STORAGE_PATH)
 
 FULL_DATA_PATH = os.path.join('data', config.DATA_FILE_NAME)
@@ -21,23 +42,124 @@ rag = RAG(
     config.SPACY_MODEL_NAME,
     config.QDRANT_INDEX_NAME,
     config.ES_INDEX_NAME,
+    encoder_backend=config.ENCODER_BACKEND,
+    encoder_onnx_dir=config.ENCODER_ONNX_DIR,
+    encoder_quantization=config.ENCODER_QUANTIZATION,
+    encoder_threads=config.WORKER_THREADS,
     es_url=config.es_url,
     qdrant_url=config.qdrant_url,
-    ollama_host=config.ollama_host
+    backend_connections=config.BACKEND_CONNECTIONS,
+    backend_timeout=config.BACKEND_TIMEOUT,
+    backend_max_retries=config.BACKEND_MAX_RETRIES,
+    es_http_compress=config.ES_HTTP_COMPRESS,
+    qdrant_prefer_grpc=config.QDRANT_PREFER_GRPC,
+    qdrant_grpc_port=config.QDRANT_GRPC_PORT,
+    qdrant_grpc_compress=config.QDRANT_GRPC_COMPRESS,
+    ollama_host=config.ollama_host,
+    ollama_hosts=config.ollama_hosts,
+    ollama_max_concurrency=config.OLLAMA_WORKER_CONCURRENCY,
+    planner_model_name=config.PLANNER_MODEL_NAME,
+    planner_hosts=config.planner_hosts,
+    spacy_n_process=config.SPACY_N_PROCESS,
+    spacy_batch_size=config.SPACY_BATCH_SIZE,
+    vector_backend=config.VECTOR_BACKEND,
+    lexical_backend=config.LEXICAL_BACKEND,
+    es_minimum_should_match=config.ES_MINIMUM_SHOULD_MATCH,
+    hybrid_search=config.HYBRID_SEARCH,
+    es_hybrid_fusion=config.ES_HYBRID_FUSION,
+    es_hybrid_num_candidates=config.ES_HYBRID_NUM_CANDIDATES,
+    adaptive_retrieval=config.ADAPTIVE_RETRIEVAL,
+    early_exit_margin_es=config.EARLY_EXIT_MARGIN_ES,
+    early_exit_margin_qdrant=config.EARLY_EXIT_MARGIN_QDRANT,
+    qdrant_quantization=config.QDRANT_QUANTIZATION,
+    qdrant_on_disk=config.QDRANT_ON_DISK,
+    qdrant_hnsw_m=config.QDRANT_HNSW_M,
+    qdrant_hnsw_ef_construct=config.QDRANT_HNSW_EF_CONSTRUCT,
+    qdrant_hnsw_ef=config.QDRANT_HNSW_EF,
+    qdrant_oversampling=config.QDRANT_OVERSAMPLING,
+    qdrant_rescore=config.QDRANT_RESCORE,
+    local_index_dir=config.LOCAL_INDEX_DIR,
+    local_vector_block_size=config.LOCAL_VECTOR_BLOCK_SIZE,
+    local_vector_hnsw=config.LOCAL_VECTOR_HNSW,
+    local_vector_hnsw_ef=config.LOCAL_VECTOR_HNSW_EF,
+    dedup_threshold=config.DEDUP_THRESHOLD,
+    chunk_dedup_threshold=config.CHUNK_DEDUP_THRESHOLD,
+    llm_tokenizer=config.LLM_TOKENIZER,
+    context_token_budget=config.CONTEXT_TOKEN_BUDGET,
+    ollama_keep_alive=config.OLLAMA_KEEP_ALIVE,
+    ollama_num_ctx=config.OLLAMA_NUM_CTX,
+    ollama_warmup=config.OLLAMA_WARMUP
 )
 
+admission = AdmissionController(config.MAX_CONCURRENT_REQUESTS, config.MAX_QUEUED_REQUESTS)
+# rejection / timeout of the leader is its own (priority, deadline), a follower then tries itself
+asks = AsyncSingleFlight("ask", retry_on=(Rejected, DeadlineExceeded))
+profiles = ProfileSelector(
+    fast_queue=config.PROFILE_FAST_QUEUE,
+    minimal_queue=config.PROFILE_MINIMAL_QUEUE,
+    fast_latency_ms=config.PROFILE_FAST_LATENCY_MS,
+    minimal_latency_ms=config.PROFILE_MINIMAL_LATENCY_MS,
+    forced=None if config.PIPELINE_PROFILE == "auto" else config.PIPELINE_PROFILE
+)
+
+Priority = Literal["high", "normal", "low"]
+
 class RagInfo(BaseModel):
-    retry_strats: List[str] | None = config.RETRY_STRATEGIES_LIST_DEFAULT
+    retry_strats: List[str] | None = Field(default_factory=lambda: list(config.RETRY_STRATEGIES_LIST_DEFAULT))
+    # override the X-Priority / X-Deadline-Ms headers
+    priority: Priority | None = None
+    deadline_ms: int | None = None
+    # a cheaper pipeline than the load would pick
+    profile: Literal["full", "fast", "minimal"] | None = None
+
+def answer(query: str, retry_strategies: List[str], deadline: float | None, profile: PipelineProfile):
+    with deadline_scope(deadline), start_trace("ask", query=query, pipeline=profile.name) as trace_id:
+        res = rag.full_rag_process(query, retry_strategies, pipeline=profile)
+    return {"model_answer": res, "profile": profile.name, "trace_id": trace_id}
 
 @app.post("/ask")
-async def run_rag(query: str, info: RagInfo):
-    print(info.retry_strats)
+async def run_rag(query: str,
+                  info: RagInfo,
+                  x_priority: Priority | None = Header(None),
+                  x_deadline_ms: int | None = Header(None)):
+    logger.debug("Strategie ponawiania", retry_strategies=info.retry_strats)
     if info.retry_strats:
         retry_strategies = info.retry_strats
     else:
         retry_strategies = []
-    res = rag.full_rag_process(query, retry_strategies)
-    return {"model_answer": res}
+    priority = info.priority or x_priority or "normal"
+    deadline_ms = info.deadline_ms or x_deadline_ms or config.REQUEST_DEADLINE_MS
+    deadline = time.monotonic() + deadline_ms / 1000.0 if deadline_ms > 0 else None
+
+    async def process():
+        async with admission.slot(priority, deadline):
+            # load seen when the request starts: requests still queued behind it, expected latency
+            profile = profiles.choose(admission.queued, admission.expected_latency(), info.profile)
+            # blocking pipeline in a worker thread, the event loop keeps queueing and shedding
+            return await run_in_threadpool(answer, query, retry_strategies, deadline, profile)
+
+    # identical questions in flight share one run (its admission slot, answer or pipeline error)
+    key = (normalize_query(query), tuple(retry_strategies), info.profile)
+    try:
+        response, coalesced = await asks.do(key, process, None if deadline is None else deadline - time.monotonic())
+    except Rejected as e:
+        # pełna kolejka: 429, nie zdąży przed terminem: 503
+        status = 503 if e.reason == "deadline" else 429
+        raise HTTPException(status_code=status, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+    except DeadlineExceeded as e:
+        raise HTTPException(status_code=504, detail=str(e))
+    return {**response, "coalesced": coalesced}
+
+@app.get("/metrics")
+async def metrics():
+    return Response(render_metrics(), media_type=CONTENT_TYPE_LATEST)
+
+@app.get("/debug/traces/{trace_id}")
+async def get_trace_by_id(trace_id: str):
+    trace = get_trace(trace_id)
+    if not trace:
+        raise HTTPException(status_code=404, detail="Trace not found or not sampled")
+    return trace.tree()
 
 @app.get("/pending")
 async def get_pending_queries():
@@ -1,66 +1,91 @@
+from contextlib import contextmanager
 from pathlib import Path
 import json
 from typing import Dict, List
 from datetime import datetime
+import threading
+import fcntl
 
 class UnresolvedQueriesMemory:
     def __init__(self, storage_path: str = "unresolved_queries.json"):
         self.storage_path = Path(storage_path)
+        # requests run on a thread pool: id assignment, the list and the file change together
+        self._lock = threading.Lock()
+        # server workers share the file: flock across processes, state reloaded under it
+        self._lock_path = self.storage_path.with_name(self.storage_path.name + ".lock")
+        print(f"[INFO] - Memory saving queries to {self.storage_path}")
         self.queries = self._load_queries()
         self.next_id = max([q['id'] for q in self.queries], default=0) + 1
 
+    @contextmanager
+    def _locked(self):
+        with self._lock, open(self._lock_path, 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                self.queries = self._load_queries()
+                self.next_id = max([q['id'] for q in self.queries], default=0) + 1
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
     def _load_queries(self) -> List[str]:
-        print(f"[INFO] - Memory saving queries to {self.storage_path}")
         if self.storage_path.exists():
             with open(self.storage_path, 'r') as f:
                 return json.load(f)
         return []
 
     def _save_queries(self):
-
-        with open(self.storage_path, 'w') as f:
+        # caller holds _locked(); write-then-rename, readers never see a half written file
+        tmp_path = self.storage_path.with_name(self.storage_path.name + ".tmp")
+        with open(tmp_path, 'w') as f:
             json.dump(self.queries, f, ensure_ascii=True, indent=2)
+        tmp_path.replace(self.storage_path)
 
     def add_query(self, query: str):
-        query_entry = {
-            "id": self.next_id,
-            "query": query,
-            "status": "pending",
-            "timestamp": datetime.now().isoformat()
-        }
-
-        self.queries.append(query_entry)
-        self._save_queries()
+        with self._locked():
+            query_id = self.next_id
+            self.next_id += 1
+            query_entry = {
+                "id": query_id,
+                "query": query,
+                "status": "pending",
+                "timestamp": datetime.now().isoformat()
+            }
 
-        query_id = self.next_id
-        self.next_id += 1
+            self.queries.append(query_entry)
+            self._save_queries()
         return query_id
     
     def get_pending_queries(self):
-        return [q for q in self.queries if q["status"] == "pending"]
+        with self._locked():
+            return [dict(q) for q in self.queries if q["status"] == "pending"]
     
     def mark_as_resolved(self, query_id: str):
-        for query in self.queries:
-            if query['id'] == query_id:
-                query['status'] = "resolved"
-                query['resolved_at'] = datetime.now().isoformat()
-                self._save_queries()
-                return True
+        with self._locked():
+            for query in self.queries:
+                if query['id'] == query_id:
+                    query['status'] = "resolved"
+                    query['resolved_at'] = datetime.now().isoformat()
+                    self._save_queries()
+                    return True
         return False
 
     def get_statistics(self) -> Dict:
-        pending = [q for q in self.queries if q['status'] == 'pending']                    
-        resolved = [q for q in self.queries if q['status'] == 'resolved']
+        with self._locked():
+            total = len(self.queries)
+            pending = [q for q in self.queries if q['status'] == 'pending']                    
+            resolved = [q for q in self.queries if q['status'] == 'resolved']
 
         return {
-            "total": len(self.queries),
+            "total": total,
             "pending": len(pending),
             "resolved": len(resolved)
         }
     
     def clear_resolved(self):
-        self.queries = [q for q in self.queries if q["status"] == "pending"]
-        self._save_queries()
+        with self._locked():
+            self.queries = [q for q in self.queries if q["status"] == "pending"]
+            self._save_queries()
 
     def should_save_as_unresolved(
             self, 
@@ -0,0 +1,68 @@
+
+from .metrics import (
+    stage,
+    expected_stage_seconds,
+    query_kind,
+    set_query_kind,
+    current_query_kind,
+    record_cache,
+    record_llm_usage,
+    record_retry,
+    record_engine_skip,
+    record_llm_host,
+    record_memory_save,
+    record_admission,
+    record_stage_skip,
+    record_pipeline_profile,
+    record_coalesced,
+    render_metrics,
+    INFLIGHT_REQUESTS,
+    QUEUED_REQUESTS,
+    REQUESTS,
+    REQUEST_SECONDS,
+)
+from .tracing import (
+    start_trace,
+    span,
+    annotate,
+    configure_tracing,
+    get_trace,
+    current_trace_id,
+)
+from .logs import (
+    setup_logging,
+    get_logger,
+    bind_query,
+)
+
+__all__ = [
+    "stage",
+    "expected_stage_seconds",
+    "query_kind",
+    "set_query_kind",
+    "current_query_kind",
+    "record_cache",
+    "record_llm_usage",
+    "record_retry",
+    "record_engine_skip",
+    "record_llm_host",
+    "record_memory_save",
+    "record_admission",
+    "record_stage_skip",
+    "record_pipeline_profile",
+    "record_coalesced",
+    "render_metrics",
+    "INFLIGHT_REQUESTS",
+    "QUEUED_REQUESTS",
+    "REQUESTS",
+    "REQUEST_SECONDS",
+    "start_trace",
+    "span",
+    "annotate",
+    "configure_tracing",
+    "get_trace",
+    "current_trace_id",
+    "setup_logging",
+    "get_logger",
+    "bind_query",
+]
\ No newline at end of file
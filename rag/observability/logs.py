@@ -0,0 +1,123 @@
+from logging.handlers import QueueHandler, QueueListener
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from typing import Optional
+import hashlib
+import logging
+import queue
+import atexit
+import json
+import sys
+import os
+
+from .tracing import current_trace_id
+
+_query_hash: ContextVar[Optional[str]] = ContextVar("query_hash", default=None)
+_listener: Optional[QueueListener] = None
+_RESERVED_KWARGS = {"exc_info", "stack_info", "stacklevel", "extra"}
+
+
+def bind_query(query: str) -> str:
+    '''
+    Attach a short hash of the query to every log record of the current request
+    '''
+    digest = hashlib.sha1(query.encode("utf-8")).hexdigest()[:12]
+    _query_hash.set(digest)
+    return digest
+
+
+class RequestContextFilter(logging.Filter):
+    '''
+    Runs in the calling thread, before the record is queued, so contextvars are still visible
+    '''
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.trace_id = current_trace_id()
+        record.query_hash = _query_hash.get()
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+
+    def __init__(self, max_field_chars: int = 300):
+        super().__init__()
+        self.max_field_chars = max_field_chars
+
+    def _truncate(self, value):
+        if isinstance(value, str) and len(value) > self.max_field_chars:
+            return f"{value[:self.max_field_chars]}...[+{len(value) - self.max_field_chars}]"
+        if isinstance(value, (list, tuple)):
+            return [self._truncate(v) for v in value[:20]]
+        if isinstance(value, dict):
+            return {k: self._truncate(v) for k, v in value.items()}
+        return value
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": self._truncate(record.getMessage()),
+        }
+        if getattr(record, "trace_id", None):
+            entry["trace_id"] = record.trace_id
+        if getattr(record, "query_hash", None):
+            entry["query_hash"] = record.query_hash
+        for key, value in getattr(record, "fields", {}).items():
+            entry[key] = self._truncate(value)
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class _FastQueueHandler(QueueHandler):
+    '''
+    Enqueue the record as is; formatting and truncation happen on the writer thread
+    '''
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+class FieldsLogger(logging.LoggerAdapter):
+    '''
+    logger.info("msg", key=value) -> structured fields, skipped entirely when level is disabled
+    '''
+
+    def process(self, msg, kwargs):
+        fields = {k: kwargs.pop(k) for k in list(kwargs) if k not in _RESERVED_KWARGS}
+        kwargs.setdefault("extra", {})["fields"] = fields
+        return msg, kwargs
+
+
+def get_logger(name: str) -> FieldsLogger:
+    return FieldsLogger(logging.getLogger(f"rag.{name}"), {})
+
+
+def setup_logging(level: str = "INFO", max_field_chars: int = 300, stream=None):
+    '''
+    Route `rag.*` loggers through a queue to a background writer emitting JSON lines
+    '''
+    global _listener
+    if _listener is not None:
+        return _listener
+
+    writer = logging.StreamHandler(stream or sys.stderr)
+    writer.setFormatter(JsonFormatter(max_field_chars))
+
+    log_queue = queue.SimpleQueue()
+    handler = _FastQueueHandler(log_queue)
+    handler.addFilter(RequestContextFilter())
+
+    root = logging.getLogger("rag")
+    root.setLevel(level.upper())
+    root.addHandler(handler)
+    root.propagate = False
+
+    _listener = QueueListener(log_queue, writer, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop)
+    # the writer thread doesn't survive fork (preloaded server workers): drain the queue
+    # before forking, so records aren't written twice, and start a writer on both sides
+    os.register_at_fork(before=_listener.stop, after_in_parent=_listener.start, after_in_child=_listener.start)
+    return _listener
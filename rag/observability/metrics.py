@@ -0,0 +1,160 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from time import perf_counter
+import threading
+import os
+
+from prometheus_client import CollectorRegistry, Counter, Gauge, Histogram, generate_latest, multiprocess
+
+from .tracing import span
+
+STAGE_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+STAGE_SECONDS = Histogram(
+    "rag_stage_duration_seconds",
+    "Duration of a single RAG pipeline stage",
+    ["stage", "query_kind"],
+    buckets=STAGE_BUCKETS,
+)
+REQUEST_SECONDS = Histogram(
+    "rag_request_duration_seconds",
+    "Duration of full_rag_process",
+    ["query_kind"],
+    buckets=STAGE_BUCKETS,
+)
+REQUESTS = Counter("rag_requests_total", "Processed RAG requests", ["query_kind"])
+RETRIES = Counter("rag_retries_total", "Retry attempts per strategy", ["strategy", "query_kind"])
+MEMORY_SAVES = Counter("rag_memory_saves_total", "Queries saved to unresolved memory", ["query_kind"])
+CACHE_LOOKUPS = Counter("rag_cache_lookups_total", "Cache lookups by result (hit/miss)", ["cache", "result"])
+ENGINE_SKIPS = Counter("rag_engine_skips_total", "Retrieval engine calls skipped (low weight / decisive top hit)", ["engine", "reason", "query_kind"])
+LLM_TOKENS = Counter("rag_llm_tokens_total", "Tokens processed by the LLM", ["call", "kind"])
+LLM_HOST_CALLS = Counter("rag_llm_host_calls_total", "LLM calls per Ollama host by outcome", ["host", "outcome"])
+LLM_PREFILL_SECONDS = Histogram(
+    "rag_llm_prefill_seconds",
+    "Model load plus prompt evaluation reported by Ollama (time to first token)",
+    ["call"],
+    buckets=STAGE_BUCKETS,
+)
+ADMISSIONS = Counter("rag_admissions_total", "/ask requests by admission outcome", ["outcome", "priority"])
+PROFILE_REQUESTS = Counter("rag_pipeline_profile_total", "Requests by pipeline profile (full / fast / minimal)", ["profile"])
+COALESCED = Counter("rag_coalesced_total", "Calls by single-flight role: leader ran it, follower shared its result", ["scope", "role"])
+STAGE_SKIPS = Counter("rag_stage_skips_total", "Optional stages skipped for lack of time before the deadline", ["stage"])
+# livesum: with several server workers the total over the live ones
+INFLIGHT_REQUESTS = Gauge("rag_inflight_requests", "/ask requests being processed", multiprocess_mode="livesum")
+QUEUED_REQUESTS = Gauge("rag_queued_requests", "/ask requests waiting for admission", multiprocess_mode="livesum")
+
+_query_kind: ContextVar[str] = ContextVar("query_kind", default="unknown")
+# moving average of recent durations per stage, used to skip stages that can't meet a deadline
+_stage_estimates: dict = {}
+# stages finish concurrently on the request thread pool, the update is read-modify-write
+_stage_estimates_lock = threading.Lock()
+STAGE_ESTIMATE_ALPHA = 0.2
+
+
+def query_kind(features: dict) -> str:
+    '''
+    Collapse analyze_query features into a low-cardinality label,
+    following the same precedence as choose_weights
+    '''
+    if features["is_acronym"] or features["has_id"]:
+        return "lookup"
+    if features["has_number"] or features["has_year"]:
+        return "factual"
+    if features["has_filter"]:
+        return "filter"
+    if features["abstract"] or features["token_len"] <= 3:
+        return "abstract"
+    return "default"
+
+
+def set_query_kind(features: dict) -> str:
+    kind = query_kind(features)
+    _query_kind.set(kind)
+    return kind
+
+
+def current_query_kind() -> str:
+    return _query_kind.get()
+
+
+@contextmanager
+def stage(name: str, **attributes):
+    '''
+    Time a pipeline stage into the stage histogram and the active trace
+    '''
+    start = perf_counter()
+    try:
+        with span(name, **attributes) as current:
+            yield current
+    finally:
+        elapsed = perf_counter() - start
+        STAGE_SECONDS.labels(name, _query_kind.get()).observe(elapsed)
+        with _stage_estimates_lock:
+            previous = _stage_estimates.get(name)
+            _stage_estimates[name] = elapsed if previous is None else previous + STAGE_ESTIMATE_ALPHA * (elapsed - previous)
+
+
+def expected_stage_seconds(name: str, default: float = 0.0) -> float:
+    '''
+    Typical recent duration of a stage (exponential moving average), `default` before it ran
+    '''
+    return _stage_estimates.get(name, default)
+
+
+def record_cache(cache: str, hit: bool):
+    CACHE_LOOKUPS.labels(cache, "hit" if hit else "miss").inc()
+
+
+def record_llm_usage(call: str, response):
+    '''
+    Count prompt and completion tokens and time to first token reported by Ollama
+    '''
+    LLM_TOKENS.labels(call, "prompt").inc(response.get("prompt_eval_count") or 0)
+    LLM_TOKENS.labels(call, "completion").inc(response.get("eval_count") or 0)
+    prefill_ns = (response.get("load_duration") or 0) + (response.get("prompt_eval_duration") or 0)
+    if prefill_ns:
+        LLM_PREFILL_SECONDS.labels(call).observe(prefill_ns / 1e9)
+
+
+def record_retry(strategy: str):
+    RETRIES.labels(strategy, _query_kind.get()).inc()
+
+
+def record_engine_skip(engine: str, reason: str):
+    ENGINE_SKIPS.labels(engine, reason, _query_kind.get()).inc()
+
+
+def record_llm_host(host: str, outcome: str):
+    LLM_HOST_CALLS.labels(host, outcome).inc()
+
+
+def record_memory_save():
+    MEMORY_SAVES.labels(_query_kind.get()).inc()
+
+
+def record_admission(outcome: str, priority: str):
+    ADMISSIONS.labels(outcome, priority).inc()
+
+
+def record_stage_skip(stage: str):
+    STAGE_SKIPS.labels(stage).inc()
+
+
+def record_pipeline_profile(profile: str):
+    PROFILE_REQUESTS.labels(profile).inc()
+
+
+def record_coalesced(scope: str, role: str):
+    COALESCED.labels(scope, role).inc()
+
+
+def render_metrics() -> bytes:
+    '''
+    Prometheus text exposition. With PROMETHEUS_MULTIPROC_DIR set (several server workers)
+    every worker writes its samples there and any of them serves the sum.
+    '''
+    if not os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        return generate_latest()
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    return generate_latest(registry)
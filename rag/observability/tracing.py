@@ -0,0 +1,271 @@
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Dict, List, Optional
+import threading
+import secrets
+import random
+import json
+import time
+import os
+import re
+
+TRACE_ID_RE = re.compile(r"[0-9a-f]{32}")
+
+
+class Span:
+    '''
+    Timed unit of work, field names follow the OpenTelemetry span model
+    '''
+    __slots__ = ("trace_id", "span_id", "parent_span_id", "name", "start_ns", "end_ns", "attributes", "status")
+
+    def __init__(self, trace_id: str, name: str, parent_span_id: Optional[str] = None, attributes: Optional[Dict] = None):
+        self.trace_id = trace_id
+        self.span_id = secrets.token_hex(8)
+        self.parent_span_id = parent_span_id
+        self.name = name
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        self.attributes = dict(attributes or {})
+        self.status = "OK"
+
+    def set_attribute(self, key: str, value):
+        self.attributes[key] = value
+
+    def end(self):
+        self.end_ns = time.time_ns()
+
+    @property
+    def duration_ms(self) -> float:
+        end = self.end_ns or time.time_ns()
+        return (end - self.start_ns) / 1e6
+
+    def to_otlp(self) -> Dict:
+        '''
+        OTLP/JSON span representation
+        '''
+        span = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": 1,
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns or self.start_ns),
+            "attributes": [{"key": k, "value": _otlp_value(v)} for k, v in self.attributes.items()],
+            "status": {"code": 1 if self.status == "OK" else 2},
+        }
+        if self.parent_span_id:
+            span["parentSpanId"] = self.parent_span_id
+        return span
+
+
+def _otlp_value(value) -> Dict:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def _from_otlp_value(value: Dict):
+    kind, raw = next(iter(value.items()))
+    return int(raw) if kind == "intValue" else raw
+
+
+class Trace:
+    __slots__ = ("trace_id", "spans")
+
+    def __init__(self, trace_id: str):
+        self.trace_id = trace_id
+        self.spans: List[Span] = []
+
+    def tree(self) -> Dict:
+        '''
+        Nest spans under their parents, children ordered by start time
+        '''
+        nodes = {
+            s.span_id: {
+                "name": s.name,
+                "span_id": s.span_id,
+                "start_unix_ns": s.start_ns,
+                "duration_ms": round(s.duration_ms, 3),
+                "status": s.status,
+                "attributes": s.attributes,
+                "children": [],
+            }
+            for s in sorted(self.spans, key=lambda s: s.start_ns)
+        }
+        roots = []
+        for s in sorted(self.spans, key=lambda s: s.start_ns):
+            parent = nodes.get(s.parent_span_id)
+            (parent["children"] if parent else roots).append(nodes[s.span_id])
+        return {"trace_id": self.trace_id, "spans": len(self.spans), "roots": roots}
+
+    @classmethod
+    def from_otlp(cls, data: Dict) -> "Trace":
+        spans = [span for resource in data["resourceSpans"] for scope in resource["scopeSpans"] for span in scope["spans"]]
+        trace = cls(spans[0]["traceId"])
+        for otlp in spans:
+            attributes = {a["key"]: _from_otlp_value(a["value"]) for a in otlp["attributes"]}
+            span = Span(otlp["traceId"], otlp["name"], otlp.get("parentSpanId"), attributes)
+            span.span_id = otlp["spanId"]
+            span.start_ns = int(otlp["startTimeUnixNano"])
+            span.end_ns = int(otlp["endTimeUnixNano"])
+            span.status = "OK" if otlp["status"]["code"] == 1 else "ERROR"
+            trace.spans.append(span)
+        return trace
+
+    def to_otlp(self, service_name: str) -> Dict:
+        return {
+            "resourceSpans": [{
+                "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": service_name}}]},
+                "scopeSpans": [{"scope": {"name": "rag"}, "spans": [s.to_otlp() for s in self.spans]}],
+            }]
+        }
+
+
+class TraceStore:
+    '''
+    Bounded in-memory store of finished traces with optional OTLP/JSON lines file export.
+    With `shared_dir` (several server workers) every trace is also written there as
+    `<trace_id>.json`, so a worker finds traces another one recorded; each worker removes
+    its own files beyond `max_traces`.
+    '''
+
+    def __init__(self, max_traces: int = 1000, export_path: Optional[str] = None, service_name: str = "rag",
+                 shared_dir: Optional[str] = None):
+        self.max_traces = max_traces
+        self.export_path = export_path
+        self.service_name = service_name
+        self.shared_dir = Path(shared_dir) if shared_dir else None
+        if self.shared_dir:
+            self.shared_dir.mkdir(parents=True, exist_ok=True)
+        self._traces: OrderedDict = OrderedDict()
+        self._shared: deque = deque()
+        self._lock = threading.Lock()
+
+    def add(self, trace: Trace):
+        with self._lock:
+            self._traces[trace.trace_id] = trace
+            while len(self._traces) > self.max_traces:
+                self._traces.popitem(last=False)
+            if self.export_path:
+                with open(self.export_path, "a") as f:
+                    f.write(json.dumps(trace.to_otlp(self.service_name), ensure_ascii=False) + "\n")
+            if self.shared_dir:
+                self._write_shared(trace)
+
+    def _write_shared(self, trace: Trace):
+        path = self.shared_dir / f"{trace.trace_id}.json"
+        tmp = path.with_suffix(f".{os.getpid()}.tmp")
+        tmp.write_text(json.dumps(trace.to_otlp(self.service_name), ensure_ascii=False))
+        # readers in other workers never see a partial file
+        os.replace(tmp, path)
+        self._shared.append(path)
+        while len(self._shared) > self.max_traces:
+            self._shared.popleft().unlink(missing_ok=True)
+
+    def get(self, trace_id: str) -> Optional[Trace]:
+        with self._lock:
+            trace = self._traces.get(trace_id)
+        if trace or not self.shared_dir or not TRACE_ID_RE.fullmatch(trace_id):
+            return trace
+        # recorded by another worker
+        try:
+            return Trace.from_otlp(json.loads((self.shared_dir / f"{trace_id}.json").read_text()))
+        except FileNotFoundError:
+            return None
+
+
+class Tracer:
+
+    def __init__(self, sample_rate: float = 0.1, store: Optional[TraceStore] = None):
+        self.sample_rate = sample_rate
+        self.store = store or TraceStore()
+
+
+_tracer = Tracer()
+_current_trace_id: ContextVar[Optional[str]] = ContextVar("current_trace_id", default=None)
+_current_trace: ContextVar[Optional[Trace]] = ContextVar("current_trace", default=None)
+_current_span: ContextVar[Optional[Span]] = ContextVar("current_span", default=None)
+
+
+def configure_tracing(sample_rate: float, max_traces: int = 1000, export_path: Optional[str] = None,
+                      shared_dir: Optional[str] = None):
+    global _tracer
+    _tracer = Tracer(sample_rate, TraceStore(max_traces, export_path, shared_dir=shared_dir))
+    return _tracer
+
+
+def get_trace(trace_id: str) -> Optional[Trace]:
+    return _tracer.store.get(trace_id)
+
+
+def current_trace_id() -> Optional[str]:
+    return _current_trace_id.get()
+
+
+@contextmanager
+def start_trace(name: str, **attributes):
+    '''
+    Root span of a request. The trace id is always generated so it can be
+    returned to the caller, spans are only recorded when the trace is sampled.
+    '''
+    trace_id = secrets.token_hex(16)
+    id_token = _current_trace_id.set(trace_id)
+    if random.random() >= _tracer.sample_rate:
+        try:
+            yield trace_id
+        finally:
+            _current_trace_id.reset(id_token)
+        return
+
+    trace = Trace(trace_id)
+    root = Span(trace_id, name, attributes=attributes)
+    trace.spans.append(root)
+    trace_token = _current_trace.set(trace)
+    span_token = _current_span.set(root)
+    try:
+        yield trace_id
+    except BaseException:
+        root.status = "ERROR"
+        raise
+    finally:
+        root.end()
+        _current_span.reset(span_token)
+        _current_trace.reset(trace_token)
+        _current_trace_id.reset(id_token)
+        _tracer.store.add(trace)
+
+
+@contextmanager
+def span(name: str, **attributes):
+    trace = _current_trace.get()
+    if trace is None:
+        yield None
+        return
+
+    parent = _current_span.get()
+    current = Span(trace.trace_id, name, parent.span_id if parent else None, attributes)
+    trace.spans.append(current)
+    token = _current_span.set(current)
+    try:
+        yield current
+    except BaseException:
+        current.status = "ERROR"
+        raise
+    finally:
+        current.end()
+        _current_span.reset(token)
+
+
+def annotate(**attributes):
+    '''
+    Attach attributes to the active span, no-op when the request isn't sampled
+    '''
+    current = _current_span.get()
+    if current is not None:
+        current.attributes.update(attributes)
@@ -1,25 +1,51 @@
 from typing import List, Dict
-from sentence_transformers import SentenceTransformer
-from qdrant_client import QdrantClient
-from elasticsearch import Elasticsearch
-import spacy
-from ollama import Client
+import json
+from functools import partial
+from pathlib import Path
 
 from common import *
 
 from reasoning.validation import CitationValidator
 from reasoning.decomposition import decompose_query
-from reasoning.chunking import chunk_document
+from reasoning.chunking import chunk_documents
 from reasoning.filtering import filter_retrieved_with_stats
+from reasoning.redundancy import suppress_near_duplicates
+from reasoning.packing import pack_chunks
 from reasoning.clarification import *
-from reasoning.prompt import ask_model
+from reasoning.prompt import ask_model, llm_options, context_window
 
 from retrieval.elastic import search_es
 from retrieval.qdrant import search_qdrant
+from retrieval.local_vector import LocalVectorIndex, search_local_vectors
+from retrieval.local_bm25 import LocalBM25Index, search_local_bm25
+from retrieval.hybrid import search_es_hybrid, search_qdrant_hybrid
 from retrieval.fusion import rrf_fusion_weighted
 
 from memory.unresolved_memory import UnresolvedQueriesMemory
 
+from observability import (
+    stage,
+    span,
+    annotate,
+    set_query_kind,
+    bind_query,
+    get_logger,
+    record_retry,
+    record_engine_skip,
+    record_memory_save,
+    record_stage_skip,
+    record_pipeline_profile,
+    expected_stage_seconds,
+    REQUESTS,
+    REQUEST_SECONDS,
+)
+
+logger = get_logger(__name__)
+
+# stages every answer goes through after the optional clarification / decomposition
+ANSWER_STAGES = ("embed", "search_qdrant", "search_es", "search_hybrid", "chunking",
+                 "redundancy", "filtering", "packing", "ask_model")
+
 class RAG:
 
     def __init__(
@@ -35,9 +61,60 @@ class RAG:
             enable_decomposition: bool = True,
             es_url: str = "http://localhost:9200",
             qdrant_url: str = "http://localhost:6333",
-            ollama_host: str = "http://ollama:11434"
+            backend_connections: int = 16,
+            backend_timeout: float = 10.0,
+            backend_max_retries: int = 2,
+            es_http_compress: bool = False,
+            qdrant_prefer_grpc: bool = False,
+            qdrant_grpc_port: int = 6334,
+            qdrant_grpc_compress: bool = False,
+            ollama_host: str = "http://ollama:11434",
+            spacy_n_process: int = 1,
+            spacy_batch_size: int = 64,
+            vector_backend: str = "qdrant",
+            qdrant_quantization: str = "none",
+            qdrant_on_disk: bool = False,
+            qdrant_hnsw_m: int = 16,
+            qdrant_hnsw_ef_construct: int = 100,
+            qdrant_hnsw_ef: int | None = None,
+            qdrant_oversampling: float | None = None,
+            qdrant_rescore: bool = True,
+            lexical_backend: str = "es",
+            es_minimum_should_match: str = "2<60%",
+            hybrid_search: str = "off",
+            es_hybrid_fusion: str = "rrf",
+            es_hybrid_num_candidates: int = 100,
+            adaptive_retrieval: bool = True,
+            early_exit_margin_es: float = 0.5,
+            early_exit_margin_qdrant: float = 0.1,
+            local_index_dir: str = "data/local_index",
+            local_vector_block_size: int = 65536,
+            local_vector_hnsw: bool = False,
+            local_vector_hnsw_ef: int = 64,
+            dedup_threshold: float | None = 0.8,
+            chunk_dedup_threshold: float = 0.7,
+            llm_tokenizer: str | None = None,
+            context_token_budget: int = 250,
+            ollama_keep_alive: str | None = "30m",
+            ollama_num_ctx: int = 0,
+            ollama_warmup: bool = True,
+            ollama_hosts: List[str] | None = None,
+            ollama_max_concurrency: int = 4,
+            planner_model_name: str | None = None,
+            planner_hosts: List[str] | None = None,
+            encoder_backend: str = "torch",
+            encoder_onnx_dir: str = "data/onnx",
+            encoder_quantization: str = "avx2",
+            encoder_threads: int | None = None
             ):
-        self.transformer_model = SentenceTransformer(transformer_model_name)
+        self._encoder_options = {
+            "model_name": transformer_model_name,
+            "backend": encoder_backend,
+            "onnx_dir": encoder_onnx_dir,
+            "quantization": encoder_quantization,
+            "threads": encoder_threads,
+        }
+        self.transformer_model = load_encoder(**self._encoder_options)
         self.memory = memory
         self.validator = CitationValidator()
         self.prompt_core_list = prompt_core_list
@@ -45,91 +122,273 @@ class RAG:
         self.qdrant_collection_name = qdrant_collection_name
         self.enable_decomposition = enable_decomposition
         self.ollama_model_name = ollama_model_name
+        self.vector_backend = vector_backend
+        self.lexical_backend = lexical_backend
+        self.es_minimum_should_match = es_minimum_should_match
+        self.hybrid_search = hybrid_search
+        self.es_hybrid_fusion = es_hybrid_fusion
+        self.es_hybrid_num_candidates = es_hybrid_num_candidates
+        self.adaptive_retrieval = adaptive_retrieval
+        # relative lead of the top hit over the runner-up that makes the other engine unnecessary, 0 = never
+        self.early_exit_margin = {"es": early_exit_margin_es, "qdrant": early_exit_margin_qdrant}
+        self.qdrant_storage = {
+            "quantization": qdrant_quantization,
+            "on_disk": qdrant_on_disk,
+            "hnsw_m": qdrant_hnsw_m,
+            "hnsw_ef_construct": qdrant_hnsw_ef_construct,
+        }
+        self.qdrant_search_params = {
+            "hnsw_ef": qdrant_hnsw_ef,
+            "oversampling": qdrant_oversampling,
+            "rescore": qdrant_rescore,
+        }
+        self.local_index_dir = local_index_dir
+        self.local_vector_block_size = local_vector_block_size
+        self.local_vector_hnsw = local_vector_hnsw
+        self.local_vector_hnsw_ef = local_vector_hnsw_ef
+        # near-duplicate documents are indexed once (None = index everything)
+        self.dedup_threshold = dedup_threshold
+        # retrieved chunks repeating a better-ranked one are dropped before packing (0 = keep all)
+        self.chunk_dedup_threshold = chunk_dedup_threshold
+        # chunk lengths in the answering model's tokens (regex tokens without a tokenizer)
+        self.token_counter = TokenCounter.from_name(llm_tokenizer)
+        self.context_token_budget = context_token_budget
+        self.ollama_keep_alive = ollama_keep_alive
+        # one context size for every call, Ollama reloads the model when num_ctx changes;
+        # regex tokens undercount model tokens, hence the margin without a tokenizer
+        budget_tokens = context_token_budget if self.token_counter.tokenizer else 2 * context_token_budget
+        self.ollama_num_ctx = ollama_num_ctx or context_window(budget_tokens)
 
-        self.es_client = Elasticsearch(es_url)
-        self.qdrant_client = QdrantClient(qdrant_url)
-        self.nlp = spacy.load(spacy_model_name)
-        self.ollama_client = Client(ollama_host)
+        # hybrid mode serves both retrievals from one engine, the per-kind backends are not used
+        self._engines = {hybrid_search} if hybrid_search != "off" else {vector_backend, lexical_backend}
+        self._connection_options = {
+            "es_url": es_url,
+            "qdrant_url": qdrant_url,
+            "connections": backend_connections,
+            "timeout": backend_timeout,
+            "max_retries": backend_max_retries,
+            "es_http_compress": es_http_compress,
+            "qdrant_prefer_grpc": qdrant_prefer_grpc,
+            "qdrant_grpc_port": qdrant_grpc_port,
+            "qdrant_grpc_compress": qdrant_grpc_compress,
+            "ollama_hosts": ollama_hosts or [ollama_host],
+            "planner_hosts": planner_hosts,
+            "ollama_max_concurrency": ollama_max_concurrency,
+        }
+        # spaCy lemmatizes only for the local BM25 index, ES analyzes queries server-side
+        self.nlp = load_nlp_profiles(spacy_model_name, spacy_n_process, spacy_batch_size,
+                                     with_keywords=hybrid_search == "off" and lexical_backend == "local")
+        self.planner_model_name = planner_model_name or ollama_model_name
+        # identical (sub)query retrievals running at the same time in different requests
+        self._retrievals = SingleFlight("retrieve")
 
+        self.connect(bind=False)
         self._initialize_engines(data_source_path)
+        self._bind_engines()
         self._ensure_model_exists()
+        if ollama_warmup:
+            self._warmup_model()
+
+    def connect(self, bind: bool = True):
+        '''
+        (Re)creates the ES / Qdrant / Ollama clients and binds the search functions to them.
+        Models and indexes stay. Workers forked from a preloaded master call it first thing:
+        sockets, connection pools and gRPC channels must not be shared between processes,
+        and neither can an ONNX Runtime encoder session (its thread pool is not forked).
+        '''
+        if self.transformer_model is None:
+            self.transformer_model = load_encoder(**self._encoder_options)
+        options = self._connection_options
+        # pooled keep-alive connections, one per request served at once
+        self.es_client = create_es_client(
+            options["es_url"], connections=options["connections"], timeout=options["timeout"],
+            max_retries=options["max_retries"], http_compress=options["es_http_compress"]
+        ) if "es" in self._engines else None
+        self.qdrant_client = create_qdrant_client(
+            options["qdrant_url"], connections=options["connections"], timeout=options["timeout"],
+            max_retries=options["max_retries"], prefer_grpc=options["qdrant_prefer_grpc"],
+            grpc_port=options["qdrant_grpc_port"], compress=options["qdrant_grpc_compress"]
+        ) if "qdrant" in self._engines else None
+        # answers go to the main model, clarification / decomposition to the (smaller) planner model
+        self.ollama_client = OllamaPool(options["ollama_hosts"], max_concurrency=options["ollama_max_concurrency"])
+        self.planner_client = self.ollama_client
+        if options["planner_hosts"]:
+            self.planner_client = OllamaPool(options["planner_hosts"], max_concurrency=options["ollama_max_concurrency"])
+        self._llms = {(self.ollama_model_name, self.ollama_client), (self.planner_model_name, self.planner_client)}
+        if bind:
+            self._bind_engines()
+
+    def close(self):
+        '''
+        Closes every client, e.g. in the master before forking workers; `connect` reopens them
+        '''
+        if self._encoder_options["backend"] != "torch":
+            self.transformer_model = None
+        for client in (self.es_client, self.qdrant_client):
+            if client is not None:
+                client.close()
+        for _, pool in self._llms:
+            pool.close()
 
     def _initialize_engines(self, data_path):
-        create_es_index(self.es_index_name, self.es_client)
-        populate_index(data_path, self.es_index_name, self.es_client)
-        create_qdrant_collection(self.qdrant_collection_name, self.qdrant_client)
-        populate_collection(data_path, self.qdrant_collection_name, self.qdrant_client)
+        '''
+        Creates / fills the indexes the configured backends search (once, at startup)
+        '''
+        if self.hybrid_search != "off":
+            self._initialize_hybrid(data_path)
+            return
+
+        if self.lexical_backend == "local":
+            self.keyword_index = LocalBM25Index.open_or_build(
+                Path(self.local_index_dir) / "bm25",
+                data_path,
+                self.nlp.keywords,
+                n_process=self.nlp.n_process,
+                batch_size=self.nlp.batch_size,
+                dedup_threshold=self.dedup_threshold
+            )
+        elif self.lexical_backend == "es":
+            create_es_index(self.es_index_name, self.es_client)
+            populate_index(data_path, self.es_index_name, self.es_client, dedup_threshold=self.dedup_threshold)
+        else:
+            raise ValueError(f"Unknown lexical backend: {self.lexical_backend}")
+
+        if self.vector_backend == "local":
+            self.vector_index = LocalVectorIndex.open_or_build(
+                Path(self.local_index_dir) / "vectors",
+                data_path,
+                block_size=self.local_vector_block_size,
+                use_hnsw=self.local_vector_hnsw,
+                hnsw_ef=self.local_vector_hnsw_ef,
+                dedup_threshold=self.dedup_threshold
+            )
+        elif self.vector_backend == "qdrant":
+            create_qdrant_collection(self.qdrant_collection_name, self.qdrant_client, **self.qdrant_storage)
+            populate_collection(data_path, self.qdrant_collection_name, self.qdrant_client,
+                                dedup_threshold=self.dedup_threshold)
+        else:
+            raise ValueError(f"Unknown vector backend: {self.vector_backend}")
     
+    def _initialize_hybrid(self, data_path):
+        if self.hybrid_search == "es":
+            create_es_index(self.es_index_name, self.es_client)
+            populate_index(data_path, self.es_index_name, self.es_client, dedup_threshold=self.dedup_threshold)
+        elif self.hybrid_search == "qdrant":
+            create_qdrant_collection(self.qdrant_collection_name, self.qdrant_client, sparse=True, **self.qdrant_storage)
+            populate_collection(data_path, self.qdrant_collection_name, self.qdrant_client, sparse=True,
+                                dedup_threshold=self.dedup_threshold)
+        else:
+            raise ValueError(f"Unknown hybrid search engine: {self.hybrid_search}")
+
+    def _bind_engines(self):
+        if self.hybrid_search == "es":
+            # search_hybrid(vec, es_query, weights, depth) -> [(text, fused score)], fused by the engine in one request
+            self.search_hybrid = partial(search_es_hybrid, es_client=self.es_client, index_name=self.es_index_name,
+                                         minimum_should_match=self.es_minimum_should_match,
+                                         fusion=self.es_hybrid_fusion,
+                                         num_candidates=self.es_hybrid_num_candidates)
+        elif self.hybrid_search == "qdrant":
+            self.search_hybrid = partial(search_qdrant_hybrid, qdrant_client=self.qdrant_client,
+                                         collection_name=self.qdrant_collection_name,
+                                         **self.qdrant_search_params)
+        if self.hybrid_search != "off":
+            return
+
+        # search_keywords(es_query, limit) -> (ids, texts, scores), same contract for every lexical backend
+        if self.lexical_backend == "local":
+            self.search_keywords = partial(search_local_bm25, index=self.keyword_index, nlp=self.nlp.keywords)
+        else:
+            self.search_keywords = partial(search_es, es_client=self.es_client, index_name=self.es_index_name,
+                                           minimum_should_match=self.es_minimum_should_match)
+        # search_vectors(vec, limit) -> (ids, texts, scores), same contract for every dense backend
+        if self.vector_backend == "local":
+            self.search_vectors = partial(search_local_vectors, index=self.vector_index)
+        else:
+            self.search_vectors = partial(search_qdrant, qdrant_client=self.qdrant_client,
+                                          collection_name=self.qdrant_collection_name,
+                                          **self.qdrant_search_params)
+
     def _ensure_model_exists(self):
-        current_models = self.ollama_client.list()
-        # Check if the model is already in the list of downloaded models
-        if not any(m['model'].startswith(self.ollama_model_name) for m in current_models.get('models', [])):
-            print(f"Downloading model {self.ollama_model_name}... this may take a while.")
-            self.ollama_client.pull(self.ollama_model_name)
-
-    def rag_query_enhanced(
-        self,
-        user_input: str,
-        result: Dict,
-        prompt_id: int,
-        max_chunk_tokens=200,
-        max_tokens_len=250,
-    ) -> Dict:
+        for model, pool in self._llms:
+            for host, client in pool.clients.items():
+                current_models = client.list()
+                # Check if the model is already in the list of downloaded models
+                if not any(m['model'].startswith(model) for m in current_models.get('models', [])):
+                    logger.info("Downloading model, this may take a while", model=model, host=host)
+                    client.pull(model)
+
+    def _warmup_model(self):
+        '''
+        Loads the models on every host with the serving num_ctx / keep_alive before the first
+        request and leaves the default system prompt in Ollama's KV cache
+        '''
+        for model, pool in self._llms:
+            for host, client in pool.clients.items():
+                try:
+                    client.chat(
+                        model=model,
+                        messages=[
+                            {"role": "system", "content": self.prompt_core_list[0]},
+                            {"role": "user", "content": "Fragmenty:\n\nPytanie:\n"},
+                        ],
+                        options=llm_options({"num_predict": 1}, self.ollama_num_ctx),
+                        keep_alive=self.ollama_keep_alive
+                    )
+                    logger.info("Model rozgrzany", model=model, host=host, num_ctx=self.ollama_num_ctx)
+                except Exception as e:
+                    logger.warning("Rozgrzewanie modelu nie powiodło się", model=model, host=host, error=str(e))
+
+    def rag_query_enhanced(self, ctx: RequestContext, user_input: str, prompt_id: int) -> Dict:
         """
         Rozszerzona wersja RAG z dekompozycją i clarification.
+        user_input: zapytanie w bieżącej interpretacji, wynik trafia do ctx.result.
         """
-        features = analyze_query(user_input)
+        result = ctx.result
+        pipeline = ctx.pipeline
+        profile = build_query_profile(user_input)
+        features = profile.features
 
         # 2. Dekompozycja zapytania 
-        if self.enable_decomposition:
-            decomposition = decompose_query(user_input, features, self.ollama_model_name, self.ollama_client)
+        decompose = self.enable_decomposition and pipeline.decomposition
+        if decompose and not self._fits("decomposition", ANSWER_STAGES):
+            result["decomposition"] = {"main_question": user_input, "sub_questions": [], "decomposition_type": "skipped"}
+        elif decompose:
+            with stage("decomposition"):
+                decomposition = decompose_query(user_input, features, self.planner_model_name, self.planner_client,
+                                                self.ollama_keep_alive, self.ollama_num_ctx)
+                annotate(sub_questions=len(decomposition["sub_questions"]),
+                         decomposition_type=decomposition["decomposition_type"])
             result["decomposition"] = decomposition
             
             if len(decomposition['sub_questions']) > 0:
-                print(f"\nDEKOMPOZYCJA ZAPYTANIA:")
-                print(f"Główne pytanie: {decomposition['main_question']}")
-                if decomposition["sub_questions"]:
-                    print(f"Podzapytania ({len(decomposition['sub_questions'])}):")
-                    for i, sq in enumerate(decomposition["sub_questions"], 1):
-                        print(f"  {i}. {sq}")
+                logger.debug("Dekompozycja zapytania",
+                             main_question=decomposition["main_question"],
+                             sub_questions=decomposition["sub_questions"])
             
         
         # 3. Logika RAG
         queries_to_process = [user_input]
         
-        if self.enable_decomposition and result["decomposition"]["sub_questions"]:
+        if decompose and result["decomposition"]["sub_questions"]:
             queries_to_process.extend(result["decomposition"]["sub_questions"])
         
         all_chunks_with_scores = []
         user_input_vec = None
         
+        result["stats"]["query_filter"] = profile.query_filter.to_dict() if profile.query_filter else None
+
         for i, query in enumerate(queries_to_process):
-            qdrant_query, es_query = make_queries(query, self.nlp)
-            vec = embed(qdrant_query, self.transformer_model)
+            check_deadline("retrieve", sum(expected_stage_seconds(name) for name in ANSWER_STAGES))
+            # sub-questions rarely repeat the constraint, fall back to the one from the main question
+            query_filter = build_query_profile(query).query_filter or profile.query_filter
+            with span("retrieve", query_index=i, query=query):
+                vec, chunks_with_scores = self.retrieve_chunks(query, features, ctx.max_chunk_tokens, query_filter,
+                                                               pipeline.depth_scale)
             
             if i == 0:
                 user_input_vec = vec
 
-            ids_qdrant, texts_qdrant = search_qdrant(vec, self.qdrant_client, self.qdrant_collection_name)
-            ids_es, texts_es = search_es(es_query, self.es_client, self.es_index_name)
-            
-            weights = choose_weights(features)
-            
-            fused_results = rrf_fusion_weighted(
-                ids_qdrant,
-                ids_es,
-                texts_qdrant,
-                texts_es,
-                qdrant_weight=weights["qdrant"],
-                es_weight=weights["es"],
-                k=15
-            )
-            
-            for text, score in fused_results:
-                chunks = chunk_document(text, self.nlp, max_tokens=max_chunk_tokens)
-                for chunk in chunks:
-                    all_chunks_with_scores.append((chunk, score))
-
+            all_chunks_with_scores.extend(chunks_with_scores)
 
         best_chunk_scores = {}
         for chunk, score in all_chunks_with_scores:
@@ -143,129 +402,275 @@ class RAG:
 
         chunks_only = [chunk for chunk, _ in all_chunks_with_scores]
 
+        # Fragmenty powtarzające lepiej ocenione (kopie stron, nakładka chunków) zajmują limit tokenów
+        with stage("redundancy"):
+            chunks_only, redundancy_stats = suppress_near_duplicates(chunks_only, self.chunk_dedup_threshold)
+            annotate(suppressed_chunks=redundancy_stats["suppressed_chunks"])
+
         # 5. Filtracja
-        filtered_chunks, filter_stats = filter_retrieved_with_stats(
-            chunks_only,
-            user_input,
-            user_input_vec,
-            features,
-            max_docs=10
-        )
-        
-        # 6. Limit tokenów
-        used_chunks = []
-        used_len = 0
-
-        for chunk in filtered_chunks:
-            tokens = tokenize_regex(chunk)
-            if used_len + len(tokens) <= max_tokens_len:
-                used_chunks.append(chunk)
-                used_len += len(tokens)
-            else:
-                break
+        with stage("filtering"):
+            filtered_chunks, filter_stats = filter_retrieved_with_stats(
+                chunks_only,
+                user_input,
+                user_input_vec,
+                features,
+                max_docs=10,
+                transformer_model=self.transformer_model,
+                profile=profile
+            )
+            annotate(input_docs=filter_stats["input_docs"], kept_docs=filter_stats["kept_docs"])
         
+        # 6. Limit tokenów (tokeny modelu)
+        with stage("packing"):
+            used_chunks, used_len = pack_chunks(
+                filtered_chunks,
+                [best_chunk_scores[chunk] for chunk in filtered_chunks],
+                ctx.max_tokens_len or self.context_token_budget,
+                self.token_counter.count
+            )
+            annotate(tokens_used=used_len, packed_chunks=len(used_chunks))
+
         result["chunks"] = used_chunks
         result["stats"]["tokens_used"] = used_len
         result["stats"].update(filter_stats)
+        result["stats"]["suppressed_chunks"] = redundancy_stats["suppressed_chunks"]
         
-        print(f"\nUżyto {used_len} tokenów w {len(used_chunks)} chunkach")
+        logger.debug("Limit tokenów", tokens_used=used_len, chunks=len(used_chunks))
         
 
-        response = ask_model(used_chunks, self.prompt_core_list, prompt_id, user_input, self.ollama_model_name, self.ollama_client)
+        check_deadline("ask_model", expected_stage_seconds("ask_model"))
+        with stage("ask_model"):
+            response = ask_model(used_chunks, self.prompt_core_list, prompt_id, user_input, self.ollama_model_name, self.ollama_client,
+                                 self.ollama_keep_alive, self.ollama_num_ctx)
 
         result["answer"] = response["message"]["content"]
         result["stats"]["citations"] = count_citations(result["answer"])
 
-        print(f'[INFO] model answer: {result["answer"]}')
+        logger.debug("Odpowiedź modelu", answer=result["answer"])
         
         return result
     
+    def retrieve_chunks(self, query: str, features: dict, max_chunk_tokens=200, query_filter: QueryFilter | None = None,
+                        depth_scale: float = 1.0):
+        '''
+        Search both engines for one (sub)query, fuse results and chunk them.
+        Date / domain constraints are pushed down to both engines, depth_scale < 1 fetches less under load.
+        Concurrent requests retrieving the same (sub)query with the same settings share one retrieval.
+        Returns query embedding and tuple of (chunk, fused score), both read-only (shared).
+        '''
+        weights = choose_weights(features)
+        depth = choose_depth(features, weights) if self.adaptive_retrieval else DEFAULT_DEPTH
+        depth = scale_depth(depth, depth_scale)
+
+        key = (
+            normalize_query(query),
+            max_chunk_tokens,
+            json.dumps(query_filter.to_dict(), sort_keys=True, default=str) if query_filter else None,
+            tuple(sorted(weights.items())),
+            tuple(sorted(depth.items())),
+        )
+        return self._retrievals.do(
+            key, partial(self._retrieve_chunks, query, weights, depth, max_chunk_tokens, query_filter)
+        )
+
+    def _retrieve_chunks(self, query: str, weights: dict, depth: dict, max_chunk_tokens: int,
+                         query_filter: QueryFilter | None):
+        with stage("make_queries"):
+            qdrant_query, es_query = make_queries(query)
+        with stage("embed"):
+            vec = embed(qdrant_query, self.transformer_model)
+
+        fused_results = self._search_fused(vec, es_query, weights, depth, query_filter)
+        if query_filter and not fused_results:
+            logger.debug("Brak wyników z filtrem, wyszukiwanie bez filtra", query_filter=query_filter.to_dict())
+            fused_results = self._search_fused(vec, es_query, weights, depth, None)
+        
+        chunks_with_scores = []
+        with stage("chunking"):
+            chunked = chunk_documents(
+                [text for text, _ in fused_results],
+                self.nlp.sentences,
+                max_tokens=max_chunk_tokens,
+                n_process=self.nlp.n_process,
+                batch_size=self.nlp.batch_size
+            )
+            for (_, score), chunks in zip(fused_results, chunked):
+                for chunk in chunks:
+                    chunks_with_scores.append((chunk, score))
+            annotate(chunks=len(chunks_with_scores))
+
+        # the same objects may go to several requests (single-flight followers)
+        vec.setflags(write=False)
+        return vec, tuple(chunks_with_scores)
+
+    def _search_fused(self, vec, es_query: str, weights: dict, depth: dict, query_filter: QueryFilter | None):
+        '''
+        [(text, fused score)] from one hybrid request, or from both engines fused here.
+        The stronger engine is asked first, the weaker one is skipped when its depth is 0
+        or when the first engine's top hit is decisive.
+        '''
+        if self.hybrid_search != "off":
+            with stage("search_hybrid"):
+                fused_results = self.search_hybrid(vec, es_query, weights, depth, query_filter=query_filter)
+                annotate(hits=len(fused_results), backend=self.hybrid_search, filtered=bool(query_filter))
+            return fused_results
+
+        found = {"qdrant": ([], [], []), "es": ([], [], [])}
+        first, second = sorted(found, key=weights.get, reverse=True)
+        found[first] = self._search_engine(first, vec, es_query, depth[first], query_filter)
+        if not depth[second]:
+            record_engine_skip(second, "weight")
+        elif self._is_decisive(first, found[first][2]):
+            record_engine_skip(second, "margin")
+        else:
+            found[second] = self._search_engine(second, vec, es_query, depth[second], query_filter)
+
+        with stage("fusion"):
+            return rrf_fusion_weighted(
+                found["qdrant"][0],
+                found["es"][0],
+                found["qdrant"][1],
+                found["es"][1],
+                qdrant_weight=weights["qdrant"],
+                es_weight=weights["es"],
+                k=depth["fused"]
+            )
+
+    def _search_engine(self, engine: str, vec, es_query: str, limit: int, query_filter: QueryFilter | None):
+        if engine == "qdrant":
+            with stage("search_qdrant"):
+                found = self.search_vectors(vec, limit=limit, query_filter=query_filter)
+                annotate(hits=len(found[0]), limit=limit, backend=self.vector_backend, filtered=bool(query_filter))
+        else:
+            with stage("search_es"):
+                found = self.search_keywords(es_query, limit=limit, query_filter=query_filter)
+                annotate(hits=len(found[0]), limit=limit, backend=self.lexical_backend, filtered=bool(query_filter))
+        return found
+
+    def _is_decisive(self, engine: str, scores: List[float]) -> bool:
+        '''
+        Top hit ahead of the runner-up by at least the engine's relative margin
+        '''
+        margin = self.early_exit_margin[engine]
+        if not self.adaptive_retrieval or not margin or len(scores) < 2 or scores[0] <= 0:
+            return False
+        return (scores[0] - scores[1]) / scores[0] >= margin
+
     def full_rag_process(
             self,
             user_input: str,
             retry_strategies: List[str],
             max_chunk_tokens=200,
-            max_tokens_len=250
+            max_tokens_len=None,
+            pipeline: PipelineProfile = PIPELINE_PROFILES["full"]
         ) -> Dict:
-            
-            result = self.generate_result(user_input)
-            interpretations, interpretation_req = clarify_query(result, user_input, self.ollama_model_name, self.ollama_client)
+            '''
+            Answers one request. Everything it decides lives in its own RequestContext,
+            the caller's retry_strategies are never modified and RAG keeps no per-request
+            state, so calls from many threads at once don't see each other's data.
+            '''
+            ctx = RequestContext.create(user_input, retry_strategies, pipeline, max_chunk_tokens, max_tokens_len)
+            kind = set_query_kind(ctx.features)
+            bind_query(user_input)
+            REQUESTS.labels(kind).inc()
+            record_pipeline_profile(pipeline.name)
+            with REQUEST_SECONDS.labels(kind).time(), span("full_rag_process", query_kind=kind, pipeline=pipeline.name):
+                return self._full_rag_process(ctx)
+
+    def _full_rag_process(self, ctx: RequestContext) -> Dict:
+            user_input = ctx.query
+            result = ctx.result
+            # heuristic ambiguity detection always runs, the LLM only when the profile and the deadline allow
+            use_llm = ctx.pipeline.llm_clarification and self._fits("clarification", ANSWER_STAGES)
+            with stage("clarification"):
+                interpretations, interpretation_req = clarify_query(result, user_input, self.planner_model_name, self.planner_client,
+                                                                    self.ollama_keep_alive, self.ollama_num_ctx, use_llm)
             interpretation_idx = 0
             if interpretation_req:
                 final_user_input = user_input + ' ' + interpretations[interpretation_idx]
             else:
                 final_user_input = user_input
-            print(f"[INFO] RAG działa dla zapytania: {final_user_input}")
+            logger.info("RAG działa dla zapytania", query=final_user_input)
             
             prompt_core_idx = 0
-            result = self.rag_query_enhanced(final_user_input, 
-                                        result,
-                                        prompt_core_idx,
-                                        max_chunk_tokens,
-                                        max_tokens_len)
+            self.rag_query_enhanced(ctx, final_user_input, prompt_core_idx)
             
-            is_answer_valid = self.evaluate_answer(result["answer"], result["stats"], result["chunks"])
+            with stage("validation"):
+                is_answer_valid = self.evaluate_answer(result["answer"], result["stats"], result["chunks"])
 
             while not is_answer_valid:
-                if "modify_prompt" in retry_strategies:
+                if ctx.allows("modify_prompt"):
                     prompt_core_idx += 1
-                    if prompt_core_idx < len(self.prompt_core_list):
-                        print(f"[INFO] Błąd, próba z promptem nr {prompt_core_idx+1}")
-                        response = ask_model(result["chunks"], self.prompt_core_list, prompt_core_idx, 
-                                             final_user_input, self.ollama_model_name, self.ollama_client)
-
-                        new_answer = response["message"]["content"]
-                        result["stats"]["citations"] = count_citations(new_answer)
-                        is_answer_valid = self.evaluate_answer(new_answer, result["stats"], result["chunks"])
+                    if prompt_core_idx < len(self.prompt_core_list) and self._fits("retry_modify_prompt", like=("ask_model",)):
+                        logger.info("Błąd, próba z kolejnym promptem", prompt_idx=prompt_core_idx + 1)
+                        record_retry("modify_prompt")
+                        with stage("retry_modify_prompt"):
+                            response = ask_model(result["chunks"], self.prompt_core_list, prompt_core_idx, 
+                                                 final_user_input, self.ollama_model_name, self.ollama_client,
+                                                 self.ollama_keep_alive, self.ollama_num_ctx)
+
+                            new_answer = response["message"]["content"]
+                            result["stats"]["citations"] = count_citations(new_answer)
+                            is_answer_valid = self.evaluate_answer(new_answer, result["stats"], result["chunks"])
                         if is_answer_valid:
                             result["answer"] = new_answer
                     else:
-                        print(f"[WARN] Brak innych promptów do wykorzystania")
-                        retry_strategies.remove("modify_prompt")
+                        if prompt_core_idx >= len(self.prompt_core_list):
+                            logger.warning("Brak innych promptów do wykorzystania")
+                        ctx = ctx.without("modify_prompt")
                         continue
-                if "change_interpretation" in retry_strategies:
-                    if interpretation_idx + 1 < len(interpretations):
+                if ctx.allows("change_interpretation"):
+                    if interpretation_idx + 1 < len(interpretations) and self._fits("retry_change_interpretation", like=ANSWER_STAGES):
                         interpretation_idx += 1
                         final_user_input = user_input + ' ' + interpretations[interpretation_idx]
-                        print(f"[INFO] Błąd, ponowna próba dla nowej interpretacji nr {interpretation_idx+1}: {final_user_input}")
-                        result = self.rag_query_enhanced(final_user_input, 
-                                        result,
-                                        prompt_core_idx,
-                                        max_chunk_tokens,
-                                        max_tokens_len)
-            
-                        is_answer_valid = self.evaluate_answer(result["answer"], result["stats"], result["chunks"])
+                        logger.info("Błąd, ponowna próba dla nowej interpretacji",
+                                    interpretation_idx=interpretation_idx + 1, query=final_user_input)
+                        record_retry("change_interpretation")
+                        with stage("retry_change_interpretation"):
+                            self.rag_query_enhanced(ctx, final_user_input, prompt_core_idx)
+                
+                            is_answer_valid = self.evaluate_answer(result["answer"], result["stats"], result["chunks"])
                         
                     else:
-                        print(f"[WARN] Brak wielu interpretacji")
-                        retry_strategies.remove("change_interpretation")
+                        if interpretation_idx + 1 >= len(interpretations):
+                            logger.warning("Brak wielu interpretacji")
+                        ctx = ctx.without("change_interpretation")
                         continue
-                if "save_to_memory" in retry_strategies:
-                    print(f"[INFO] Błąd w odpowiedzi, zapis pytania do pamięci")
+                if ctx.allows("save_to_memory"):
+                    logger.info("Błąd w odpowiedzi, zapis pytania do pamięci")
+                    record_retry("save_to_memory")
+                    record_memory_save()
                     self.memory.add_query(user_input)
                     return result
                 else:
-                    print(f"[WARN] Nieznana strategia rozwiązania błędu, zapis pytania do pamięci")
+                    logger.warning("Nieznana strategia rozwiązania błędu, zapis pytania do pamięci",
+                                   retry_strategies=list(ctx.retry_strategies))
+                    record_memory_save()
                     self.memory.add_query(user_input)
                     return result
             return result
         
 
-    def generate_result(self, query: str):
-        result = {
-            "original_query": query,
-            "answer": "",
-            "chunks": [],
-            "decomposition": None,
-            "stats": {}
-        }
-        return result
+    def _fits(self, stage_name: str, following=(), like=()) -> bool:
+        '''
+        Whether an optional stage, and the stages that must run after it, are expected to
+        finish before the request deadline (recent stage durations). Records the skip if not.
+        A stage that hasn't run yet is estimated by the stages it repeats (`like`).
+        '''
+        first_run = sum(expected_stage_seconds(name) for name in like)
+        needed = expected_stage_seconds(stage_name, first_run) + sum(expected_stage_seconds(name) for name in following)
+        if has_time(needed):
+            return True
+        record_stage_skip(stage_name)
+        logger.info("Etap pominięty, brak czasu przed terminem", stage=stage_name,
+                    needed_s=round(needed, 3), remaining_s=round(remaining() or 0.0, 3))
+        return False
 
     def evaluate_answer(self, model_answer, model_stats, chunks):
         if self.memory.should_save_as_unresolved(model_answer, chunks, model_stats):
-            print("[WARN] Model nie był w stanie odpowiedzieć na podstawie podanych fragmentów")
+            logger.warning("Model nie był w stanie odpowiedzieć na podstawie podanych fragmentów")
             return False
         elif not self.validator.validate_answer(model_answer, chunks):
-            print("[ERR] Model zwrócił błędne cytaty")
+            logger.warning("Model zwrócił błędne cytaty")
             return False
         return True
@@ -1,11 +1,15 @@
 
 from .filtering import filter_retrieved_with_stats
+from .redundancy import suppress_near_duplicates
+from .packing import pack_chunks
 from .decomposition import decompose_query
 from .validation import CitationValidator
 from .clarification import clarify_query
 
 __all__ = [
     "filter_retrieved_with_stats",
+    "suppress_near_duplicates",
+    "pack_chunks",
     "decompose_query",
     "CitationValidator",
     "clarify_query",
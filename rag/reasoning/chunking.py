@@ -5,6 +5,20 @@ def chunk_document(text: str, nlp, max_tokens=200, overlap=30) -> List[str]:
         return []
 
     doc = nlp(text)
+    return _chunk_sentences(doc, max_tokens, overlap)
+
+def chunk_documents(texts: List[str], nlp, max_tokens=200, overlap=30, n_process=1, batch_size=64) -> List[List[str]]:
+    '''
+    Batched chunk_document, runs spaCy once over all texts with nlp.pipe
+    '''
+    chunked = [[] for _ in texts]
+    non_empty = [i for i, text in enumerate(texts) if text]
+    docs = nlp.pipe((texts[i] for i in non_empty), n_process=n_process, batch_size=batch_size)
+    for i, doc in zip(non_empty, docs):
+        chunked[i] = _chunk_sentences(doc, max_tokens, overlap)
+    return chunked
+
+def _chunk_sentences(doc, max_tokens: int, overlap: int) -> List[str]:
     sentences = [sent.text.strip() for sent in doc.sents if sent.text.strip()]
 
     chunks = []
@@ -40,4 +54,4 @@ def chunk_document(text: str, nlp, max_tokens=200, overlap=30) -> List[str]:
     if current_chunk:
         chunks.append(" ".join(current_chunk))
 
-    return chunks
\ No newline at end of file
+    return chunks
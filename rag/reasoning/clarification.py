@@ -1,25 +1,26 @@
-from typing import List, Dict
+from typing import List, Dict, Optional
 import re
 from ollama import Client
 
-from common.util import (
-    TOKEN_RE,
-    ID_RE,
-    ACRONYM_RE,
-    YEAR_RE,
-)
+from common.query_profile import QueryProfile, build_query_profile, LEXICON
+from observability import record_llm_usage, get_logger
 
-def detect_ambiguity_hybrid(user_input: str) -> Dict:
-    text_lower = user_input.lower()
-    tokens = TOKEN_RE.findall(text_lower)
+from .prompt import llm_options
+
+logger = get_logger(__name__)
+
+def detect_ambiguity_hybrid(user_input: str, profile: QueryProfile = None) -> Dict:
+    profile = profile or build_query_profile(user_input)
+    features = profile.features
+    tokens = profile.tokens
     
     # KROK 1: Szybkie heurystyki wykluczające (high precision)
     # Jeśli zapytanie ma te cechy, na pewno NIE jest niejednoznaczne
     if any([
-        ID_RE.search(user_input),  # ma ID dokumentu
-        ACRONYM_RE.fullmatch(user_input),  # samo akronim
-        YEAR_RE.search(user_input) and len(tokens) <= 8,  # konkretna data + krótkie
-        any(t.isdigit() for t in tokens) and len(tokens) <= 6,  # liczby + krótkie
+        features["has_id"],  # ma ID dokumentu
+        features["is_acronym"],  # samo akronim
+        features["has_year"] and len(tokens) <= 8,  # konkretna data + krótkie
+        features["has_number"] and len(tokens) <= 6,  # liczby + krótkie
     ]):
         return {
             "is_ambiguous": False,
@@ -30,53 +31,22 @@ def detect_ambiguity_hybrid(user_input: str) -> Dict:
         }
     
     # KROK 2: Heurystyki wskazujące niejednoznaczność (high recall)
+    # Słowniki (common/lexicon.json) są dopasowane jednym przebiegiem w QueryProfile
     ambiguity_signals = []
     
     # Wieloznaczne encje
-    ambiguous_entities = {
-        "pan": "PAN (instytucja) vs pan (osoba/grzecznościowe)",
-        "rada": "która rada? (ministrów, nadzorcza, etc.)",
-        "instytut": "który instytut?",
-        "komisja": "która komisja?",
-        "program": "jaki program? (komputerowy, polityczny, edukacyjny)",
-        "organizacja": "która organizacja?"
-    }
-    
-    for entity, desc in ambiguous_entities.items():
-        if entity in text_lower and not any(x in text_lower for x in ["który", "jaki", "która", "jakie"]):
-            ambiguity_signals.append(("entity", entity, desc))
+    if not profile.matched("entity_disambiguators"):
+        for entity in profile.matched("ambiguous_entities"):
+            ambiguity_signals.append(("entity", entity, LEXICON.ambiguous_entities[entity]))
     
     # Abstrakcyjne pojęcia bez kontekstu
-    abstract_concepts = {
-        "sens": "sens moralny/praktyczny/egzystencjalny?",
-        "znaczenie": "znaczenie słowa/wydarzenia/symboliczne?",
-        "odpowiedzialność": "moralna/prawna/społeczna/zawodowa?",
-        "sukces": "sukces finansowy/osobisty/zawodowy?",
-        "kryzys": "kryzys ekonomiczny/polityczny/osobisty/zdrowotny?",
-        "efektywność": "efektywność czego dokładnie?",
-        "rozwój": "rozwój osobisty/zawodowy/gospodarczy?",
-        "zarządzanie": "zarządzanie czym? (ludźmi/projektem/firmą/czasem)"
-    }
-    
-    for concept, desc in abstract_concepts.items():
-        # Sprawdź czy jest kontekst
-        has_context = any(ctx in text_lower for ctx in [
-            "w kontekście", "w zakresie", "odnośnie", "dotycząc",
-            "w przypadku", "dla", "przy"
-        ])
-        
-        if concept in text_lower and not has_context:
-            ambiguity_signals.append(("abstract", concept, desc))
+    if not profile.matched("concept_context"):
+        for concept in profile.matched("abstract_concepts"):
+            ambiguity_signals.append(("abstract", concept, LEXICON.abstract_concepts[concept]))
     
     # Ogólne pytania bez zakresu
-    if any(phrase in text_lower for phrase in ["jak zarządzać", "jak poprawić", "jak zwiększyć"]):
-        # Sprawdź czy ma kontekst
-        has_scope = any(s in text_lower for s in [
-            "w firmie", "w zespole", "w projekcie", "w organizacji",
-            "w przypadku", "dla", "przy"
-        ])
-        if not has_scope:
-            ambiguity_signals.append(("scope", "brak zakresu", "nie określono kontekstu/zakresu"))
+    if profile.matched("scope_triggers") and not profile.matched("scope_markers"):
+        ambiguity_signals.append(("scope", "brak zakresu", "nie określono kontekstu/zakresu"))
     
     # KROK 3: Decyzja
     if len(ambiguity_signals) == 0:
@@ -101,7 +71,35 @@ def detect_ambiguity_hybrid(user_input: str) -> Dict:
     }
 
 
-def generate_clarification_question(user_input: str, ollama_model: str, ollama_client: Client) -> Dict:
+def heuristic_interpretations(signals: List[tuple]) -> List[Dict]:
+    '''
+    Interpretations built from the detected ambiguity signals alone, without the LLM
+    '''
+    interpretations = []
+    for i, (sig_type, sig_term, sig_desc) in enumerate(signals[:3], 1):
+        if sig_type == "entity" and " vs " in sig_desc:
+            parts = sig_desc.split(" vs ")
+            interpretations.append({
+                "label": f"Interpretacja {len(interpretations) + 1}",
+                "clarification": f"pytanie dotyczy {parts[0].strip()}"
+            })
+            if len(interpretations) < 3 and len(parts) > 1:
+                interpretations.append({
+                    "label": f"Interpretacja {len(interpretations) + 1}",
+                    "clarification": f"pytanie dotyczy {parts[1].strip()}"
+                })
+        else:
+            clean_desc = sig_desc.replace("?", "").strip()
+            interpretations.append({
+                "label": f"Interpretacja {len(interpretations) + 1}",
+                "clarification": f"pytanie dotyczy {clean_desc}"
+            })
+    return interpretations
+
+
+def generate_clarification_question(user_input: str, ollama_model: str, ollama_client: Client,
+                                    keep_alive: Optional[str] = None, num_ctx: Optional[int] = None,
+                                    use_llm: bool = True) -> Dict:
     # KROK 1: Sprawdź czy jest niejednoznaczne
     ambiguity = detect_ambiguity_hybrid(user_input)
     
@@ -115,14 +113,24 @@ def generate_clarification_question(user_input: str, ollama_model: str, ollama_c
     
     # KROK 2: Przygotuj kontekst dla LLM na podstawie wykrytych sygnałów
     signals = ambiguity.get("signals", [])
+
+    # pod obciążeniem tylko heurystyki, bez wywołania LLM
+    if not use_llm:
+        return {
+            "needs_clarification": True,
+            "original_query": user_input,
+            "interpretations": heuristic_interpretations(signals),
+            "ambiguity_info": ambiguity,
+            "method": "heuristic_only"
+        }
     signal_desc = ""
     
     if signals:
         signal_type, signal_term, signal_explanation = signals[0]
         signal_desc = f"\n\nWykryto niejednoznaczność w terminie '{signal_term}': {signal_explanation}"
     
-    # KROK 3: Uproszczony prompt z przykładami (few-shot)
-    prompt = f"""Zapytanie użytkownika jest niejednoznaczne.
+    # KROK 3: Uproszczony prompt z przykładami (few-shot), stała część jako wiadomość systemowa
+    system_prompt = """Zapytanie użytkownika jest niejednoznaczne.
 TWOJE ZADANIE:
 Napisz 2-3 interpretacje W FORMIE ZDAŃ TWIERDZĄCYCH (nie pytań!).
 Każda interpretacja powinna zaczynać się od "pytanie dotyczy" lub podobnego sformułowania.
@@ -140,16 +148,20 @@ pytanie dotyczy odpowiedzialności w kontekście moralnym
 pytanie dotyczy odpowiedzialności w kontekście praktycznym (biznes, zarządzanie)
 pytanie dotyczy odpowiedzialności w kontekście egzystencjalnym (filozofia życia)
 
-ZAPYTANIE: "{user_input}"{signal_desc}
-
 Napisz tylko interpretacje w formie zdań twierdzących, każda w nowej linii."""
+    prompt = f'ZAPYTANIE: "{user_input}"{signal_desc}'
 
     try:
         response = ollama_client.chat(
             model=ollama_model,
-            messages=[{"role": "user", "content": prompt}],
-            options={"temperature": 0.3, "top_p": 0.9}
+            messages=[
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": prompt},
+            ],
+            options=llm_options({"temperature": 0.3, "top_p": 0.9}, num_ctx),
+            keep_alive=keep_alive
         )
+        record_llm_usage("clarification", response)
         
         content = response["message"]["content"].strip()
         
@@ -235,34 +247,14 @@ Napisz tylko interpretacje w formie zdań twierdzących, każda w nowej linii.""
         }
         
     except Exception as e:
-        print(f"Błąd generowania clarification: {e}")
+        logger.warning("Błąd generowania clarification", error=str(e))
         
         # OSTATECZNY FALLBACK: użyj tylko heurystyk
         if signals:
-            interpretations = []
-            for i, (sig_type, sig_term, sig_desc) in enumerate(signals[:3], 1):
-                if sig_type == "entity" and " vs " in sig_desc:
-                    parts = sig_desc.split(" vs ")
-                    interpretations.append({
-                        "label": f"Interpretacja {len(interpretations) + 1}",
-                        "clarification": f"pytanie dotyczy {parts[0].strip()}"
-                    })
-                    if len(interpretations) < 3 and len(parts) > 1:
-                        interpretations.append({
-                            "label": f"Interpretacja {len(interpretations) + 1}",
-                            "clarification": f"pytanie dotyczy {parts[1].strip()}"
-                        })
-                else:
-                    clean_desc = sig_desc.replace("?", "").strip()
-                    interpretations.append({
-                        "label": f"Interpretacja {len(interpretations) + 1}",
-                        "clarification": f"pytanie dotyczy {clean_desc}"
-                    })
-            
             return {
                 "needs_clarification": True,
                 "original_query": user_input,
-                "interpretations": interpretations,
+                "interpretations": heuristic_interpretations(signals),
                 "ambiguity_info": ambiguity,
                 "method": "heuristic_fallback",
                 "error": str(e)
@@ -277,21 +269,20 @@ Napisz tylko interpretacje w formie zdań twierdzących, każda w nowej linii.""
             "error": str(e)
         }
     
-def clarify_query(result: Dict, query: str, ollama_model: str, ollama_client: Client) -> tuple[List[str], bool]:
-    clarification = generate_clarification_question(query, ollama_model, ollama_client)
+def clarify_query(result: Dict, query: str, ollama_model: str, ollama_client: Client,
+                  keep_alive: Optional[str] = None, num_ctx: Optional[int] = None,
+                  use_llm: bool = True) -> tuple[List[str], bool]:
+    clarification = generate_clarification_question(query, ollama_model, ollama_client, keep_alive, num_ctx, use_llm)
     result["clarification"] = clarification
     
     if clarification["needs_clarification"]:
-        print(f"\n[WARN] - WYKRYTO NIEJEDNOZNACZNOŚĆ")
-        print(f"Zapytanie: {query}")
-        print(f"Pewność: {clarification.get('confidence', 0):.2f}")
-        print(f"Powód: {clarification.get('reason', 'brak')}")
-        print(f"Możliwe interpretacje:")
-        for i, interp in enumerate(clarification["interpretations"], 1):
-            print(f"  {i}. {interp.get('clarification', 'brak')}")
-        
-        print(f'Dalszy proces dla interpretacji: {clarification["interpretations"][0]["clarification"]}')
+        ambiguity = clarification.get("ambiguity_info", {})
+        logger.info("Wykryto niejednoznaczność",
+                    query=query,
+                    confidence=ambiguity.get("confidence", 0),
+                    reason=ambiguity.get("reason", "brak"),
+                    interpretations=[i.get("clarification", "brak") for i in clarification["interpretations"]])
         return [data['clarification'] for data in clarification["interpretations"]], True
         
-    print(f"[INFO] Brak dwuznaczności, jedna interpretacja")
+    logger.debug("Brak dwuznaczności, jedna interpretacja")
     return [], False
\ No newline at end of file
@@ -1,8 +1,16 @@
 import json
+from typing import Optional
 from ollama import Client
 import re
 
-def decompose_query(user_input: str, features: dict, ollama_model: str, ollama_client: Client) -> dict:    
+from observability import record_llm_usage, get_logger
+
+from .prompt import llm_options
+
+logger = get_logger(__name__)
+
+def decompose_query(user_input: str, features: dict, ollama_model: str, ollama_client: Client,
+                    keep_alive: Optional[str] = None, num_ctx: Optional[int] = None) -> dict:    
     # Przypadki, które NIE wymagają dekompozycji
     if features["is_acronym"] or features["has_id"]:
         return {
@@ -19,26 +27,30 @@ def decompose_query(user_input: str, features: dict, ollama_model: str, ollama_c
         }
     
     # Złożone pytania wymagające dekompozycji
-    prompt = f"""Jesteś ekspertem od analizy zapytań. Twoim zadaniem jest rozłożyć pytanie na komponenty.
-
-Pytanie: {user_input}
+    # instrukcja w stałej wiadomości systemowej (cache prefiksu w Ollama), pytanie osobno
+    system_prompt = """Jesteś ekspertem od analizy zapytań. Twoim zadaniem jest rozłożyć pytanie użytkownika na komponenty.
 
 Zasady:
 1. Jeśli pytanie jest proste i konkretne (np. "Co zawiera dokument X?", "Czy inflacja rośnie?"), zwróć je jako main_question bez sub_questions.
 2. Jeśli pytanie jest złożone (np. "Jak poprawić pracę zespołową?"), rozbij je na 2-3 podzapytania.
 3. Format odpowiedzi (JSON):
-{{
+{
   "main_question": "...",
   "sub_questions": ["...", "..."]
-}}
+}
 
 NIE dodawaj komentarzy. Zwróć TYLKO JSON."""
 
     response = ollama_client.chat(
         model=ollama_model,
-        messages=[{"role": "user", "content": prompt}],
-        options={"temperature": 0.2}
+        messages=[
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": f"Pytanie: {user_input}"},
+        ],
+        options=llm_options({"temperature": 0.2}, num_ctx),
+        keep_alive=keep_alive
     )
+    record_llm_usage("decomposition", response)
     
     try:
         content = response["message"]["content"]
@@ -55,7 +67,7 @@ NIE dodawaj komentarzy. Zwróć TYLKO JSON."""
         return result
         
     except Exception as e:
-        print(f"Błąd dekompozycji: {e}")
+        logger.warning("Błąd dekompozycji", error=str(e))
         return {
             "main_question": user_input,
             "sub_questions": [],
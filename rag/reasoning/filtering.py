@@ -1,7 +1,10 @@
 import numpy as np
 from typing import List
 
-from common import tokenize_regex, embed
+from common import tokenize_regex, embed, build_query_profile
+from observability import get_logger
+
+logger = get_logger(__name__)
 
 def filter_retrieved_with_stats(
         docs: List[str], 
@@ -9,8 +12,10 @@ def filter_retrieved_with_stats(
         query_vec: np.ndarray, 
         f: dict,  
         min_tokens: int = 15, 
-        max_docs: int = 5):
-    query_tokens = {t.lower() for t in tokenize_regex(query) if len(t) > 2}
+        max_docs: int = 5,
+        transformer_model=None,
+        profile=None):
+    query_tokens = (profile or build_query_profile(query)).overlap_tokens
 
     stats = {
         "input_docs": len(docs),
@@ -36,7 +41,7 @@ def filter_retrieved_with_stats(
         if f["is_acronym"] or f["has_id"] or f["has_number"] or f["has_year"] or f["has_filter"]:
             if overlap == 0:
                 if text not in doc_vec_cache:
-                    doc_vec_cache[text] = embed(text)
+                    doc_vec_cache[text] = embed(text, transformer_model)
 
                 sim = cosine_similarity(query_vec, doc_vec_cache[text])
                 
@@ -47,6 +52,8 @@ def filter_retrieved_with_stats(
         docs_filtered.append(text)
         stats["kept_docs"] += 1
 
+    logger.debug("Filtracja", input_docs=stats["input_docs"], kept_docs=stats["kept_docs"],
+                 rejected_short=stats["rejected_short"], rejected_overlap=stats["rejected_overlap"])
     return docs_filtered[:max_docs], stats
 
 def cosine_similarity(a: np.ndarray, b: np.ndarray) -> float:
@@ -0,0 +1,36 @@
+from typing import Callable, List
+import numpy as np
+
+def pack_chunks(chunks: List[str],
+                scores: List[float],
+                max_tokens: int,
+                count_tokens: Callable[[List[str]], List[int]]) -> tuple[List[str], int]:
+    '''
+    Chunks with the highest total score that fit in `max_tokens` model tokens together
+    (0/1 knapsack over token counts, each chunk used at most once). Unlike stopping at the
+    first chunk that does not fit, shorter lower-ranked chunks fill the remaining budget.
+    Returns the chosen chunks in their original (rank) order and the tokens they use.
+    '''
+    if not chunks or max_tokens <= 0:
+        return [], 0
+    counts = count_tokens(chunks)
+
+    # best[c] = najlepsza suma wyników przy c tokenach, take[i, c] = czy fragment i wzięty
+    best = np.zeros(max_tokens + 1)
+    take = np.zeros((len(chunks), max_tokens + 1), dtype=bool)
+    for i, (n, score) in enumerate(zip(counts, scores)):
+        if n > max_tokens:
+            continue
+        candidate = np.full(max_tokens + 1, -np.inf)
+        # small bonus keeps zero-score chunks ahead of leaving the budget empty
+        candidate[n:] = best[:max_tokens + 1 - n] + max(score, 0.0) + 1e-9
+        take[i] = candidate > best
+        best = np.maximum(best, candidate)
+
+    chosen, capacity = [], max_tokens
+    for i in range(len(chunks) - 1, -1, -1):
+        if take[i, capacity]:
+            chosen.append(i)
+            capacity -= counts[i]
+    chosen.reverse()
+    return [chunks[i] for i in chosen], sum(counts[i] for i in chosen)
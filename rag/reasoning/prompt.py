@@ -1,27 +1,57 @@
-from typing import List
+from typing import Dict, List, Optional
 from ollama import Client
 
+from observability import record_llm_usage
 
-def build_prompt(chunks: List[str], prompt_core: str, question: str) -> str:
+# instructions, question and answer on top of the packed fragments
+PROMPT_OVERHEAD_TOKENS = 1024
+NUM_CTX_STEP = 512
+
+
+def context_window(context_tokens: int) -> int:
+    '''
+    num_ctx that fits `context_tokens` of fragments plus the rest of the prompt and the answer
+    '''
+    return -(-(context_tokens + PROMPT_OVERHEAD_TOKENS) // NUM_CTX_STEP) * NUM_CTX_STEP
+
+
+def llm_options(options: Dict, num_ctx: Optional[int]) -> Dict:
+    '''
+    Sampling options plus the context size. All calls must use the same num_ctx,
+    Ollama reloads the model whenever it changes
+    '''
+    return {**options, "num_ctx": num_ctx} if num_ctx else options
+
+
+def build_messages(chunks: List[str], prompt_core: str, question: str) -> List[Dict]:
+    '''
+    Instructions go to a system message that is identical for every request, so Ollama
+    reuses its KV cache; only the fragments and the question are evaluated per request
+    '''
     context = "\n\n".join(
         [f"[{i+1}] {chunk}" for i, chunk in enumerate(chunks)]
     )
 
-    prompt = f"{prompt_core}\nFragmenty:\n{context}\n\nPytanie:\n{question}"
-    return prompt
+    return [
+        {"role": "system", "content": prompt_core},
+        {"role": "user", "content": f"Fragmenty:\n{context}\n\nPytanie:\n{question}"},
+    ]
 
-def ask_model(chunks: List[str], 
+def ask_model(chunks: List[str],
                 prompts_list: List[str],
-                prompt_idx: int, 
-                query: str, 
+                prompt_idx: int,
+                query: str,
                 ollama_model: str,
-                ollama_client: Client):
+                ollama_client: Client,
+                keep_alive: Optional[str] = None,
+                num_ctx: Optional[int] = None):
     prompt_core = prompts_list[prompt_idx]
-    prompt = build_prompt(chunks, prompt_core, query)
 
     model_resp = ollama_client.chat(
         model=ollama_model,
-        messages=[{"role": "user", "content": prompt}],
-        options={"temperature": 0.6}
+        messages=build_messages(chunks, prompt_core, query),
+        options=llm_options({"temperature": 0.6}, num_ctx),
+        keep_alive=keep_alive
     )
-    return model_resp
\ No newline at end of file
+    record_llm_usage("answer", model_resp)
+    return model_resp
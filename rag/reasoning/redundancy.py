@@ -0,0 +1,46 @@
+from typing import List
+import numpy as np
+
+from common import TOKEN_RE
+
+def shingle_set(text: str, size: int = 3) -> set:
+    '''
+    Hashes of word n-grams (whole text when shorter). Python's hash is enough within one request
+    '''
+    words = TOKEN_RE.findall(text.lower())
+    if len(words) <= size:
+        return {hash(tuple(words))} if words else set()
+    return set(map(hash, zip(*(words[i:] for i in range(size)))))
+
+def suppress_near_duplicates(chunks: List[str], threshold: float = 0.7, shingle_size: int = 3) -> tuple[List[str], dict]:
+    '''
+    Drops chunks that mostly repeat a better-ranked one (same page mirrored, shared boilerplate,
+    a chunk contained in another). Redundancy is the share of the candidate's word 3-grams
+    found in a kept chunk, |A & B| / |A|, computed for all pairs at once: a long chunk that
+    only includes a short better-ranked one stays. Order of kept chunks is preserved.
+    '''
+    stats = {"input_chunks": len(chunks), "suppressed_chunks": 0}
+    if len(chunks) < 2 or not threshold:
+        return chunks, stats
+
+    shingles = [shingle_set(chunk, shingle_size) for chunk in chunks]
+    sizes = np.asarray([len(s) for s in shingles], dtype=np.float32)
+    # chunk x shingle incidence matrix over the shingles present in this request only
+    flat = np.fromiter((h for s in shingles for h in s), dtype=np.int64, count=int(sizes.sum()))
+    _, columns = np.unique(flat, return_inverse=True)
+    rows = np.repeat(np.arange(len(chunks)), sizes.astype(np.int64))
+    incidence = np.zeros((len(chunks), columns.max() + 1 if len(columns) else 0), dtype=np.float32)
+    incidence[rows, columns] = 1.0
+
+    shared = incidence @ incidence.T
+    # row i: share of chunk i's shingles present in chunk j
+    containment = shared / np.maximum(sizes[:, None], 1.0)
+
+    kept = []
+    for i in range(len(chunks)):
+        if kept and containment[i, kept].max() >= threshold:
+            stats["suppressed_chunks"] += 1
+            continue
+        kept.append(i)
+
+    return [chunks[i] for i in kept], stats
@@ -0,0 +1,146 @@
+from pathlib import Path
+from typing import Iterable, List, Optional
+import json
+import os
+
+import numpy as np
+
+from common.filters import QueryFilter
+
+TEXTS_FILE = "texts.bin"
+OFFSETS_FILE = "text_offsets.npy"
+IDS_FILE = "ids.npy"
+DATES_FILE = "dates.npy"
+DOMAIN_CODES_FILE = "domain_codes.npy"
+DOMAINS_FILE = "domains.json"
+MANIFEST_FILE = "manifest.json"
+
+# Bumped whenever the on-disk layout changes, older indexes are rebuilt on start
+DOCSTORE_FORMAT = 2
+NO_DATE = np.iinfo(np.int64).min
+
+
+def _day(date: Optional[str]) -> int:
+    '''
+    Days since epoch of an ISO date / datetime, NO_DATE when missing or unparsable
+    '''
+    try:
+        return int(np.datetime64(str(date)[:10], "D").astype(np.int64))
+    except ValueError:
+        return NO_DATE
+
+
+def source_signature(data_file_path, **extra) -> dict:
+    stat = os.stat(data_file_path)
+    return {
+        "source": str(Path(data_file_path).resolve()),
+        "size": stat.st_size,
+        "mtime": int(stat.st_mtime),
+        "format": DOCSTORE_FORMAT,
+        **extra,
+    }
+
+
+class DocStore:
+    '''
+    Document texts and filterable metadata for the in-process backends, stored next to their indexes.
+    Row i of every index is document i here: ids.npy holds its id, text_offsets.npy (n+1 int64)
+    its byte range in texts.bin (utf-8, memory-mapped), dates.npy its day number and
+    domain_codes.npy its index into domains.json.
+    '''
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.ids = np.load(self.path / IDS_FILE, mmap_mode="r")
+        self.offsets = np.load(self.path / OFFSETS_FILE, mmap_mode="r")
+        self._texts = np.memmap(self.path / TEXTS_FILE, dtype=np.uint8, mode="r") \
+            if self.offsets[-1] > 0 else np.zeros(0, dtype=np.uint8)
+        self.dates = np.load(self.path / DATES_FILE)
+        self.domain_codes = np.load(self.path / DOMAIN_CODES_FILE)
+        with open(self.path / DOMAINS_FILE, "r", encoding="utf-8") as f:
+            self.domain_index = {domain: code for code, domain in enumerate(json.load(f))}
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def text(self, row: int) -> str:
+        start, end = self.offsets[row], self.offsets[row + 1]
+        return self._texts[start:end].tobytes().decode("utf-8")
+
+    def get(self, rows: Iterable[int]) -> tuple[List[int], List[str]]:
+        rows = list(rows)
+        return [int(self.ids[r]) for r in rows], [self.text(r) for r in rows]
+
+    def row_mask(self, query_filter: Optional[QueryFilter]) -> Optional[np.ndarray]:
+        '''
+        Rows passing the filter, None when there is nothing to filter.
+        Documents without a date never pass a date constraint (as in ES and Qdrant).
+        '''
+        if not query_filter:
+            return None
+        mask = np.ones(len(self), dtype=bool)
+        if query_filter.date_from:
+            mask &= self.dates >= _day(query_filter.date_from)
+        if query_filter.date_before:
+            mask &= (self.dates < _day(query_filter.date_before)) & (self.dates != NO_DATE)
+        if query_filter.domains:
+            codes = [self.domain_index[d] for d in query_filter.domains if d in self.domain_index]
+            mask &= np.isin(self.domain_codes, codes)
+        return mask
+
+    @staticmethod
+    def is_current(path, signature: dict) -> bool:
+        '''
+        Index at path was fully built from the same source with the same settings
+        '''
+        if not (Path(path) / MANIFEST_FILE).exists():
+            return False
+        manifest = DocStore.manifest(path)
+        return all(manifest.get(k) == v for k, v in signature.items())
+
+    @staticmethod
+    def manifest(path) -> dict:
+        with open(Path(path) / MANIFEST_FILE, "r") as f:
+            return json.load(f)
+
+
+class DocStoreWriter:
+    '''
+    Appends documents in row order, finish() writes the offset table, metadata and manifest
+    '''
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        (self.path / MANIFEST_FILE).unlink(missing_ok=True)
+        self._texts = open(self.path / TEXTS_FILE, "wb")
+        self._ids: List[int] = []
+        self._offsets: List[int] = [0]
+        self._dates: List[int] = []
+        self._domain_codes: List[int] = []
+        self._domains: dict = {}
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def add(self, doc_id: int, text: str, date: Optional[str] = None, domain: Optional[str] = None) -> int:
+        data = text.encode("utf-8")
+        self._texts.write(data)
+        self._ids.append(int(doc_id))
+        self._offsets.append(self._offsets[-1] + len(data))
+        self._dates.append(_day(date) if date else NO_DATE)
+        self._domain_codes.append(self._domains.setdefault(domain, len(self._domains)) if domain else -1)
+        return len(self._ids) - 1
+
+    def finish(self, **manifest) -> DocStore:
+        self._texts.close()
+        np.save(self.path / IDS_FILE, np.asarray(self._ids, dtype=np.int64))
+        np.save(self.path / OFFSETS_FILE, np.asarray(self._offsets, dtype=np.int64))
+        np.save(self.path / DATES_FILE, np.asarray(self._dates, dtype=np.int64))
+        np.save(self.path / DOMAIN_CODES_FILE, np.asarray(self._domain_codes, dtype=np.int32))
+        with open(self.path / DOMAINS_FILE, "w", encoding="utf-8") as f:
+            json.dump(sorted(self._domains, key=self._domains.__getitem__), f, ensure_ascii=False)
+        # manifest is written last, an interrupted build is rebuilt on next start
+        with open(self.path / MANIFEST_FILE, "w") as f:
+            json.dump({"docs": len(self._ids), **manifest}, f)
+        return DocStore(self.path)
@@ -1,19 +1,44 @@
 from elasticsearch import Elasticsearch
-from typing import List
+from typing import List, Optional
+
+from common import QueryFilter
+
+def search_es(
+        es_query: str,
+        es_client: Elasticsearch,
+        index_name: str,
+        minimum_should_match: str = "2<60%",
+        limit: int = 35,
+        query_filter: Optional[QueryFilter] = None
+    ) -> tuple[List[int], List[str], List[float]]:
+    '''
+    Raw query text goes through the index analyzer (lemmas, Polish stop words).
+    Identical queries are answered from the shard request cache.
+    Date / domain constraints go to bool.filter: they don't score and are cached per segment.
+    Only `text` is fetched from _source, the stored vector would be most of the response.
+    '''
+    query = {
+        "match": {
+            "text": {
+                "query": es_query,
+                "minimum_should_match": minimum_should_match
+            }
+        }
+    }
+    if query_filter:
+        query = {"bool": {"must": query, "filter": query_filter.to_es()}}
 
-def search_es(es_query: str, es_client: Elasticsearch, index_name: str) -> tuple[List[int], List[str]]:
     response = es_client.search(
         index=index_name,
-        query={
-            "query_string": {
-                "query": es_query
-            }
-        },
-        size=35
+        query=query,
+        size=limit,
+        source=["text"],
+        request_cache=True
     )
     
     hits = response["hits"]["hits"]
     top_id = [int(h["_id"]) for h in hits]
     top_text = [h["_source"]["text"] for h in hits]
+    top_score = [h["_score"] for h in hits]
     
-    return top_id, top_text
\ No newline at end of file
+    return top_id, top_text, top_score
\ No newline at end of file
@@ -0,0 +1,112 @@
+from elasticsearch import Elasticsearch
+from qdrant_client import QdrantClient
+from qdrant_client.models import Prefetch, FusionQuery, Fusion, SearchParams, QuantizationSearchParams
+from typing import Dict, List, Optional
+
+from common import QueryFilter, SPARSE_VECTOR_NAME, sparse_query_vector
+
+# Single-engine hybrid search: dense and lexical retrieval run in one request and are fused
+# server-side. Returns the same [(text, fused score)] list as rrf_fusion_weighted.
+# Server-side RRF has no per-retriever weights: depth (choose_depth) gives the weaker
+# retriever fewer candidates instead, 0 leaves it out.
+
+
+def search_es_hybrid(
+        query_vector,
+        es_query: str,
+        weights: Dict[str, float],
+        depth: Dict[str, int],
+        es_client: Elasticsearch,
+        index_name: str,
+        minimum_should_match: str = "2<60%",
+        fusion: str = "rrf",
+        num_candidates: int = 100,
+        query_filter: Optional[QueryFilter] = None
+    ) -> List[tuple[str, float]]:
+    '''
+    BM25 match and knn over the indexed `vector` field in one _search.
+    fusion="rrf": rrf retriever (needs an Enterprise / trial license).
+    fusion="linear": top-level knn + query, scores summed with the weights as boosts (basic license),
+    BM25 and cosine scores are on different scales so the weights need tuning.
+    '''
+    match = {"match": {"text": {"query": es_query, "minimum_should_match": minimum_should_match}}}
+    filters = query_filter.to_es() if query_filter else []
+    lexical = {"bool": {"must": match, "filter": filters}} if filters else match
+    knn = {
+        "field": "vector",
+        "query_vector": query_vector.tolist(),
+        "k": depth["qdrant"],
+        "num_candidates": max(num_candidates, depth["qdrant"]),
+    }
+    if filters:
+        knn["filter"] = filters
+
+    if fusion == "rrf":
+        retrievers = []
+        if depth["es"]:
+            retrievers.append({"standard": {"query": lexical}})
+        if depth["qdrant"]:
+            retrievers.append({"knn": knn})
+        response = es_client.search(
+            index=index_name,
+            retriever=retrievers[0] if len(retrievers) == 1 else {"rrf": {
+                "retrievers": retrievers,
+                "rank_window_size": max(depth["es"], depth["qdrant"])
+            }},
+            size=depth["fused"],
+            source=["text"]
+        )
+    elif fusion == "linear":
+        response = es_client.search(
+            index=index_name,
+            query={"bool": {"must": match, "filter": filters, "boost": weights["es"]}} if depth["es"] else None,
+            knn={**knn, "boost": weights["qdrant"]} if depth["qdrant"] else None,
+            size=depth["fused"],
+            source=["text"]
+        )
+    else:
+        raise ValueError(f"Unknown ES hybrid fusion: {fusion}")
+
+    return [(h["_source"]["text"], h["_score"]) for h in response["hits"]["hits"]]
+
+
+def search_qdrant_hybrid(
+        query_vector,
+        es_query: str,
+        weights: Dict[str, float],
+        depth: Dict[str, int],
+        qdrant_client: QdrantClient,
+        collection_name: str,
+        hnsw_ef: Optional[int] = None,
+        oversampling: Optional[float] = None,
+        rescore: bool = True,
+        query_filter: Optional[QueryFilter] = None
+    ) -> List[tuple[str, float]]:
+    '''
+    Dense and sparse prefetch fused with RRF by Qdrant (collection created with sparse=True)
+    '''
+    search_params = None
+    if hnsw_ef is not None or oversampling is not None or not rescore:
+        search_params = SearchParams(
+            hnsw_ef=hnsw_ef,
+            quantization=QuantizationSearchParams(rescore=rescore, oversampling=oversampling)
+        )
+    qdrant_filter = query_filter.to_qdrant() if query_filter else None
+    prefetch = []
+    sparse = sparse_query_vector(es_query)
+    # dense prefetch also stands in when the query has no lexical terms
+    if depth["qdrant"] or not sparse.indices:
+        prefetch.append(Prefetch(query=query_vector.tolist(), filter=qdrant_filter, params=search_params,
+                                 limit=depth["qdrant"] or depth["fused"]))
+    if depth["es"] and sparse.indices:
+        prefetch.append(Prefetch(query=sparse, using=SPARSE_VECTOR_NAME, filter=qdrant_filter, limit=depth["es"]))
+
+    result = qdrant_client.query_points(
+        collection_name=collection_name,
+        prefetch=prefetch,
+        query=FusionQuery(fusion=Fusion.RRF),
+        with_payload=["text"],
+        limit=depth["fused"]
+    ).points
+
+    return [(hit.payload.get("text", ""), hit.score) for hit in result]
@@ -0,0 +1,165 @@
+from collections import Counter
+from pathlib import Path
+from typing import Iterable, List, Optional
+from array import array
+import json
+
+import numpy as np
+
+from common import iter_documents, QueryFilter
+from observability import get_logger
+
+from .docstore import DocStore, DocStoreWriter, source_signature
+
+logger = get_logger(__name__)
+
+VOCAB_FILE = "vocab.json"
+INDPTR_FILE = "postings_indptr.npy"
+ROWS_FILE = "postings_rows.npy"
+WEIGHTS_FILE = "postings_weights.npy"
+IDF_FILE = "idf.npy"
+
+
+def _analyzer_name(nlp) -> str:
+    return f"{nlp.meta.get('lang')}_{nlp.meta.get('name')}-{nlp.meta.get('version')}"
+
+
+def analyze(doc) -> List[str]:
+    '''
+    Index terms of a spaCy doc, same filter as extract_keywords_lemmatized
+    so query keywords and postings share one vocabulary
+    '''
+    return [
+        token.lemma_
+        for token in doc
+        if not token.is_stop
+        and token.is_alpha
+        and len(token.lemma_) > 2
+    ]
+
+
+def analyze_query(keyword_query: str, nlp) -> List[str]:
+    '''
+    Query terms, analyzed the same way as the indexed documents
+    '''
+    return list(dict.fromkeys(analyze(nlp(keyword_query.lower()))))
+
+
+class LocalBM25Index:
+    '''
+    In-process replacement for the ES index: BM25 over lemmatized postings in CSR form.
+    postings_indptr[t]:postings_indptr[t+1] slices rows and precomputed
+    tf-saturation weights of term t, so a query is idf-weighted sums over its postings.
+    All arrays are memory-mapped, loading only reads the vocabulary.
+    '''
+
+    def __init__(self, index_dir):
+        self.index_dir = Path(index_dir)
+        self.docs = DocStore(self.index_dir)
+        with open(self.index_dir / VOCAB_FILE, "r", encoding="utf-8") as f:
+            self.vocab = {term: i for i, term in enumerate(json.load(f))}
+        self.indptr = np.load(self.index_dir / INDPTR_FILE, mmap_mode="r")
+        self.rows = np.load(self.index_dir / ROWS_FILE, mmap_mode="r")
+        self.weights = np.load(self.index_dir / WEIGHTS_FILE, mmap_mode="r")
+        self.idf = np.load(self.index_dir / IDF_FILE, mmap_mode="r")
+
+    @classmethod
+    def open_or_build(cls, index_dir, data_file_path, nlp, n_process: int = 1, batch_size: int = 64,
+                      k1: float = 1.2, b: float = 0.75, dedup_threshold: Optional[float] = None) -> "LocalBM25Index":
+        signature = source_signature(data_file_path, analyzer=_analyzer_name(nlp), k1=k1, b=b, dedup=dedup_threshold)
+        if not DocStore.is_current(index_dir, signature):
+            build_bm25_index(data_file_path, index_dir, nlp, n_process, batch_size, k1, b, dedup_threshold)
+        return cls(index_dir)
+
+    def __len__(self) -> int:
+        return len(self.docs)
+
+    def search(self, terms: Iterable[str], limit: int = 35,
+               query_filter: Optional[QueryFilter] = None) -> tuple[np.ndarray, np.ndarray]:
+        '''
+        OR query: every document containing any term (and passing the filter) is scored, rows best first
+        '''
+        term_ids = [self.vocab[t] for t in terms if t in self.vocab]
+        if not term_ids:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+
+        rows = [np.asarray(self.rows[self.indptr[t]:self.indptr[t + 1]]) for t in term_ids]
+        contrib = [self.idf[t] * np.asarray(self.weights[self.indptr[t]:self.indptr[t + 1]]) for t in term_ids]
+        rows = np.concatenate(rows)
+        contrib = np.concatenate(contrib)
+        mask = self.docs.row_mask(query_filter)
+        if mask is not None:
+            keep = mask[rows]
+            rows, contrib = rows[keep], contrib[keep]
+            if not len(rows):
+                return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+
+        # sum per document: only touched rows are materialized, not an N-sized accumulator
+        candidates, inverse = np.unique(rows, return_inverse=True)
+        scores = np.bincount(inverse, weights=contrib).astype(np.float32)
+
+        k = min(limit, len(candidates))
+        top = np.argpartition(-scores, k - 1)[:k] if len(candidates) > k else np.arange(len(candidates))
+        # ties broken by row, as ES breaks them by doc order
+        order = np.lexsort((candidates[top], -scores[top]))
+        top = top[order]
+        return candidates[top].astype(np.int64), scores[top]
+
+
+def build_bm25_index(data_file_path, index_dir, nlp, n_process: int = 1, batch_size: int = 64,
+                     k1: float = 1.2, b: float = 0.75, dedup_threshold: Optional[float] = None) -> DocStore:
+    '''
+    One pass over the ndjson: texts go to the DocStore, analyzed terms to
+    (term, row, tf) triples that are sorted by term into CSR postings
+    '''
+    index_dir = Path(index_dir)
+    writer = DocStoreWriter(index_dir)
+    vocab = {}
+    term_ids, rows, tfs = array("i"), array("i"), array("i")
+    doc_len = array("i")
+
+    texts = ((doc["text"].lower(), doc) for doc in iter_documents(data_file_path, dedup_threshold))
+    for parsed, doc in nlp.pipe(texts, as_tuples=True, n_process=n_process, batch_size=batch_size):
+        row = writer.add(doc["id"], doc["text"], doc.get("date"), doc.get("domain"))
+        counts = Counter(analyze(parsed))
+        doc_len.append(sum(counts.values()))
+        for term, tf in counts.items():
+            term_ids.append(vocab.setdefault(term, len(vocab)))
+            rows.append(row)
+            tfs.append(tf)
+
+    term_ids = np.frombuffer(term_ids, dtype=np.int32)
+    rows = np.frombuffer(rows, dtype=np.int32)
+    tfs = np.frombuffer(tfs, dtype=np.int32).astype(np.float32)
+    doc_len = np.frombuffer(doc_len, dtype=np.int32).astype(np.float32)
+    n_docs = len(doc_len)
+
+    order = np.argsort(term_ids, kind="stable")   # stable keeps rows ascending within a term
+    rows = rows[order]
+    tfs = tfs[order]
+    df = np.bincount(term_ids, minlength=len(vocab))
+    indptr = np.concatenate([[0], np.cumsum(df)]).astype(np.int64)
+
+    avg_len = max(float(doc_len.mean()), 1.0) if n_docs else 1.0
+    norm = k1 * (1 - b + b * doc_len[rows] / avg_len)
+    weights = (tfs * (k1 + 1) / (tfs + norm)).astype(np.float32)
+    idf = np.log(1 + (n_docs - df + 0.5) / (df + 0.5)).astype(np.float32)   # Lucene BM25 idf
+
+    with open(index_dir / VOCAB_FILE, "w", encoding="utf-8") as f:
+        json.dump(sorted(vocab, key=vocab.__getitem__), f, ensure_ascii=False)
+    np.save(index_dir / INDPTR_FILE, indptr)
+    np.save(index_dir / ROWS_FILE, rows)
+    np.save(index_dir / WEIGHTS_FILE, weights)
+    np.save(index_dir / IDF_FILE, idf)
+
+    store = writer.finish(**source_signature(data_file_path, analyzer=_analyzer_name(nlp), k1=k1, b=b,
+                                             dedup=dedup_threshold),
+                          terms=len(vocab), postings=len(rows))
+    logger.info("Zbudowano lokalny indeks BM25", docs=n_docs, terms=len(vocab), postings=len(rows))
+    return store
+
+
+def search_local_bm25(es_query: str, index: LocalBM25Index, nlp, limit: int = 35,
+                      query_filter: Optional[QueryFilter] = None) -> tuple[List[int], List[str], List[float]]:
+    rows, scores = index.search(analyze_query(es_query, nlp), limit, query_filter)
+    return *index.docs.get(rows), scores.tolist()
@@ -0,0 +1,216 @@
+from pathlib import Path
+from typing import Iterable, List, Optional
+import json
+
+import numpy as np
+
+from common import iter_documents, QueryFilter
+from observability import get_logger
+
+from .docstore import DocStore, DocStoreWriter, source_signature
+
+logger = get_logger(__name__)
+
+VECTORS_FILE = "vectors.npy"
+HNSW_FILE = "hnsw.bin"
+# build parameters of hnsw.bin, the graph is rebuilt when they change
+HNSW_PARAMS_FILE = "hnsw.json"
+
+
+def _normalize(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+class LocalVectorIndex:
+    '''
+    In-process replacement for the Qdrant collection.
+    Vectors are L2-normalized float32 rows of a memory-mapped .npy, so cosine is a dot product;
+    row order is the DocStore order. Exact search scans the matrix in blocks,
+    optional HNSW (hnswlib) answers approximately.
+    '''
+
+    def __init__(self, index_dir, block_size: int = 65536, hnsw_ef: Optional[int] = None):
+        self.index_dir = Path(index_dir)
+        self.docs = DocStore(self.index_dir)
+        self.matrix = np.load(self.index_dir / VECTORS_FILE, mmap_mode="r")
+        self.block_size = block_size
+        self.hnsw = None
+        if hnsw_ef is not None:
+            self.hnsw = _load_hnsw(self.index_dir / HNSW_FILE, self.matrix.shape[1], hnsw_ef)
+
+    @classmethod
+    def open_or_build(cls, index_dir, data_file_path, block_size: int = 65536,
+                      use_hnsw: bool = False, hnsw_m: int = 16, hnsw_ef_construction: int = 200,
+                      hnsw_ef: int = 64, dedup_threshold: Optional[float] = None) -> "LocalVectorIndex":
+        if not DocStore.is_current(index_dir, source_signature(data_file_path, dedup=dedup_threshold)):
+            build_vector_index(data_file_path, index_dir, dedup_threshold=dedup_threshold)
+        if use_hnsw and not hnsw_is_current(index_dir, hnsw_m, hnsw_ef_construction):
+            build_hnsw(index_dir, hnsw_m, hnsw_ef_construction)
+        return cls(index_dir, block_size, hnsw_ef if use_hnsw else None)
+
+    def __len__(self) -> int:
+        return self.matrix.shape[0]
+
+    def search(self, query_vector, limit: int = 35,
+               query_filter: Optional[QueryFilter] = None) -> tuple[np.ndarray, np.ndarray]:
+        '''
+        Rows and cosine scores of the top `limit` documents, best first
+        '''
+        rows, scores = self.search_batch(np.asarray(query_vector, dtype=np.float32)[None, :], limit, query_filter)
+        return rows[0], scores[0]
+
+    def search_batch(self, query_vectors, limit: int = 35,
+                     query_filter: Optional[QueryFilter] = None) -> tuple[List[np.ndarray], List[np.ndarray]]:
+        '''
+        Top-k for several queries at once (main question + sub-questions),
+        every block of the matrix is read once for all of them
+        '''
+        queries = _normalize(np.atleast_2d(np.asarray(query_vectors, dtype=np.float32)))
+        mask = self.docs.row_mask(query_filter)
+        allowed = len(self) if mask is None else int(mask.sum())
+        k = min(limit, allowed)
+        if k == 0:
+            empty = [np.zeros(0, dtype=np.int64)] * len(queries)
+            return empty, [np.zeros(0, dtype=np.float32)] * len(queries)
+        if mask is not None and allowed <= self.block_size:
+            # selective filter: score only the matching rows
+            return self._search_rows(queries, np.flatnonzero(mask), k)
+        if self.hnsw is not None:
+            try:
+                return self._search_hnsw(queries, k, mask)
+            except RuntimeError:
+                # filter too selective for the graph walk to collect k hits
+                pass
+        return self._search_exact(queries, k, mask)
+
+    def _search_rows(self, queries: np.ndarray, rows: np.ndarray, k: int):
+        scores = np.asarray(self.matrix[rows]) @ queries.T          # (rows, queries)
+        top = np.argsort(-scores, axis=0, kind="stable")[:k]
+        best_scores = np.take_along_axis(scores, top, axis=0).T
+        return list(rows[top].T), list(best_scores)
+
+    def _search_exact(self, queries: np.ndarray, k: int, mask: Optional[np.ndarray] = None):
+        # candidates are kept as (k, queries): block @ queries.T is the fast BLAS layout
+        best_rows = np.zeros((0, len(queries)), dtype=np.int64)
+        best_scores = np.zeros((0, len(queries)), dtype=np.float32)
+        queries_t = np.ascontiguousarray(queries.T)
+
+        for start in range(0, len(self), self.block_size):
+            block = np.asarray(self.matrix[start:start + self.block_size])
+            scores = block @ queries_t                              # (block, queries)
+            if mask is not None:
+                scores[~mask[start:start + len(block)]] = -np.inf
+            if len(scores) > k:
+                top = np.argpartition(-scores, k - 1, axis=0)[:k]
+                scores = np.take_along_axis(scores, top, axis=0)
+            else:
+                top = np.broadcast_to(np.arange(len(scores))[:, None], scores.shape)
+
+            # merge block candidates with the running top-k
+            cand_rows = np.concatenate([best_rows, top + start])
+            cand_scores = np.concatenate([best_scores, scores])
+            if len(cand_scores) > k:
+                keep = np.argpartition(-cand_scores, k - 1, axis=0)[:k]
+                cand_rows = np.take_along_axis(cand_rows, keep, axis=0)
+                cand_scores = np.take_along_axis(cand_scores, keep, axis=0)
+            best_rows, best_scores = cand_rows, cand_scores
+
+        order = np.argsort(-best_scores, axis=0, kind="stable")
+        best_rows = np.take_along_axis(best_rows, order, axis=0).T
+        best_scores = np.take_along_axis(best_scores, order, axis=0).T
+        return list(best_rows), list(best_scores)
+
+    def _search_hnsw(self, queries: np.ndarray, k: int, mask: Optional[np.ndarray] = None):
+        if mask is None:
+            labels, distances = self.hnsw.knn_query(queries, k=k)
+        else:
+            labels, distances = self.hnsw.knn_query(queries, k=k, num_threads=1, filter=lambda label: bool(mask[label]))
+        # inner product space returns 1 - dot
+        return list(labels.astype(np.int64)), list((1.0 - distances).astype(np.float32))
+
+
+def build_vector_index(data_file_path, index_dir, dim: int = 384, dedup_threshold: Optional[float] = None) -> DocStore:
+    '''
+    Stream the ndjson once: texts go to the DocStore, normalized vectors to a raw
+    float32 file that is then wrapped into vectors.npy without loading it whole
+    '''
+    index_dir = Path(index_dir)
+    writer = DocStoreWriter(index_dir)
+    # graph labels are row numbers of the previous build, open_or_build rebuilds it when missing
+    (index_dir / HNSW_FILE).unlink(missing_ok=True)
+    raw_path = index_dir / "vectors.f32"
+    with open(raw_path, "wb") as raw:
+        for doc in iter_documents(data_file_path, dedup_threshold):
+            vector = np.asarray(doc["vector"], dtype=np.float32)
+            if vector.shape != (dim,):
+                logger.warning("Pominięto dokument z wektorem o złym wymiarze", id=doc["id"], dim=vector.shape)
+                continue
+            norm = np.linalg.norm(vector)
+            raw.write((vector / norm if norm else vector).tobytes())
+            writer.add(doc["id"], doc["text"], doc.get("date"), doc.get("domain"))
+
+    n = len(writer)
+    vectors = np.lib.format.open_memmap(index_dir / VECTORS_FILE, mode="w+", dtype=np.float32, shape=(n, dim))
+    if n:
+        vectors[:] = np.memmap(raw_path, dtype=np.float32, mode="r", shape=(n, dim))
+    vectors.flush()
+    del vectors
+    raw_path.unlink()
+
+    store = writer.finish(**source_signature(data_file_path, dedup=dedup_threshold), dim=dim)
+    logger.info("Zbudowano lokalny indeks wektorowy", docs=n, path=str(index_dir))
+    return store
+
+
+def _import_hnswlib():
+    try:
+        import hnswlib
+    except ImportError as e:
+        raise ImportError("LOCAL_VECTOR_HNSW requires hnswlib (pip install hnswlib)") from e
+    return hnswlib
+
+
+def build_hnsw(index_dir, m: int = 16, ef_construction: int = 200, block_size: int = 65536):
+    hnswlib = _import_hnswlib()
+    matrix = np.load(Path(index_dir) / VECTORS_FILE, mmap_mode="r")
+    index = hnswlib.Index(space="ip", dim=matrix.shape[1])
+    index.init_index(max_elements=max(len(matrix), 1), M=m, ef_construction=ef_construction)
+    for start in range(0, len(matrix), block_size):
+        block = np.asarray(matrix[start:start + block_size])
+        index.add_items(block, np.arange(start, start + len(block)))
+    index.save_index(str(Path(index_dir) / HNSW_FILE))
+    (Path(index_dir) / HNSW_PARAMS_FILE).write_text(json.dumps(_hnsw_params(m, ef_construction)))
+    logger.info("Zbudowano indeks HNSW", docs=len(matrix), m=m, ef_construction=ef_construction)
+
+
+def _hnsw_params(m: int, ef_construction: int) -> dict:
+    return {"m": m, "ef_construction": ef_construction}
+
+
+def hnsw_is_current(index_dir, m: int, ef_construction: int) -> bool:
+    index_dir = Path(index_dir)
+    if not (index_dir / HNSW_FILE).exists() or not (index_dir / HNSW_PARAMS_FILE).exists():
+        return False
+    return json.loads((index_dir / HNSW_PARAMS_FILE).read_text()) == _hnsw_params(m, ef_construction)
+
+
+def _load_hnsw(path, dim: int, ef: int):
+    hnswlib = _import_hnswlib()
+    index = hnswlib.Index(space="ip", dim=dim)
+    index.load_index(str(path))
+    index.set_ef(ef)
+    return index
+
+
+def search_local_vectors(query_vector, index: LocalVectorIndex, limit: int = 35,
+                         query_filter: Optional[QueryFilter] = None) -> tuple[List[int], List[str], List[float]]:
+    rows, scores = index.search(query_vector, limit, query_filter)
+    return *index.docs.get(rows), scores.tolist()
+
+
+def search_local_vectors_batch(query_vectors: Iterable, index: LocalVectorIndex, limit: int = 35,
+                               query_filter: Optional[QueryFilter] = None) -> List[tuple[List[int], List[str], List[float]]]:
+    rows_per_query, scores_per_query = index.search_batch(list(query_vectors), limit, query_filter)
+    return [(*index.docs.get(rows), scores.tolist()) for rows, scores in zip(rows_per_query, scores_per_query)]
@@ -1,13 +1,43 @@
 from qdrant_client import QdrantClient
-from typing import List
+from qdrant_client.models import SearchParams, QuantizationSearchParams
+from typing import List, Optional
+
+from common import QueryFilter
+
+def search_qdrant(
+        query_vector,
+        qdrant_client: QdrantClient,
+        collection_name: str,
+        limit: int = 35,
+        hnsw_ef: Optional[int] = None,
+        oversampling: Optional[float] = None,
+        rescore: bool = True,
+        query_filter: Optional[QueryFilter] = None
+    ) -> tuple[List[int], List[str], List[float]]:
+    '''
+    hnsw_ef: search beam width (recall vs latency), collection default when None
+    oversampling / rescore: for quantized collections fetch limit * oversampling candidates
+    by quantized score and rescore them with the original vectors
+    query_filter: date / domain constraints, served by the payload indexes
+    Only the `text` payload field is returned.
+    '''
+    search_params = None
+    if hnsw_ef is not None or oversampling is not None or not rescore:
+        search_params = SearchParams(
+            hnsw_ef=hnsw_ef,
+            quantization=QuantizationSearchParams(rescore=rescore, oversampling=oversampling)
+        )
 
-def search_qdrant(query_vector, qdrant_client: QdrantClient, collection_name: str) -> tuple[List[int], List[str]]:
     result = qdrant_client.query_points(
         collection_name=collection_name,
         query=query_vector,
-        limit=35
+        query_filter=query_filter.to_qdrant() if query_filter else None,
+        search_params=search_params,
+        with_payload=["text"],
+        limit=limit
     ).points
 
     top_id = [hit.id for hit in result]
     top_text = [hit.payload.get("text", "") for hit in result]
-    return top_id, top_text
\ No newline at end of file
+    top_score = [hit.score for hit in result]
+    return top_id, top_text, top_score
\ No newline at end of file
@@ -0,0 +1,24 @@
+import pytest
+
+from common.filters import extract_query_filter
+
+
+@pytest.mark.parametrize("query", [
+    "badanie w 2000 rodzin wykazało",
+    "z 2020 raportu",
+    "w 2015 ustawa",
+    "w 2015 rokiem",
+])
+def test_word_after_year_is_not_a_year_filter(query):
+    assert not extract_query_filter(query)
+
+
+@pytest.mark.parametrize("query", [
+    "w 2015 r. uchwalono",
+    "w 2015 roku",
+    "w roku 2015",
+    "dane z 2015 r",
+])
+def test_in_year(query):
+    query_filter = extract_query_filter(query)
+    assert (query_filter.date_from, query_filter.date_before) == ("2015-01-01", "2016-01-01")